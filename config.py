@@ -2,6 +2,7 @@
 Dayflow Windows - 配置文件
 """
 import os
+import functools
 from pathlib import Path
 
 # 版本信息
@@ -18,11 +19,15 @@ RECORD_FPS = 1  # 每秒1帧
 CHUNK_DURATION_SECONDS = 60  # 每60秒一个切片
 VIDEO_BITRATE = "500k"  # 低码率
 VIDEO_CODEC = "libx264"
+# 硬件 H.264 编码器（按优先级探测，需要 PATH 中有 ffmpeg；都不可用时使用 OpenCV mp4v 软件编码）
+VIDEO_HW_ENCODERS = ("h264_nvenc", "h264_qsv", "h264_amf")
 
 # 分析配置
 BATCH_DURATION_MINUTES = 15  # 批次时长约15分钟
 ANALYSIS_INTERVAL_SECONDS = 60  # 每分钟扫描一次
 ANALYSIS_MAX_IDLE_INTERVAL = 300  # 无任务时最大扫描间隔（秒）
+MAX_CONCURRENT_TRANSCRIBE = 4  # 单个批次内并发转录的切片数上限
+TRANSCRIBE_MAX_FRAMES = 8  # 每个切片送给模型的关键帧数
 
 # 录制优化配置
 WINDOW_TRACKING_ON_CHANGE_ONLY = True  # 仅在窗口变化时记录（减少数据量）
@@ -61,12 +66,12 @@ APP_DATA_DIR = _get_app_data_dir()
 CHUNKS_DIR = Path(CUSTOM_CHUNKS_DIR) if CUSTOM_CHUNKS_DIR else APP_DATA_DIR / "chunks"
 DATABASE_PATH = APP_DATA_DIR / "dayflow.db"
 
-# 确保目录存在
-APP_DATA_DIR.mkdir(parents=True, exist_ok=True)
-CHUNKS_DIR.mkdir(parents=True, exist_ok=True)
 
-# 打印数据目录路径（用于调试）
-print(f"[Dayflow] 数据目录: {APP_DATA_DIR}")
+@functools.lru_cache(maxsize=1)
+def ensure_dirs() -> None:
+    """确保数据目录存在（每个进程只在首次真正使用文件系统时创建一次）"""
+    APP_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    CHUNKS_DIR.mkdir(parents=True, exist_ok=True)
 
 # UI 配置
 WINDOW_TITLE = "Dayflow"
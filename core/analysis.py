@@ -3,18 +3,21 @@ Dayflow Windows - 分析调度器
 批量处理视频切片，调用 API 生成时间轴卡片
 """
 import asyncio
+import json
 import logging
+import os
 import threading
 from datetime import datetime, timedelta
 from typing import List, Optional
-from pathlib import Path
 
 import config
 from core.types import (
     VideoChunk, ChunkStatus,
     AnalysisBatch, BatchStatus,
-    Observation, ActivityCard
+    Observation, ActivityCard,
+    observations_to_json
 )
+from core.keyframes import keyframes_path
 from core.llm_provider import DayflowBackendProvider
 from database.storage import StorageManager
 
@@ -45,8 +48,10 @@ class AnalysisScheduler:
         self._scheduler_thread: Optional[threading.Thread] = None
         self._stop_event = threading.Event()
         
-        # 事件循环（用于异步 API 调用）
+        # 事件循环（用于异步 API 调用），调度线程内常驻运行
         self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 事件循环内的停止事件，用于立即唤醒扫描间隔等待
+        self._async_stop_event: Optional[asyncio.Event] = None
     
     @property
     def is_running(self) -> bool:
@@ -63,8 +68,9 @@ class AnalysisScheduler:
         self._running = True
         self._stop_event.clear()
         
-        # 创建新的事件循环
+        # 创建新的事件循环及循环内的停止事件
         self._loop = asyncio.new_event_loop()
+        self._async_stop_event = asyncio.Event()
         
         # 启动调度线程
         self._scheduler_thread = threading.Thread(target=self._scheduler_loop, daemon=True)
@@ -82,6 +88,13 @@ class AnalysisScheduler:
         self._stop_event.set()
         self._running = False
         
+        # 唤醒事件循环中的等待
+        if self._loop and self._async_stop_event and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._async_stop_event.set)
+            except RuntimeError:
+                pass
+        
         # 使用较短的超时时间，避免阻塞太久
         if self._scheduler_thread and self._scheduler_thread.is_alive():
             self._scheduler_thread.join(timeout=2)
@@ -98,22 +111,33 @@ class AnalysisScheduler:
             except Exception as e:
                 logger.warning(f"关闭事件循环时出错: {e}")
             self._loop = None
+            self._async_stop_event = None
         
         logger.info("调度器已停止")
     
     def _scheduler_loop(self):
-        """调度主循环"""
+        """调度线程入口 - 事件循环只启动一次，常驻运行主协程"""
         asyncio.set_event_loop(self._loop)
         
+        try:
+            self._loop.run_until_complete(self._main_coro())
+        except Exception as e:
+            logger.error(f"调度线程异常退出: {e}")
+    
+    async def _main_coro(self):
+        """调度主循环"""
         while not self._stop_event.is_set():
             try:
                 # 扫描并处理
-                self._loop.run_until_complete(self._scan_and_process())
+                await self._scan_and_process()
             except Exception as e:
                 logger.error(f"调度循环错误: {e}")
             
-            # 等待下一次扫描
-            self._stop_event.wait(self.scan_interval)
+            # 等待下一次扫描（stop() 会立即唤醒）
+            try:
+                await asyncio.wait_for(self._async_stop_event.wait(), timeout=self.scan_interval)
+            except asyncio.TimeoutError:
+                pass
     
     async def _scan_and_process(self):
         """扫描并处理待分析的切片"""
@@ -148,7 +172,19 @@ class AnalysisScheduler:
         batch_duration = 0
         max_duration = self.batch_duration * 60  # 转换为秒
         
-        for chunk in chunks:
+        # 批次必须在时间上连续，按开始时间排序后贪心装箱
+        ordered = sorted(chunks, key=lambda c: c.start_time or datetime.min)
+        
+        for chunk in ordered:
+            # 超长切片单独成批，避免与前后切片挤在一起
+            if chunk.duration_seconds >= max_duration:
+                if current_batch:
+                    batches.append(current_batch)
+                    current_batch = []
+                    batch_duration = 0
+                batches.append([chunk])
+                continue
+            
             if batch_duration + chunk.duration_seconds > max_duration and current_batch:
                 batches.append(current_batch)
                 current_batch = []
@@ -177,49 +213,55 @@ class AnalysisScheduler:
         batch_id = self.storage.create_batch(batch)
         
         # 更新切片状态
-        for chunk in chunks:
-            if chunk.id:
-                self.storage.update_chunk_status(chunk.id, ChunkStatus.PROCESSING, batch_id)
+        self.storage.update_chunk_statuses_bulk(
+            [c.id for c in chunks if c.id], ChunkStatus.PROCESSING, batch_id
+        )
         
         try:
             # 更新批次状态为处理中
             self.storage.update_batch(batch_id, BatchStatus.PROCESSING)
             
-            # 转录所有切片
+            # 并发转录所有切片（受信号量限制，避免触发 API 限流）
+            # 不预先检查文件是否存在，缺失的切片由转录时的 FileNotFoundError 处理
+            semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_TRANSCRIBE)
+            results = await self._gather_until_stopped(
+                [self._transcribe_chunk(chunk, semaphore) for chunk in chunks]
+            )
+            
+            if results is None:
+                # 调度器停止：取消未完成的转录，切片恢复为待分析，下次启动重新处理
+                logger.info(f"调度器已停止，批次 {batch_id} 中止")
+                self.storage.update_batch(batch_id, BatchStatus.FAILED, error_message="调度器停止，批次已中止")
+                self.storage.update_chunk_statuses_bulk(
+                    [c.id for c in chunks if c.id], ChunkStatus.PENDING
+                )
+                return
+            
             all_observations = []
-            for chunk in chunks:
-                if not Path(chunk.file_path).exists():
+            failed_chunk_ids = set()
+            for chunk, observations in zip(chunks, results):
+                if isinstance(observations, FileNotFoundError):
                     logger.warning(f"切片文件不存在: {chunk.file_path}")
                     continue
+                if isinstance(observations, BaseException):
+                    logger.error(f"切片转录失败 {chunk.file_path}: {observations}")
+                    if chunk.id:
+                        failed_chunk_ids.add(chunk.id)
+                    continue
                 
-                # 读取窗口记录
-                window_records = None
-                if chunk.window_records_path:
-                    window_records_file = Path(chunk.window_records_path)
-                    if window_records_file.exists():
-                        try:
-                            import json
-                            with open(window_records_file, 'r', encoding='utf-8') as f:
-                                window_records = json.load(f)
-                            logger.debug(f"已加载 {len(window_records)} 条窗口记录")
-                        except Exception as e:
-                            logger.warning(f"读取窗口记录失败: {e}")
-                
-                observations = await self.provider.transcribe_video(
-                    chunk.file_path,
-                    chunk.duration_seconds,
-                    window_records=window_records
-                )
-                
-                # 调整时间戳（相对于批次开始时间）
+                # 调整时间戳（相对于批次开始时间，时间戳均为 float 秒数）
                 if chunk.start_time and batch.start_time:
                     offset = (chunk.start_time - batch.start_time).total_seconds()
-                    for obs in observations:
-                        obs.start_ts += offset
-                        obs.end_ts += offset
+                    if offset:
+                        for obs in observations:
+                            obs.start_ts += offset
+                            obs.end_ts += offset
                 
                 all_observations.extend(observations)
             
+            if failed_chunk_ids:
+                self.storage.update_chunk_statuses_bulk(list(failed_chunk_ids), ChunkStatus.FAILED)
+            
             if not all_observations:
                 logger.warning(f"批次 {batch_id} 没有生成任何观察记录")
                 self.storage.update_batch(batch_id, BatchStatus.COMPLETED, "[]")
@@ -235,25 +277,26 @@ class AnalysisScheduler:
                 start_time=batch.start_time
             )
             
-            # 保存卡片
+            # 将相对时间转换为绝对时间
             for card in cards:
-                # 将相对时间转换为绝对时间
                 if batch.start_time:
                     if card.start_time is None and hasattr(card, '_relative_start'):
                         card.start_time = batch.start_time + timedelta(seconds=card._relative_start)
                     if card.end_time is None and hasattr(card, '_relative_end'):
                         card.end_time = batch.start_time + timedelta(seconds=card._relative_end)
-                
-                self.storage.save_card(card, batch_id)
+            
+            # 保存卡片（单个事务，放到线程池避免阻塞事件循环）
+            await asyncio.to_thread(self.storage.save_cards_bulk, cards, batch_id)
             
             # 更新状态
-            import json
-            observations_json = json.dumps([o.to_dict() for o in all_observations])
+            observations_json = observations_to_json(all_observations)
             self.storage.update_batch(batch_id, BatchStatus.COMPLETED, observations_json)
             
-            for chunk in chunks:
-                if chunk.id:
-                    self.storage.update_chunk_status(chunk.id, ChunkStatus.COMPLETED)
+            await asyncio.to_thread(
+                self.storage.update_chunk_statuses_bulk,
+                [c.id for c in chunks if c.id and c.id not in failed_chunk_ids],
+                ChunkStatus.COMPLETED
+            )
             
             logger.info(f"批次 {batch_id} 处理完成 - 生成 {len(cards)} 张卡片")
             
@@ -269,35 +312,85 @@ class AnalysisScheduler:
             
             self.storage.update_batch(batch_id, BatchStatus.FAILED, error_message=str(e))
             
-            for chunk in chunks:
-                if chunk.id:
-                    self.storage.update_chunk_status(chunk.id, ChunkStatus.FAILED)
+            self.storage.update_chunk_statuses_bulk(
+                [c.id for c in chunks if c.id], ChunkStatus.FAILED
+            )
             
             raise
     
+    async def _gather_until_stopped(self, coros: list) -> Optional[list]:
+        """
+        并发执行协程，调度器停止时取消未完成的任务
+        
+        Returns:
+            各协程的结果（异常作为结果返回）；调度器停止时返回 None
+        """
+        gather_future = asyncio.gather(*coros, return_exceptions=True)
+        if self._async_stop_event is None:
+            return await gather_future
+        
+        stop_waiter = asyncio.ensure_future(self._async_stop_event.wait())
+        try:
+            await asyncio.wait({gather_future, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop_waiter.cancel()
+        
+        if gather_future.done():
+            return gather_future.result()
+        
+        gather_future.cancel()
+        try:
+            await gather_future
+        except asyncio.CancelledError:
+            pass
+        return None
+    
+    async def _transcribe_chunk(self, chunk: VideoChunk, semaphore: asyncio.Semaphore) -> List[Observation]:
+        """转录单个切片（读取窗口记录后调用 API）"""
+        window_records = None
+        if chunk.window_records_path:
+            try:
+                with open(chunk.window_records_path, 'r', encoding='utf-8') as f:
+                    window_records = json.load(f)
+                logger.debug(f"已加载 {len(window_records)} 条窗口记录")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"读取窗口记录失败: {e}")
+        
+        async with semaphore:
+            return await self.provider.transcribe_video(
+                chunk.file_path,
+                chunk.duration_seconds,
+                window_records=window_records
+            )
+    
     def _delete_chunk_files(self, chunks: List[VideoChunk]):
         """
-        删除已分析完成的视频切片文件和窗口记录文件
+        删除已分析完成的视频切片文件、窗口记录文件和关键帧文件
         只在分析成功后调用，确保数据已保存到数据库
         """
+        def unlink(path: str) -> bool:
+            try:
+                os.unlink(path)
+                return True
+            except FileNotFoundError:
+                return False
+            except OSError as e:
+                failed.append((path, e))
+                return False
+        
         deleted_count = 0
+        failed = []
         for chunk in chunks:
-            try:
-                # 删除视频文件
-                chunk_path = Path(chunk.file_path)
-                if chunk_path.exists():
-                    chunk_path.unlink()
-                    deleted_count += 1
-                    logger.debug(f"已删除视频切片: {chunk_path.name}")
-                
-                # 删除窗口记录文件
-                if chunk.window_records_path:
-                    window_records_path = Path(chunk.window_records_path)
-                    if window_records_path.exists():
-                        window_records_path.unlink()
-                        logger.debug(f"已删除窗口记录: {window_records_path.name}")
-            except Exception as e:
-                logger.warning(f"删除文件失败 {chunk.file_path}: {e}")
+            if unlink(chunk.file_path):
+                deleted_count += 1
+            if chunk.window_records_path:
+                unlink(chunk.window_records_path)
+            unlink(str(keyframes_path(chunk.file_path)))
+        
+        for path, e in failed:
+            logger.warning(f"删除文件失败 {path}: {e}")
         
         if deleted_count > 0:
             logger.info(f"已清理 {deleted_count} 个视频切片文件")
@@ -305,37 +398,37 @@ class AnalysisScheduler:
     def _cleanup_if_over_limit(self):
         """当缓存目录超过大小上限时，按时间从旧到新删除文件"""
         chunks_dir = config.CHUNKS_DIR
-        if not chunks_dir.exists():
-            return
-
         max_bytes = config.CHUNKS_MAX_SIZE_GB * 1024 ** 3
 
+        # os.scandir 的 DirEntry.stat() 在 Windows 上直接使用目录枚举结果，无需额外系统调用
         try:
-            files = [f for f in chunks_dir.iterdir() if f.is_file()]
+            with os.scandir(chunks_dir) as it:
+                files = [(entry.path, entry.name, entry.stat()) for entry in it if entry.is_file()]
+        except FileNotFoundError:
+            return
         except Exception as e:
             logger.warning(f"扫描缓存目录失败: {e}")
             return
 
-        total_size = sum(f.stat().st_size for f in files)
+        total_size = sum(st.st_size for _, _, st in files)
         if total_size <= max_bytes:
             return
 
         # 按修改时间排序，最旧的在前
-        files.sort(key=lambda f: f.stat().st_size)
-        files.sort(key=lambda f: f.stat().st_mtime)
+        files.sort(key=lambda f: (f[2].st_mtime, f[2].st_size))
 
         deleted_count = 0
-        for f in files:
+        for path, name, st in files:
             if total_size <= max_bytes:
                 break
             try:
-                size = f.stat().st_size
-                f.unlink()
+                size = st.st_size
+                os.unlink(path)
                 total_size -= size
                 deleted_count += 1
-                logger.debug(f"缓存清理: 删除 {f.name} ({size / 1024 / 1024:.1f}MB)")
+                logger.debug(f"缓存清理: 删除 {name} ({size / 1024 / 1024:.1f}MB)")
             except Exception as e:
-                logger.warning(f"缓存清理失败 {f.name}: {e}")
+                logger.warning(f"缓存清理失败 {name}: {e}")
 
         if deleted_count > 0:
             logger.info(f"缓存清理完成: 删除 {deleted_count} 个文件，当前大小 {total_size / 1024 / 1024:.0f}MB")
@@ -354,6 +447,9 @@ class AnalysisManager:
     def __init__(self, storage: Optional[StorageManager] = None):
         self.storage = storage or StorageManager()
         self.scheduler = AnalysisScheduler(storage=self.storage)
+        
+        # 手动分析使用的事件循环（调度器未运行时懒创建，之后复用）
+        self._adhoc_loop: Optional[asyncio.AbstractEventLoop] = None
     
     def start_scheduler(self):
         """启动自动调度"""
@@ -365,11 +461,18 @@ class AnalysisManager:
     
     def analyze_now(self):
         """立即分析（同步）"""
-        loop = asyncio.new_event_loop()
-        try:
-            loop.run_until_complete(self.scheduler.process_immediately())
-        finally:
-            loop.close()
+        # 调度器事件循环正在运行时，直接提交到该循环，避免重复创建事件循环
+        scheduler_loop = self.scheduler._loop
+        if scheduler_loop and not scheduler_loop.is_closed() and scheduler_loop.is_running():
+            future = asyncio.run_coroutine_threadsafe(
+                self.scheduler.process_immediately(), scheduler_loop
+            )
+            future.result()
+            return
+        
+        if self._adhoc_loop is None or self._adhoc_loop.is_closed():
+            self._adhoc_loop = asyncio.new_event_loop()
+        self._adhoc_loop.run_until_complete(self.scheduler.process_immediately())
     
     @property
     def is_running(self) -> bool:
@@ -14,58 +14,125 @@ import config
 logger = logging.getLogger(__name__)
 
 
+# 配置键常量（模块级字符串，热路径上避免类属性查找）
+EMAIL_SEND_TIMES = "email_send_times"  # JSON: ["12:00", "22:00"]
+VIDEO_MAX_FRAMES = "video_max_frames"  # int: 8
+API_TIMEOUT = "api_timeout"  # float: 120.0
+BATCH_DURATION_MINUTES = "batch_duration_minutes"  # int: 15
+LOG_MAX_SIZE_MB = "log_max_size_mb"  # int: 5
+LOG_BACKUP_COUNT = "log_backup_count"  # int: 5
+LOG_RETENTION_DAYS = "log_retention_days"  # int: 30
+DB_POOL_SIZE = "db_pool_size"  # int: 5
+DB_POOL_TIMEOUT = "db_pool_timeout"  # float: 30.0
+DB_IDLE_TIMEOUT = "db_idle_timeout"  # float: 300.0
+
+
 @dataclass
 class ConfigKey:
-    """配置键定义"""
-    EMAIL_SEND_TIMES: str = "email_send_times"  # JSON: ["12:00", "22:00"]
-    VIDEO_MAX_FRAMES: str = "video_max_frames"  # int: 8
-    API_TIMEOUT: str = "api_timeout"  # float: 120.0
-    BATCH_DURATION_MINUTES: str = "batch_duration_minutes"  # int: 15
-    LOG_MAX_SIZE_MB: str = "log_max_size_mb"  # int: 5
-    LOG_BACKUP_COUNT: str = "log_backup_count"  # int: 5
-    LOG_RETENTION_DAYS: str = "log_retention_days"  # int: 30
-    DB_POOL_SIZE: str = "db_pool_size"  # int: 5
-    DB_POOL_TIMEOUT: str = "db_pool_timeout"  # float: 30.0
-    DB_IDLE_TIMEOUT: str = "db_idle_timeout"  # float: 300.0
+    """配置键定义（兼容旧接口，值与模块级常量相同）"""
+    EMAIL_SEND_TIMES: str = EMAIL_SEND_TIMES
+    VIDEO_MAX_FRAMES: str = VIDEO_MAX_FRAMES
+    API_TIMEOUT: str = API_TIMEOUT
+    BATCH_DURATION_MINUTES: str = BATCH_DURATION_MINUTES
+    LOG_MAX_SIZE_MB: str = LOG_MAX_SIZE_MB
+    LOG_BACKUP_COUNT: str = LOG_BACKUP_COUNT
+    LOG_RETENTION_DAYS: str = LOG_RETENTION_DAYS
+    DB_POOL_SIZE: str = DB_POOL_SIZE
+    DB_POOL_TIMEOUT: str = DB_POOL_TIMEOUT
+    DB_IDLE_TIMEOUT: str = DB_IDLE_TIMEOUT
 
 
 # 默认值映射 (从 config.py 或硬编码)
 DEFAULT_VALUES = {
-    ConfigKey.EMAIL_SEND_TIMES: '["12:00", "22:00"]',
-    ConfigKey.VIDEO_MAX_FRAMES: "8",
-    ConfigKey.API_TIMEOUT: "120.0",
-    ConfigKey.BATCH_DURATION_MINUTES: str(getattr(config, 'BATCH_DURATION_MINUTES', 15)),
-    ConfigKey.LOG_MAX_SIZE_MB: "5",
-    ConfigKey.LOG_BACKUP_COUNT: "5",
-    ConfigKey.LOG_RETENTION_DAYS: "30",
-    ConfigKey.DB_POOL_SIZE: "5",
-    ConfigKey.DB_POOL_TIMEOUT: "30.0",
-    ConfigKey.DB_IDLE_TIMEOUT: "300.0",
+    EMAIL_SEND_TIMES: '["12:00", "22:00"]',
+    VIDEO_MAX_FRAMES: "8",
+    API_TIMEOUT: "120.0",
+    BATCH_DURATION_MINUTES: str(getattr(config, 'BATCH_DURATION_MINUTES', 15)),
+    LOG_MAX_SIZE_MB: "5",
+    LOG_BACKUP_COUNT: "5",
+    LOG_RETENTION_DAYS: "30",
+    DB_POOL_SIZE: "5",
+    DB_POOL_TIMEOUT: "30.0",
+    DB_IDLE_TIMEOUT: "300.0",
 }
 
+# 整数类型的配置键
+_INT_KEYS = frozenset({
+    VIDEO_MAX_FRAMES,
+    BATCH_DURATION_MINUTES,
+    LOG_MAX_SIZE_MB,
+    LOG_BACKUP_COUNT,
+    LOG_RETENTION_DAYS,
+    DB_POOL_SIZE,
+})
+
+# 浮点数类型的配置键
+_FLOAT_KEYS = frozenset({
+    API_TIMEOUT,
+    DB_POOL_TIMEOUT,
+    DB_IDLE_TIMEOUT,
+})
+
 
-class ConfigManager(QObject):
+def _parse_value(key: str, str_value: str) -> Any:
     """
-    集中配置管理器
+    解析字符串值为适当类型
     
-    优先从数据库读取用户配置，回退到 config.py 默认值。
-    配置变更时发出信号通知其他组件。
+    Args:
+        key: 配置键（用于判断类型）
+        str_value: 字符串值
+    
+    Returns:
+        解析后的值
     """
+    if not str_value:
+        return None
     
-    # 配置变更信号: (key, new_value)
-    config_changed = Signal(str, object)
+    # JSON 类型的配置
+    if key == EMAIL_SEND_TIMES:
+        try:
+            return json.loads(str_value)
+        except json.JSONDecodeError:
+            return str_value
+    
+    # 整数类型
+    if key in _INT_KEYS:
+        try:
+            return int(str_value)
+        except ValueError:
+            return str_value
+    
+    # 浮点数类型
+    if key in _FLOAT_KEYS:
+        try:
+            return float(str_value)
+        except ValueError:
+            return str_value
+    
+    return str_value
+
+
+# 预解析的默认值（模块加载时解析一次）
+_PARSED_DEFAULTS = {key: _parse_value(key, value) for key, value in DEFAULT_VALUES.items()}
+
+
+class _ConfigCore:
+    """
+    配置读写核心（纯 Python，不依赖 Qt）
+    
+    优先从数据库读取用户配置，回退到 config.py 默认值。
+    无 GUI 的场景（命令行、测试）可直接使用，跳过 QObject 初始化。
+    """
     
     def __init__(self, storage=None):
         """
-        初始化配置管理器
+        初始化配置核心
         
         Args:
             storage: StorageManager 实例，用于读写数据库
         """
-        super().__init__()
         self._storage = storage
         self._cache = {}  # 内存缓存
-        logger.info("ConfigManager 初始化完成")
     
     def set_storage(self, storage):
         """设置 StorageManager（延迟注入）"""
@@ -102,10 +169,8 @@ class ConfigManager(QObject):
         
         # 回退到默认值
         if value is None:
-            default_str = DEFAULT_VALUES.get(key, "")
-            if default_str:
-                value = self._parse_value(key, default_str)
-            else:
+            value = _PARSED_DEFAULTS.get(key)
+            if value is None:
                 value = default
         
         # 缓存结果
@@ -137,8 +202,11 @@ class ConfigManager(QObject):
         # 更新缓存
         self._cache[key] = value
         
-        # 发出变更信号
-        self.config_changed.emit(key, value)
+        self._on_config_changed(key, value)
+    
+    def _on_config_changed(self, key: str, value: Any) -> None:
+        """配置变更钩子（子类可覆盖以发出通知）"""
+        pass
     
     def get_email_send_times(self) -> List[Tuple[int, int]]:
         """
@@ -147,7 +215,7 @@ class ConfigManager(QObject):
         Returns:
             [(hour, minute), ...] 格式的时间列表
         """
-        times_str = self.get(ConfigKey.EMAIL_SEND_TIMES, '["12:00", "22:00"]')
+        times_str = self.get(EMAIL_SEND_TIMES, '["12:00", "22:00"]')
         
         result = []
         try:
@@ -177,7 +245,7 @@ class ConfigManager(QObject):
             times: [(hour, minute), ...] 格式的时间列表
         """
         times_str_list = [f"{h:02d}:{m:02d}" for h, m in times]
-        self.set(ConfigKey.EMAIL_SEND_TIMES, json.dumps(times_str_list))
+        self.set(EMAIL_SEND_TIMES, json.dumps(times_str_list))
     
     def get_int(self, key: str, default: int = 0) -> int:
         """获取整数配置值"""
@@ -196,54 +264,8 @@ class ConfigManager(QObject):
             return default
     
     def _parse_value(self, key: str, str_value: str) -> Any:
-        """
-        解析字符串值为适当类型
-        
-        Args:
-            key: 配置键（用于判断类型）
-            str_value: 字符串值
-        
-        Returns:
-            解析后的值
-        """
-        if not str_value:
-            return None
-        
-        # JSON 类型的配置
-        if key == ConfigKey.EMAIL_SEND_TIMES:
-            try:
-                return json.loads(str_value)
-            except json.JSONDecodeError:
-                return str_value
-        
-        # 整数类型
-        int_keys = {
-            ConfigKey.VIDEO_MAX_FRAMES,
-            ConfigKey.BATCH_DURATION_MINUTES,
-            ConfigKey.LOG_MAX_SIZE_MB,
-            ConfigKey.LOG_BACKUP_COUNT,
-            ConfigKey.LOG_RETENTION_DAYS,
-            ConfigKey.DB_POOL_SIZE,
-        }
-        if key in int_keys:
-            try:
-                return int(str_value)
-            except ValueError:
-                return str_value
-        
-        # 浮点数类型
-        float_keys = {
-            ConfigKey.API_TIMEOUT,
-            ConfigKey.DB_POOL_TIMEOUT,
-            ConfigKey.DB_IDLE_TIMEOUT,
-        }
-        if key in float_keys:
-            try:
-                return float(str_value)
-            except ValueError:
-                return str_value
-        
-        return str_value
+        """解析字符串值为适当类型"""
+        return _parse_value(key, str_value)
     
     def _serialize_value(self, value: Any) -> str:
         """
@@ -263,3 +285,29 @@ class ConfigManager(QObject):
         """清空配置缓存"""
         self._cache.clear()
         logger.debug("配置缓存已清空")
+
+
+class ConfigManager(_ConfigCore, QObject):
+    """
+    集中配置管理器
+    
+    在 _ConfigCore 基础上增加 Qt 信号，配置变更时通知其他组件。
+    """
+    
+    # 配置变更信号: (key, new_value)
+    config_changed = Signal(str, object)
+    
+    def __init__(self, storage=None):
+        """
+        初始化配置管理器
+        
+        Args:
+            storage: StorageManager 实例，用于读写数据库
+        """
+        QObject.__init__(self)
+        _ConfigCore.__init__(self, storage)
+        logger.debug("ConfigManager 初始化完成")
+    
+    def _on_config_changed(self, key: str, value: Any) -> None:
+        """发出变更信号"""
+        self.config_changed.emit(key, value)
@@ -2,23 +2,160 @@
 Dayflow - 邮件推送服务
 支持 QQ 邮箱定时发送效率报告，含 AI 点评功能
 """
-import smtplib
-import logging
 import asyncio
-import httpx
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import atexit
+import contextlib
+import heapq
+import importlib.util
+import json
+import random
+import re
+import socket
+import sqlite3
+import logging
+import string
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, List, Optional, Set, Tuple, Union
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from operator import attrgetter, itemgetter
 
 import config
 
+# httpx、numpy、smtplib 和 email.mime 只在真正调用 AI 接口、分析数据或发送邮件时才导入，
+# 未启用邮件推送时不必在启动阶段加载它们
+if TYPE_CHECKING:
+    import httpx
+    import smtplib
+
+# httpx 的 HTTP/2 支持依赖 h2，这里只检测是否安装，不导入
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
 # 工作日活跃时长（小时）
 DAILY_ACTIVE_HOURS = 16
 
+# AI 接口共享的 HTTP 客户端（首次使用时创建，复用连接池避免每次请求重新握手）
+_HTTP_CLIENT: Optional["httpx.Client"] = None
+_HTTP_CLIENT_LOCK = threading.Lock()
+
+
+def _get_http_client() -> "httpx.Client":
+    """获取共享的 HTTP 客户端"""
+    import httpx
+    
+    global _HTTP_CLIENT
+    with _HTTP_CLIENT_LOCK:
+        if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+            _HTTP_CLIENT = httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(15.0, connect=5.0),
+                limits=httpx.Limits(max_keepalive_connections=4, max_connections=8, keepalive_expiry=60),
+                headers={"Content-Type": "application/json"}
+            )
+            atexit.register(_HTTP_CLIENT.close)
+        return _HTTP_CLIENT
+
+
+class _AIResponseCache:
+    """
+    AI 回复缓存（LRU，按量化后的统计数据作键）
+    
+    首次使用时从磁盘加载，进程退出时写回，使缓存跨重启有效
+    """
+    
+    def __init__(self, path, maxsize: int = 256):
+        self._path = path
+        self._maxsize = maxsize
+        self._data: Optional[OrderedDict] = None
+        self._dirty = False
+        self._lock = threading.Lock()
+    
+    def _load(self) -> OrderedDict:
+        """懒加载缓存文件（需持有锁）"""
+        if self._data is None:
+            self._data = OrderedDict()
+            try:
+                if self._path.exists():
+                    self._data.update(json.loads(self._path.read_text(encoding="utf-8")))
+            except Exception as e:
+                logger.debug(f"读取 AI 缓存失败: {e}")
+            atexit.register(self.save)
+        return self._data
+    
+    @staticmethod
+    def _encode_key(key: tuple) -> str:
+        return json.dumps(key, ensure_ascii=False)
+    
+    def get(self, key: tuple):
+        with self._lock:
+            data = self._load()
+            k = self._encode_key(key)
+            if k not in data:
+                return None
+            data.move_to_end(k)
+            return data[k]
+    
+    def put(self, key: tuple, value) -> None:
+        with self._lock:
+            data = self._load()
+            k = self._encode_key(key)
+            data[k] = value
+            data.move_to_end(k)
+            while len(data) > self._maxsize:
+                data.popitem(last=False)
+            self._dirty = True
+    
+    def save(self) -> None:
+        """写回磁盘（仅在有新内容时）"""
+        with self._lock:
+            if not self._dirty or self._data is None:
+                return
+            try:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                self._path.write_text(json.dumps(self._data, ensure_ascii=False), encoding="utf-8")
+                self._dirty = False
+            except Exception as e:
+                logger.debug(f"保存 AI 缓存失败: {e}")
+
+
+_AI_CACHE = _AIResponseCache(config.APP_DATA_DIR / "ai_cache.json")
+
+
+# 模块共享的 I/O 线程池（报告发送等阻塞任务），避免各处各自创建线程池
+# 4 个线程足够：2 个并发 AI 请求 + 1 个 SMTP 发送 + 1 个备用
+_IO_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="dayflow-io")
+atexit.register(_IO_POOL.shutdown, wait=False)
+
+
+def _compile_template(template: str) -> List[Tuple[str, Optional[str]]]:
+    """将 str.format 风格的模板预先拆分为 (字面文本, 字段名) 片段"""
+    return [(literal, field) for literal, field, _, _ in string.Formatter().parse(template)]
+
+
+def _render_template(parts: List[Tuple[str, Optional[str]]], values: dict) -> str:
+    """按预先拆分的片段拼接模板"""
+    return "".join(
+        literal if field is None else f"{literal}{values[field]}"
+        for literal, field in parts
+    )
+
+
+def _minify_html(html: str) -> str:
+    """去掉模板中的换行和缩进（用于循环渲染的片段，减小邮件体积）"""
+    return re.sub(r'\n\s*', '', html)
+
 
 @dataclass
 class EmailConfig:
@@ -27,73 +164,223 @@ class EmailConfig:
     smtp_port: int = 465
     sender_email: str = ""
     auth_code: str = ""  # QQ邮箱授权码
-    receiver_email: str = ""
+    receiver_email: Union[str, List[str]] = ""  # 多个收件人可用列表或逗号/分号分隔
     enabled: bool = False
+    
+    @property
+    def recipients(self) -> List[str]:
+        """收件人地址列表"""
+        if isinstance(self.receiver_email, str):
+            addrs = re.split(r"[,;，；]", self.receiver_email)
+        else:
+            addrs = self.receiver_email
+        return [a.strip() for a in addrs if a and a.strip()]
 
 
 class EmailService:
-    """邮件服务"""
+    """
+    邮件服务
+    
+    SMTP 连接在多次发送之间复用，避免每封邮件都重新进行 TLS 握手和登录；
+    连接空闲过久、发送数量达到上限或邮箱配置变化时会重新建立。
+    """
+    
+    # 连接空闲超过此时间（秒）后重新建立
+    IDLE_TIMEOUT = 60
+    # 单个连接最多发送的邮件数
+    MAX_MESSAGES_PER_CONN = 100
     
     def __init__(self, config: EmailConfig):
         self.config = config
+        self._conn: Optional["smtplib.SMTP_SSL"] = None
+        self._conn_key: Optional[tuple] = None
+        self._last_used = 0.0
+        self._sent_count = 0
+        self._lock = threading.Lock()
+        # EHLO 使用的本机名：gethostname() 不查询 DNS，传给 SMTP_SSL 可跳过 smtplib 内部
+        # 在网络配置异常时可能阻塞数秒的 socket.getfqdn()；非 ASCII 主机名不能用于 EHLO
+        hostname = socket.gethostname()
+        self._local_hostname = hostname if hostname and hostname.isascii() else "localhost"
     
     def send_report(self, subject: str, html_content: str) -> tuple:
         """发送 HTML 报告邮件，返回 (成功, 错误信息)"""
+        return self.send_reports([(subject, html_content)])[0]
+    
+    def send_reports(self, messages: List[Tuple[str, str]]) -> List[tuple]:
+        """
+        批量发送 HTML 报告邮件（补发多份报告时使用）
+        
+        所有邮件在一次加锁期间通过同一个 SMTP 连接依次发送；
+        连续失败超过总数的 1/3 时放弃剩余邮件（多半是网络或账号问题，继续发送只会逐个超时）
+        
+        Args:
+            messages: [(主题, HTML 内容), ...]
+        
+        Returns:
+            与 messages 一一对应的 [(成功, 错误信息), ...]
+        """
         if not self.config.enabled:
-            return False, "邮件推送未启用"
+            return [(False, "邮件推送未启用")] * len(messages)
         
-        if not all([self.config.sender_email, self.config.auth_code, self.config.receiver_email]):
-            return False, "邮箱配置不完整"
+        recipients = self.config.recipients
+        if not all([self.config.sender_email, self.config.auth_code, recipients]):
+            return [(False, "邮箱配置不完整")] * len(messages)
         
-        try:
-            # 创建邮件
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = subject
-            msg["From"] = self.config.sender_email
-            msg["To"] = self.config.receiver_email
-            
-            # 添加 HTML 内容
-            html_part = MIMEText(html_content, "html", "utf-8")
-            msg.attach(html_part)
-            
-            # 发送邮件
-            logger.info(f"正在连接 SMTP 服务器: {self.config.smtp_server}:{self.config.smtp_port}")
-            server = smtplib.SMTP_SSL(self.config.smtp_server, self.config.smtp_port, timeout=30)
-            try:
-                logger.info("SMTP 连接成功，正在登录...")
-                server.login(self.config.sender_email, self.config.auth_code)
-                logger.info("登录成功，正在发送邮件...")
-                server.sendmail(
-                    self.config.sender_email,
-                    self.config.receiver_email,
-                    msg.as_string()
-                )
-                # sendmail 成功 = 邮件已发送
-                logger.info(f"邮件发送成功: {subject}")
-                return True, ""
-            finally:
-                # 忽略 quit() 时的错误（QQ 邮箱可能返回非标准响应）
+        results: List[tuple] = []
+        max_consecutive_failures = len(messages) / 3
+        consecutive_failures = 0
+        
+        with self._lock:
+            for subject, html_content in messages:
                 try:
-                    server.quit()
-                except Exception:
-                    pass
-            
-        except smtplib.SMTPAuthenticationError as e:
-            error_msg = "授权码错误或SMTP服务未开启"
+                    wire_bytes = self._build_message(subject, html_content, recipients)
+                    self._send_locked(wire_bytes, recipients)
+                except Exception as e:
+                    consecutive_failures += 1
+                    results.append((False, self._describe_error(e)))
+                    if consecutive_failures > max_consecutive_failures:
+                        break
+                    continue
+                consecutive_failures = 0
+                logger.info(f"邮件发送成功: {subject}")
+                results.append((True, ""))
+        
+        skipped = len(messages) - len(results)
+        if skipped:
+            logger.warning(f"连续 {consecutive_failures} 封邮件发送失败，放弃剩余 {skipped} 封")
+            results.extend([(False, "连续发送失败，已中止批量发送")] * skipped)
+        return results
+    
+    def _build_message(self, subject: str, html_content: str, recipients: List[str]) -> bytes:
+        """构建并序列化邮件（SMTP 要求 CRLF 换行）"""
+        from email.mime.text import MIMEText
+        
+        # 只有 HTML 一种正文，直接作为顶层消息，不再包一层 multipart/alternative
+        msg = MIMEText(html_content, "html", "utf-8")
+        msg["Subject"] = subject
+        msg["From"] = self.config.sender_email
+        msg["To"] = ", ".join(recipients)
+        return msg.as_bytes(policy=msg.policy.clone(linesep="\r\n"))
+    
+    @staticmethod
+    def _describe_error(e: Exception) -> str:
+        """记录发送异常并转换为用户可读的错误信息"""
+        import smtplib
+        
+        if isinstance(e, smtplib.SMTPAuthenticationError):
             logger.error(f"SMTP认证失败: {e}")
-            return False, error_msg
-        except smtplib.SMTPConnectError as e:
-            error_msg = "无法连接SMTP服务器，请检查网络"
+            return "授权码错误或SMTP服务未开启"
+        if isinstance(e, smtplib.SMTPConnectError):
             logger.error(f"SMTP连接失败: {e}")
-            return False, error_msg
-        except TimeoutError:
-            error_msg = "连接超时，请检查网络或端口是否被封锁"
+            return "无法连接SMTP服务器，请检查网络"
+        if isinstance(e, TimeoutError):
             logger.error("SMTP连接超时")
-            return False, error_msg
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"邮件发送失败: {e}")
-            return False, error_msg
+            return "连接超时，请检查网络或端口是否被封锁"
+        logger.error(f"邮件发送失败: {e}")
+        return str(e)
+    
+    def close(self) -> None:
+        """关闭复用的 SMTP 连接"""
+        with self._lock:
+            self._close_conn()
+    
+    def _send_locked(self, wire_bytes: bytes, recipients: List[str]) -> None:
+        """
+        在持有锁的情况下发送已序列化的邮件，出错时丢弃连接以便下次重建
+        
+        所有收件人共用一次 DATA 传输
+        """
+        import smtplib
+        
+        try:
+            try:
+                self._get_conn().sendmail(self.config.sender_email, recipients, wire_bytes)
+            except smtplib.SMTPServerDisconnected:
+                # 复用的连接被服务器关闭，重新连接后再试一次
+                logger.info("SMTP 连接已断开，正在重新连接...")
+                self._close_conn()
+                self._get_conn().sendmail(self.config.sender_email, recipients, wire_bytes)
+        except Exception:
+            self._close_conn()
+            raise
+        
+        # sendmail 成功 = 邮件已发送
+        self._sent_count += 1
+        self._last_used = time.monotonic()
+    
+    def _get_conn(self) -> "smtplib.SMTP_SSL":
+        """获取可用的 SMTP 连接，必要时重新建立"""
+        import smtplib
+        
+        key = (self.config.smtp_server, self.config.smtp_port,
+               self.config.sender_email, self.config.auth_code)
+        
+        if self._conn is not None:
+            reusable = (
+                key == self._conn_key
+                and time.monotonic() - self._last_used <= self.IDLE_TIMEOUT
+                and self._sent_count < self.MAX_MESSAGES_PER_CONN
+            )
+            if reusable:
+                try:
+                    # RSET 探测连接是否仍然可用
+                    self._conn.rset()
+                    return self._conn
+                except (smtplib.SMTPException, OSError):
+                    logger.debug("SMTP 连接已失效，重新连接")
+            self._close_conn()
+        
+        logger.info(f"正在连接 SMTP 服务器: {self.config.smtp_server}:{self.config.smtp_port}")
+        server = smtplib.SMTP_SSL(
+            self.config.smtp_server, self.config.smtp_port,
+            local_hostname=self._local_hostname, timeout=30
+        )
+        try:
+            logger.info("SMTP 连接成功，正在登录...")
+            server.login(self.config.sender_email, self.config.auth_code)
+        except Exception:
+            server.close()
+            raise
+        
+        self._conn = server
+        self._conn_key = key
+        self._sent_count = 0
+        self._last_used = time.monotonic()
+        return server
+    
+    def _close_conn(self) -> None:
+        """关闭当前连接（忽略 QQ 邮箱 quit() 可能返回的非标准响应）"""
+        if self._conn is None:
+            return
+        try:
+            self._conn.quit()
+        except Exception:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+        self._conn_key = None
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch_seconds(dt: datetime) -> float:
+    """转换为秒级时间戳（与 ActivityCard.duration_minutes 一样忽略时区信息）"""
+    return (dt.replace(tzinfo=None) - _EPOCH).total_seconds()
+
+
+@dataclass(slots=True)
+class Session:
+    """合并后的工作段（连续同类别的卡片）"""
+    category: str
+    start_time: Optional[datetime]
+    end_time: Optional[datetime]
+    duration: float  # 分钟
+    scores: List[float]
+    avg_score: int = 0
+    start_time_str: str = ""  # 预先格式化的开始时间（%H:%M）
 
 
 class DeepAnalyzer:
@@ -103,167 +390,231 @@ class DeepAnalyzer:
     注意：原始 cards 是每分钟一条记录（系统设计），需要合并成真正的工作段
     """
     
+    # 工作节奏的时段划分；np.digitize(hour, [6, 12, 18]) 的结果映射到时段下标，凌晨(<6)归入晚上
+    RHYTHM_PERIODS = ('上午(6-12)', '下午(12-18)', '晚上(18-24)')
+    _PERIOD_OF_BIN = (2, 0, 1, 2)
+    
     def __init__(self, cards: list):
+        import numpy as np
+        
         self.cards = cards
         self.sorted_cards = sorted(
-            [c for c in cards if c.start_time], 
-            key=lambda x: x.start_time
+            (c for c in cards if c.start_time),
+            key=attrgetter('start_time')
         )
+        # 按字段提取列式数组，合并与各项分析直接复用，避免反复访问卡片属性
+        n = len(self.sorted_cards)
+        self._cat = np.array([c.category for c in self.sorted_cards], dtype=object)
+        self._dur = np.fromiter((c.duration_minutes for c in self.sorted_cards), dtype=np.float64, count=n)
+        self._score = np.fromiter((c.productivity_score for c in self.sorted_cards), dtype=np.float64, count=n)
+        self._hour = np.fromiter((c.start_time.hour for c in self.sorted_cards), dtype=np.int8, count=n)
+        self._start_ts = np.fromiter((_epoch_seconds(c.start_time) for c in self.sorted_cards),
+                                     dtype=np.float64, count=n)
+        self._end_ts = np.fromiter((_epoch_seconds(c.end_time) if c.end_time else np.nan for c in self.sorted_cards),
+                                   dtype=np.float64, count=n)
         # 合并连续同类型记录为真正的工作段
         self.merged_sessions = self._merge_consecutive_cards()
     
-    def _merge_consecutive_cards(self) -> list:
+    def _merge_consecutive_cards(self) -> List[Session]:
         """
         将连续的同类型记录合并成真正的工作段
         
         例如：10个连续的"编程"卡片 → 1个10分钟的编程工作段
         
         注意：如果两张卡片之间的时间间隔超过 5 分钟，即使类别相同也视为不同工作段
+        
+        实现为对卡片序列做游程编码：先找出所有分段边界，再用 np.add.reduceat 一次性汇总每段的时长和评分
         """
-        if not self.sorted_cards:
+        import numpy as np
+        
+        cards = self.sorted_cards
+        if not cards:
             return []
         
         # 时间间隔阈值（分钟）- 超过此值视为不同工作段
         GAP_THRESHOLD_MINUTES = 5
         
-        sessions = []
-        current_session = {
-            'category': self.sorted_cards[0].category,
-            'start_time': self.sorted_cards[0].start_time,
-            'end_time': self.sorted_cards[0].end_time,
-            'duration': self.sorted_cards[0].duration_minutes,
-            'scores': [self.sorted_cards[0].productivity_score] if self.sorted_cards[0].productivity_score > 0 else []
-        }
+        n = len(cards)
+        cats, durs, scores = self._cat, self._dur, self._score
+        # 相邻卡片的时间间隔（秒）；上一张没有结束时间时为 NaN，比较结果为 False，即不因间隔拆分
+        gaps = self._start_ts[1:] - self._end_ts[:-1]
         
-        for card in self.sorted_cards[1:]:
-            # 计算与上一张卡片的时间间隔
-            time_gap = 0
-            if current_session['end_time'] and card.start_time:
-                time_gap = (card.start_time - current_session['end_time']).total_seconds() / 60
-            
-            # 如果类别相同且时间间隔在阈值内，合并到当前工作段
-            if card.category == current_session['category'] and time_gap <= GAP_THRESHOLD_MINUTES:
-                current_session['duration'] += card.duration_minutes
-                current_session['end_time'] = card.end_time
-                if card.productivity_score > 0:
-                    current_session['scores'].append(card.productivity_score)
-            else:
-                # 类别不同或时间间隔过大，保存当前工作段，开始新的
-                current_session['avg_score'] = int(sum(current_session['scores']) / len(current_session['scores'])) if current_session['scores'] else 0
-                sessions.append(current_session)
-                current_session = {
-                    'category': card.category,
-                    'start_time': card.start_time,
-                    'end_time': card.end_time,
-                    'duration': card.duration_minutes,
-                    'scores': [card.productivity_score] if card.productivity_score > 0 else []
-                }
+        # 类别变化或间隔过大的位置即为新工作段的起点
+        boundaries = np.flatnonzero((cats[1:] != cats[:-1]) | (gaps > GAP_THRESHOLD_MINUTES * 60)) + 1
+        starts_idx = np.concatenate(([0], boundaries))
+        ends_idx = np.concatenate((boundaries, [n]))
+        
+        scored = scores > 0
+        dur_sums = np.add.reduceat(durs, starts_idx).tolist()
+        score_sums = np.add.reduceat(np.where(scored, scores, 0), starts_idx)
+        score_counts = np.add.reduceat(scored.astype(np.int32), starts_idx)
         
-        # 保存最后一个工作段
-        current_session['avg_score'] = int(sum(current_session['scores']) / len(current_session['scores'])) if current_session['scores'] else 0
-        sessions.append(current_session)
+        sessions = []
+        for i, (start, end) in enumerate(zip(starts_idx.tolist(), ends_idx.tolist())):
+            count = int(score_counts[i])
+            sessions.append(Session(
+                category=cards[start].category,
+                start_time=cards[start].start_time,
+                end_time=cards[end - 1].end_time,
+                duration=dur_sums[i],
+                scores=scores[start:end][scored[start:end]].tolist(),
+                avg_score=int(score_sums[i] / count) if count else 0,
+                start_time_str=cards[start].start_time.strftime('%H:%M')
+            ))
         
         return sessions
     
     def analyze(self) -> dict:
         """执行完整的深度分析，返回结构化数据"""
         return {
-            'focus': self._analyze_focus(),
-            'rhythm': self._analyze_rhythm(),
-            'switching': self._analyze_switching(),
-            'categories': self._analyze_categories(),
+            'focus': self._focus,
+            'rhythm': self._rhythm,
+            'switching': self._switching,
+            'categories': self._categories,
             'timeline': self._analyze_timeline(),
             'day_type': self._classify_day_type(),
             'raw_record_count': len(self.cards)  # 原始记录数（分钟数）
         }
     
+    # 各项分析结果只计算一次，analyze() 与 _classify_day_type() 共用
+    @cached_property
+    def _focus(self) -> dict:
+        return self._analyze_focus()
+    
+    @cached_property
+    def _rhythm(self) -> dict:
+        return self._analyze_rhythm()
+    
+    @cached_property
+    def _switching(self) -> dict:
+        return self._analyze_switching()
+    
+    @cached_property
+    def _categories(self) -> dict:
+        return self._analyze_categories()
+    
+    @cached_property
+    def _session_pass(self) -> dict:
+        """
+        单次遍历工作段，同时收集专注力、任务切换、类别效率和时间线所需的中间数据
+        """
+        durations = []
+        switches = []
+        switch_pairs = Counter()
+        cat_minutes = Counter()
+        cat_sessions = Counter()
+        cat_scores = defaultdict(list)
+        timeline = []
+        
+        prev = None
+        for i, session in enumerate(self.merged_sessions):
+            time_str = session.start_time_str
+            durations.append(session.duration)
+            
+            if prev is not None:
+                switches.append({'time': time_str, 'from': prev.category, 'to': session.category})
+                switch_pairs[f"{prev.category}→{session.category}"] += 1
+            
+            cat = session.category or '其他'
+            cat_minutes[cat] += session.duration
+            cat_sessions[cat] += 1
+            if session.avg_score > 0:
+                cat_scores[cat].append(session.avg_score)
+            
+            # 时间线最多15个工作段
+            if i < 15 and session.start_time:
+                timeline.append({
+                    'time': time_str,
+                    'category': session.category,
+                    'duration': int(session.duration),
+                    'score': session.avg_score
+                })
+            prev = session
+        
+        return {
+            'durations': durations,
+            'switches': switches,
+            'switch_pairs': switch_pairs,
+            'cat_minutes': cat_minutes,
+            'cat_sessions': cat_sessions,
+            'cat_scores': cat_scores,
+            'timeline': timeline
+        }
+    
     def _analyze_focus(self) -> dict:
         """专注力分析 - 基于合并后的真实工作段"""
+        import numpy as np
+        
         if not self.merged_sessions:
             return {'has_data': False}
         
-        durations = [s['duration'] for s in self.merged_sessions if s['duration'] > 0]
-        if not durations:
+        all_durations = np.asarray(self._session_pass['durations'], dtype=np.float64)
+        durations = all_durations[all_durations > 0]
+        if not durations.size:
             return {'has_data': False}
         
-        # 时长分布统计（基于真实工作段）
-        fragments = [d for d in durations if d < 15]  # <15分钟
-        short = [d for d in durations if 15 <= d < 30]  # 15-30分钟
-        medium = [d for d in durations if 30 <= d < 60]  # 30-60分钟
-        deep = [d for d in durations if d >= 60]  # >60分钟（深度工作）
-        
-        # 找最长的那次
-        max_duration = max(durations)
-        max_session = None
-        for s in self.merged_sessions:
-            if s['duration'] == max_duration:
-                max_session = {
-                    'category': s['category'],
-                    'duration': int(max_duration),
-                    'time': s['start_time'].strftime('%H:%M') if s['start_time'] else ''
-                }
-                break
+        # 时长分布统计（基于真实工作段）：<15 碎片 / 15-30 / 30-60 / >=60 深度工作
+        buckets = np.searchsorted([15, 30, 60], durations, side='right')
+        fragment_count, short_count, medium_count, deep_count = np.bincount(buckets, minlength=4).tolist()
+        
+        # 找最长的那次（argmax 返回第一个最大值）
+        s = self.merged_sessions[int(all_durations.argmax())]
+        max_session = {
+            'category': s.category,
+            'duration': int(s.duration),
+            'time': s.start_time_str
+        }
         
         return {
             'has_data': True,
             'total_sessions': len(self.merged_sessions),  # 真实工作段数量
-            'fragment_count': len(fragments),  # 碎片数量
-            'fragment_percent': int(len(fragments) / len(durations) * 100) if durations else 0,
-            'short_count': len(short),
-            'medium_count': len(medium),
-            'deep_count': len(deep),  # 深度工作次数
-            'deep_total_mins': int(sum(deep)),  # 深度工作总时长
+            'fragment_count': fragment_count,  # 碎片数量
+            'fragment_percent': int(fragment_count / durations.size * 100),
+            'short_count': short_count,
+            'medium_count': medium_count,
+            'deep_count': deep_count,  # 深度工作次数
+            'deep_total_mins': int(durations[durations >= 60].sum()),  # 深度工作总时长
             'max_session': max_session,
-            'avg_duration': int(sum(durations) / len(durations))
+            'avg_duration': int(durations.sum() / durations.size)
         }
     
     def _analyze_rhythm(self) -> dict:
         """工作节奏分析 - 按时段统计"""
-        # 按小时统计
-        hourly_data = {}
-        for card in self.sorted_cards:
-            if card.start_time and card.productivity_score > 0:
-                hour = card.start_time.hour
-                if hour not in hourly_data:
-                    hourly_data[hour] = {'scores': [], 'minutes': 0}
-                hourly_data[hour]['scores'].append(card.productivity_score)
-                hourly_data[hour]['minutes'] += card.duration_minutes
-        
-        if not hourly_data:
+        import numpy as np
+        
+        scored = self._score > 0
+        if not scored.any():
             return {'has_data': False}
         
-        # 计算每小时平均分
-        hourly_avg = {h: int(sum(d['scores'])/len(d['scores'])) 
-                      for h, d in hourly_data.items()}
+        hours = self._hour[scored]
+        scores = self._score[scored]
+        minutes = self._dur[scored]
+        
+        # 按小时统计每小时平均分（按小时首次出现的顺序排列，跨零点时峰谷取值与时间顺序一致）
+        hour_counts = np.bincount(hours, minlength=24)
+        hour_score_sums = np.bincount(hours, weights=scores, minlength=24)
+        unique_hours, first_idx = np.unique(hours, return_index=True)
+        hourly_avg = {int(h): int(hour_score_sums[h] / hour_counts[h])
+                      for h in unique_hours[np.argsort(first_idx)]}
         
         # 找峰值和谷值
         peak_hour = max(hourly_avg, key=hourly_avg.get)
         low_hour = min(hourly_avg, key=hourly_avg.get)
         
         # 按时段汇总
-        periods = {
-            '上午(6-12)': {'scores': [], 'minutes': 0},
-            '下午(12-18)': {'scores': [], 'minutes': 0},
-            '晚上(18-24)': {'scores': [], 'minutes': 0}
-        }
-        for hour, data in hourly_data.items():
-            if 6 <= hour < 12:
-                periods['上午(6-12)']['scores'].extend(data['scores'])
-                periods['上午(6-12)']['minutes'] += data['minutes']
-            elif 12 <= hour < 18:
-                periods['下午(12-18)']['scores'].extend(data['scores'])
-                periods['下午(12-18)']['minutes'] += data['minutes']
-            else:
-                periods['晚上(18-24)']['scores'].extend(data['scores'])
-                periods['晚上(18-24)']['minutes'] += data['minutes']
+        period_idx = np.take(self._PERIOD_OF_BIN, np.digitize(hours, [6, 12, 18]))
+        period_counts = np.bincount(period_idx, minlength=3)
+        period_score_sums = np.bincount(period_idx, weights=scores, minlength=3)
+        period_minutes = np.bincount(period_idx, weights=minutes, minlength=3)
         
         period_stats = {}
-        for name, data in periods.items():
-            if data['scores']:
+        for i, name in enumerate(self.RHYTHM_PERIODS):
+            count = int(period_counts[i])
+            if count:
                 period_stats[name] = {
-                    'avg_score': int(sum(data['scores'])/len(data['scores'])),
-                    'total_mins': int(data['minutes']),
-                    'session_count': len(data['scores'])
+                    'avg_score': int(period_score_sums[i] / count),
+                    'total_mins': int(period_minutes[i]),
+                    'session_count': count
                 }
         
         return {
@@ -282,20 +633,11 @@ class DeepAnalyzer:
             return {'has_data': False, 'total_switches': 0}
         
         # 切换次数 = 工作段数量 - 1
-        switches = []
-        for i in range(1, len(self.merged_sessions)):
-            prev = self.merged_sessions[i-1]
-            curr = self.merged_sessions[i]
-            switches.append({
-                'time': curr['start_time'].strftime('%H:%M') if curr['start_time'] else '',
-                'from': prev['category'],
-                'to': curr['category']
-            })
+        switches = self._session_pass['switches']
         
         # 统计切换频率
-        from collections import Counter
-        switch_pairs = Counter(f"{s['from']}→{s['to']}" for s in switches)
-        most_common = switch_pairs.most_common(3)
+        # 只取前 3 个，用堆选取，不必对全部切换模式排序（并列时与 most_common 一样保持出现顺序）
+        most_common = heapq.nlargest(3, self._session_pass['switch_pairs'].items(), key=itemgetter(1))
         
         return {
             'has_data': True,
@@ -306,29 +648,21 @@ class DeepAnalyzer:
     
     def _analyze_categories(self) -> dict:
         """类别效率分析 - 基于合并后的真实工作段"""
-        from collections import defaultdict
-        
-        cat_data = defaultdict(lambda: {'scores': [], 'minutes': 0, 'sessions': 0})
-        
-        for session in self.merged_sessions:
-            cat = session['category'] or '其他'
-            if session['avg_score'] > 0:
-                cat_data[cat]['scores'].append(session['avg_score'])
-            cat_data[cat]['minutes'] += session['duration']
-            cat_data[cat]['sessions'] += 1
-        
-        if not cat_data:
+        cat_minutes = self._session_pass['cat_minutes']
+        if not cat_minutes:
             return {'has_data': False}
+        cat_sessions = self._session_pass['cat_sessions']
+        cat_scores = self._session_pass['cat_scores']
         
         # 计算每个类别的统计
         cat_stats = {}
-        for cat, data in cat_data.items():
-            avg_score = int(sum(data['scores'])/len(data['scores'])) if data['scores'] else 0
+        for cat, minutes in cat_minutes.items():
+            scores = cat_scores.get(cat, [])
             cat_stats[cat] = {
-                'avg_score': avg_score,
-                'total_mins': int(data['minutes']),
-                'session_count': data['sessions'],  # 真实工作段数量
-                'score_variance': self._calc_variance(data['scores']) if len(data['scores']) > 1 else 0
+                'avg_score': int(sum(scores) / len(scores)) if scores else 0,
+                'total_mins': int(minutes),
+                'session_count': cat_sessions[cat],  # 真实工作段数量
+                'score_variance': self._calc_variance(scores) if len(scores) > 1 else 0
             }
         
         # 找最高效和最低效
@@ -347,27 +681,18 @@ class DeepAnalyzer:
         """计算分数波动（标准差）"""
         if len(scores) < 2:
             return 0
-        avg = sum(scores) / len(scores)
-        variance = sum((s - avg) ** 2 for s in scores) / len(scores)
-        return int(variance ** 0.5)
+        import statistics
+        
+        return int(statistics.pstdev(scores))
     
     def _analyze_timeline(self) -> list:
         """生成时间线摘要 - 基于合并后的真实工作段"""
-        timeline = []
-        for session in self.merged_sessions[:15]:  # 最多15个工作段
-            if session['start_time']:
-                timeline.append({
-                    'time': session['start_time'].strftime('%H:%M'),
-                    'category': session['category'],
-                    'duration': int(session['duration']),
-                    'score': session.get('avg_score', 0)
-                })
-        return timeline
+        return self._session_pass['timeline']
     
     def _classify_day_type(self) -> dict:
         """基于数据判断今日类型"""
-        focus = self._analyze_focus()
-        switching = self._analyze_switching()
+        focus = self._focus
+        switching = self._switching
         
         if not focus.get('has_data'):
             return {'type': '数据不足', 'description': '记录较少，无法分类'}
@@ -486,10 +811,62 @@ class AICommentGenerator:
 - 使用 Markdown 格式，包含小标题
 - 直接输出分析内容，不要有任何前言"""
 
+    # 合并 Prompt：一次请求同时生成点评和专业分析，数据只上传一次
+    COMBINED_PROMPT = """你是一位专业的时间管理与行为分析专家，同时也是用户懂时间管理的朋友。请基于以下用户今日的活动数据，一次完成两项写作任务。
+
+【数据说明】
+- "工作段"是指连续做同一类事情的时间段（系统自动识别并合并）
+- 切换次数是指在不同类别之间切换的次数
+- 效率分数基于屏幕活动的专注程度评估
+
+【今日原始数据】
+日期：{date}
+总记录时长：{recorded_time}
+综合效率评分：{score}分
+今日类型：{day_type}
+时间分布：{categories}
+
+【专注力指标】
+{focus_data}
+
+【时段效率数据】
+{rhythm_data}
+
+【任务切换数据】
+{switching_data}
+
+【类别效率对比】
+{category_data}
+
+【任务一：朋友式点评（comment）】
+- 像发微信语音转文字那样自然，100-150字，不要标题
+- 开头别用"今天"，从某个有趣的数据点切入，说出数据背后有意思的发现
+- 禁止鸡汤（"继续保持"、"加油"等）、套路开头和猜测，最多1个 emoji 放结尾
+
+【任务二：专业深度分析（expert）】
+- 依次分析：行为模式诊断、效率瓶颈识别、优势与亮点、改进策略（2-3条具体可执行的建议）
+- 专业、客观，有数据支撑，总字数300-500字
+- 使用 Markdown 格式，包含小标题，不要有任何前言
+
+【输出格式】
+只输出一个 JSON 对象，不要代码块标记或其他文字：
+{{"comment": "朋友式点评", "expert": "Markdown 格式的专业分析报告"}}"""
+
+    # API 重试配置：最多请求次数、可重试的状态码、单次等待上限（秒）
+    API_MAX_ATTEMPTS = 3
+    API_RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+    API_RETRY_MAX_DELAY = 10.0
+
+    # 预先拆分好的模板片段，生成 Prompt 时直接拼接，不必每次重新解析模板
+    _COMMENT_PARTS = _compile_template(COMMENT_PROMPT)
+    _ANALYSIS_PARTS = _compile_template(ANALYSIS_PROMPT)
+    _COMBINED_PARTS = _compile_template(COMBINED_PROMPT)
+
     def __init__(self, storage=None):
         self.storage = storage
         self.api_base_url = config.API_BASE_URL.rstrip("/")
         self.model = config.API_MODEL
+        self._endpoint = f"{self.api_base_url}/chat/completions"
     
     def _get_api_key(self) -> str:
         """获取 API Key（优先从数据库读取）"""
@@ -500,94 +877,8 @@ class AICommentGenerator:
         return config.API_KEY
     
     def generate_comment(self, stats: dict, deep_analysis: dict) -> str:
-        """
-        生成 AI 点评
-        
-        Args:
-            stats: 基础统计数据
-            deep_analysis: DeepAnalyzer 生成的深度分析结果
-        """
-        api_key = self._get_api_key()
-        if not api_key:
-            return self._fallback_comment(stats, deep_analysis)
-        
-        try:
-            recorded_h = stats['recorded_minutes'] // 60
-            recorded_m = stats['recorded_minutes'] % 60
-            
-            categories_str = "、".join([
-                f"{cat}({m//60}h{m%60}m)" 
-                for cat, m in stats['categories'][:5]
-            ]) if stats['categories'] else "无记录"
-            
-            # 格式化深度分析数据
-            focus = deep_analysis.get('focus', {})
-            rhythm = deep_analysis.get('rhythm', {})
-            switching = deep_analysis.get('switching', {})
-            categories = deep_analysis.get('categories', {})
-            day_type = deep_analysis.get('day_type', {})
-            
-            # 专注力数据
-            if focus.get('has_data'):
-                focus_data = f"""- 总共 {focus['total_sessions']} 段工作
-- 碎片(<15分钟): {focus['fragment_count']}段，占{focus['fragment_percent']}%
-- 深度工作(>60分钟): {focus['deep_count']}段，共{focus['deep_total_mins']}分钟
-- 最长一段: {focus['max_session']['duration']}分钟（{focus['max_session']['category']}，{focus['max_session']['time']}）
-- 平均每段: {focus['avg_duration']}分钟"""
-            else:
-                focus_data = "数据不足"
-            
-            # 节奏数据
-            if rhythm.get('has_data'):
-                period_lines = [f"- {name}: 均分{data['avg_score']}，共{data['total_mins']}分钟" 
-                               for name, data in rhythm.get('periods', {}).items()]
-                rhythm_data = "\n".join(period_lines) if period_lines else "数据不足"
-                rhythm_data += f"\n- 效率最高时段: {rhythm['peak_hour']}点（{rhythm['peak_score']}分）"
-                rhythm_data += f"\n- 效率最低时段: {rhythm['low_hour']}点（{rhythm['low_score']}分）"
-            else:
-                rhythm_data = "数据不足"
-            
-            # 切换数据
-            if switching.get('has_data'):
-                switching_data = f"- 总切换次数: {switching['total_switches']}次"
-                if switching.get('common_patterns'):
-                    patterns = [f"{p[0]}({p[1]}次)" for p in switching['common_patterns']]
-                    switching_data += f"\n- 常见切换: {', '.join(patterns)}"
-            else:
-                switching_data = "切换较少或无数据"
-            
-            # 类别数据
-            if categories.get('has_data'):
-                cat_lines = []
-                for cat, data in categories.get('stats', {}).items():
-                    cat_lines.append(f"- {cat}: 均分{data['avg_score']}，{data['session_count']}段共{data['total_mins']}分钟")
-                category_data = "\n".join(cat_lines[:5])
-                if categories.get('best') and categories.get('worst') and categories['best'] != categories['worst']:
-                    category_data += f"\n- 效率最高: {categories['best']}，最低: {categories['worst']}"
-            else:
-                category_data = "数据不足"
-            
-            # 今日类型
-            day_type_str = f"{day_type.get('type', '常规日')}（{day_type.get('indicators', '')}）"
-            
-            prompt = self.COMMENT_PROMPT.format(
-                date=stats['date'],
-                recorded_time=f"{recorded_h}小时{recorded_m}分钟",
-                score=stats['score'],
-                categories=categories_str,
-                focus_data=focus_data,
-                rhythm_data=rhythm_data,
-                switching_data=switching_data,
-                category_data=category_data,
-                day_type=day_type_str
-            )
-            
-            comment = self._call_api_sync(prompt, api_key, max_tokens=200)
-            return comment if comment else self._fallback_comment(stats, deep_analysis)
-            
-        except Exception as e:
-            logger.error(f"AI 点评生成失败: {e}")
-            return self._fallback_comment(stats, deep_analysis)
+        """生成 AI 点评（generate_comment_async 的同步入口，不能在已运行事件循环的线程中调用）"""
+        return asyncio.run(self.generate_comment_async(stats, deep_analysis))
     
     def generate_deep_analysis(self, stats: dict, deep_analysis: dict) -> str:
         """
@@ -605,84 +896,7 @@ class AICommentGenerator:
             return self._fallback_analysis(deep_analysis)
         
         try:
-            recorded_h = stats['recorded_minutes'] // 60
-            recorded_m = stats['recorded_minutes'] % 60
-            
-            categories_str = "、".join([
-                f"{cat}({m//60}h{m%60}m)" 
-                for cat, m in stats['categories'][:5]
-            ]) if stats['categories'] else "无记录"
-            
-            # 格式化深度分析数据
-            focus = deep_analysis.get('focus', {})
-            rhythm = deep_analysis.get('rhythm', {})
-            switching = deep_analysis.get('switching', {})
-            categories = deep_analysis.get('categories', {})
-            day_type = deep_analysis.get('day_type', {})
-            
-            # 专注力数据
-            if focus.get('has_data'):
-                focus_data = f"""- 工作段数量: {focus['total_sessions']}段
-- 碎片工作(<15min): {focus['fragment_count']}段，占比{focus['fragment_percent']}%
-- 深度工作(>60min): {focus['deep_count']}段，累计{focus['deep_total_mins']}分钟
-- 最长单次专注: {focus['max_session']['duration']}分钟（{focus['max_session']['category']}，{focus['max_session']['time']}开始）
-- 平均工作段时长: {focus['avg_duration']}分钟"""
-            else:
-                focus_data = "数据不足，无法分析"
-            
-            # 节奏数据
-            if rhythm.get('has_data'):
-                period_lines = [f"- {name}: 效率均分{data['avg_score']}分，工作{data['total_mins']}分钟，{data['session_count']}个工作段" 
-                               for name, data in rhythm.get('periods', {}).items()]
-                rhythm_data = "\n".join(period_lines) if period_lines else "数据不足"
-                rhythm_data += f"\n- 效率峰值: {rhythm['peak_hour']}:00（{rhythm['peak_score']}分）"
-                rhythm_data += f"\n- 效率低谷: {rhythm['low_hour']}:00（{rhythm['low_score']}分）"
-                rhythm_data += f"\n- 峰谷差值: {rhythm['peak_score'] - rhythm['low_score']}分"
-            else:
-                rhythm_data = "数据不足，无法分析"
-            
-            # 切换数据
-            if switching.get('has_data'):
-                switching_data = f"- 类别切换总次数: {switching['total_switches']}次"
-                if switching.get('common_patterns'):
-                    patterns = [f"{p[0]}（{p[1]}次）" for p in switching['common_patterns']]
-                    switching_data += f"\n- 高频切换模式: {', '.join(patterns)}"
-            else:
-                switching_data = "切换极少或无数据"
-            
-            # 类别数据
-            if categories.get('has_data'):
-                cat_lines = []
-                for cat, data in sorted(categories.get('stats', {}).items(), 
-                                        key=lambda x: x[1]['total_mins'], reverse=True):
-                    variance_text = f"，波动±{data['score_variance']}" if data['score_variance'] > 0 else ""
-                    cat_lines.append(f"- {cat}: 效率{data['avg_score']}分{variance_text}，{data['session_count']}段共{data['total_mins']}分钟")
-                category_data = "\n".join(cat_lines[:6])
-                if categories.get('best') and categories.get('worst') and categories['best'] != categories['worst']:
-                    best_data = categories['stats'].get(categories['best'], {})
-                    worst_data = categories['stats'].get(categories['worst'], {})
-                    diff = best_data.get('avg_score', 0) - worst_data.get('avg_score', 0)
-                    category_data += f"\n- 效率最高: {categories['best']}（{best_data.get('avg_score', 0)}分）"
-                    category_data += f"\n- 效率最低: {categories['worst']}（{worst_data.get('avg_score', 0)}分）"
-                    category_data += f"\n- 类别效率差: {diff}分"
-            else:
-                category_data = "数据不足，无法分析"
-            
-            # 今日类型
-            day_type_str = f"{day_type.get('type', '常规日')}（{day_type.get('indicators', '')}）"
-            
-            prompt = self.ANALYSIS_PROMPT.format(
-                date=stats['date'],
-                recorded_time=f"{recorded_h}小时{recorded_m}分钟",
-                score=stats['score'],
-                categories=categories_str,
-                focus_data=focus_data,
-                rhythm_data=rhythm_data,
-                switching_data=switching_data,
-                category_data=category_data,
-                day_type=day_type_str
-            )
-            
+            prompt = self._build_analysis_prompt(stats, deep_analysis)
             analysis = self._call_api_sync(prompt, api_key, max_tokens=1500)
             return analysis if analysis else self._fallback_analysis(deep_analysis)
             
@@ -690,143 +904,931 @@ class AICommentGenerator:
             logger.error(f"深度分析生成失败: {e}")
             return self._fallback_analysis(deep_analysis)
     
-    def _fallback_analysis(self, deep_analysis: dict) -> str:
-        """深度分析降级方案"""
-        focus = deep_analysis.get('focus', {})
-        rhythm = deep_analysis.get('rhythm', {})
-        switching = deep_analysis.get('switching', {})
-        day_type = deep_analysis.get('day_type', {})
+    def generate_combined(self, stats: dict, deep_analysis: dict) -> Tuple[str, str]:
+        """用一次请求同时生成 AI 点评和专业深度分析（generate_combined_async 的同步入口）"""
+        return asyncio.run(self.generate_combined_async(stats, deep_analysis))
+    
+    async def generate_comment_async(self, stats: dict, deep_analysis: dict,
+                                     client: Optional["httpx.AsyncClient"] = None) -> str:
+        """
+        生成 AI 点评
         
-        lines = ["### 行为模式"]
+        Args:
+            stats: 基础统计数据
+            deep_analysis: DeepAnalyzer 生成的深度分析结果
+            client: 复用的 AsyncClient，为空时临时创建
+        """
+        api_key = self._get_api_key()
+        if not api_key:
+            return self._fallback_comment(stats, deep_analysis)
         
-        dtype = day_type.get('type', '常规日')
-        lines.append(f"今日属于 **{dtype}**。{day_type.get('indicators', '')}")
+        # 统计数据量化后相同的点评直接复用，不再请求接口
+        cache_key = ("comment",) + self._stats_cache_key(stats)
+        cached = _AI_CACHE.get(cache_key)
+        if cached:
+            return cached
         
-        if focus.get('has_data'):
-            lines.append("")
-            lines.append("### 专注力表现")
-            if focus.get('deep_count', 0) > 0:
-                lines.append(f"- 完成了 {focus['deep_count']} 次深度工作（>60分钟），累计 {focus['deep_total_mins']} 分钟")
-            lines.append(f"- 最长专注 {focus.get('max_session', {}).get('duration', 0)} 分钟")
-            lines.append(f"- 碎片工作占比 {focus.get('fragment_percent', 0)}%")
+        try:
+            prompt = self._build_comment_prompt(stats, deep_analysis)
+            async with self._async_client(client) as client:
+                comment = await self._call_api_async(client, prompt, api_key, max_tokens=200)
+        except Exception as e:
+            logger.error(f"AI 点评生成失败: {e}")
+            comment = None
         
-        if rhythm.get('has_data'):
-            lines.append("")
-            lines.append("### 时段效率")
-            lines.append(f"- 效率峰值在 {rhythm.get('peak_hour', '')}:00（{rhythm.get('peak_score', 0)}分）")
-            lines.append(f"- 效率低谷在 {rhythm.get('low_hour', '')}:00（{rhythm.get('low_score', 0)}分）")
+        if not comment:
+            return self._fallback_comment(stats, deep_analysis)
+        _AI_CACHE.put(cache_key, comment)
+        return comment
+    
+    async def generate_combined_async(self, stats: dict, deep_analysis: dict,
+                                      client: Optional["httpx.AsyncClient"] = None) -> Tuple[str, str]:
+        """
+        用一次请求同时生成 AI 点评和专业深度分析
         
-        if switching.get('has_data') and switching.get('total_switches', 0) > 0:
-            lines.append("")
-            lines.append("### 任务切换")
-            lines.append(f"- 今日切换 {switching['total_switches']} 次")
+        模型按 JSON 返回 {"comment": ..., "expert": ...}；请求失败或结果无法解析时，
+        回退为 generate_both_async 的两次并发请求
         
-        return "\n".join(lines)
+        Args:
+            client: 复用的 AsyncClient（批量生成时共用），为空时临时创建
+        
+        Returns:
+            (点评, 专业分析)
+        """
+        comment, analysis, _ = await self._generate_combined(stats, deep_analysis, client)
+        return comment, analysis
     
-    def _call_api_sync(self, prompt: str, api_key: str, max_tokens: int = 300) -> Optional[str]:
-        """同步调用 API"""
-        try:
-            # 长输出需要更长超时
-            timeout = 30.0 if max_tokens > 500 else 15.0
+    async def _generate_combined(self, stats: dict, deep_analysis: dict,
+                                 client: Optional["httpx.AsyncClient"]) -> Tuple[str, str, bool]:
+        """
+        generate_combined_async 的实现
+        
+        Returns:
+            (点评, 专业分析, 两者是否都由 AI 生成)；任一项是降级文本时最后一项为 False
+        """
+        api_key = self._get_api_key()
+        if not api_key:
+            return self._fallback_comment(stats, deep_analysis), self._fallback_analysis(deep_analysis), False
+        
+        # 专业分析会引用具体数据，只在同一天内复用（重试、测试邮件、午间/晚间数据无明显变化时）
+        cache_key = ("combined", stats['date']) + self._stats_cache_key(stats)
+        cached = _AI_CACHE.get(cache_key)
+        if cached:
+            return cached[0], cached[1], True
+        
+        async with self._async_client(client) as client:
+            try:
+                prompt = _render_template(self._COMBINED_PARTS, self._analysis_prompt_values(stats, deep_analysis))
+                result = self._parse_combined(await self._call_api_async(client, prompt, api_key, max_tokens=1800))
+            except Exception as e:
+                logger.error(f"合并 AI 生成失败: {e}")
+                result = None
             
-            with httpx.Client(timeout=timeout) as client:
-                response = client.post(
-                    f"{self.api_base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": 0.7,
-                        "max_tokens": max_tokens  # 使用传入的参数
-                    }
-                )
-                response.raise_for_status()
-                result = response.json()
-                content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-                return content.strip() if content else None
-        except httpx.HTTPStatusError as e:
-            logger.warning(f"API HTTP 错误: {e.response.status_code}")
+            if result is None:
+                logger.info("合并 AI 结果不可用，改为分别生成点评和专业分析")
+                return await self._generate_both(stats, deep_analysis, client)
+        
+        _AI_CACHE.put(cache_key, list(result))
+        return result[0], result[1], True
+    
+    @staticmethod
+    def _async_client(client: Optional["httpx.AsyncClient"]):
+        """
+        传入了 AsyncClient 时原样复用（不负责关闭），否则临时创建一个
+        
+        AsyncClient 绑定创建它的事件循环，asyncio.run 每次都是新循环，因此不做模块级共享
+        """
+        if client is not None:
+            return contextlib.nullcontext(client)
+        
+        import httpx
+        return httpx.AsyncClient(http2=HTTP2_AVAILABLE, timeout=httpx.Timeout(15.0))
+    
+    @staticmethod
+    def _stats_cache_key(stats: dict) -> tuple:
+        """把统计数据量化成缓存键：分数按 5 分、时长按 15 分钟、前三类别按 30 分钟分桶"""
+        return (
+            stats['score'] // 5,
+            stats['recorded_minutes'] // 15,
+            tuple((cat, mins // 30) for cat, mins in stats['categories'][:3])
+        )
+    
+    @staticmethod
+    def _parse_combined(content: Optional[str]) -> Optional[Tuple[str, str]]:
+        """解析合并请求返回的 JSON，字段缺失或格式不对时返回 None"""
+        if not content:
             return None
-        except httpx.RequestError as e:
-            logger.warning(f"API 请求错误: {e}")
+        
+        # 兼容模型仍然包了 ```json 代码块的情况
+        start, end = content.find("{"), content.rfind("}")
+        if start < 0 or end <= start:
             return None
-        except Exception as e:
-            logger.warning(f"API 调用失败: {type(e).__name__}: {e}")
+        
+        try:
+            data = json.loads(content[start:end + 1])
+        except ValueError:
             return None
+        
+        comment = data.get("comment") if isinstance(data, dict) else None
+        expert = data.get("expert") if isinstance(data, dict) else None
+        if not isinstance(comment, str) or not isinstance(expert, str) or not comment.strip() or not expert.strip():
+            return None
+        return comment.strip(), expert.strip()
     
-    def _fallback_comment(self, stats: dict, deep_analysis: dict) -> str:
-        """降级方案：基于深度分析数据生成点评"""
-        score = stats['score']
+    def generate_both(self, stats: dict, deep_analysis: dict) -> Tuple[str, str]:
+        """
+        并发生成 AI 点评和专业深度分析（同步入口，不能在已运行事件循环的线程中调用）
+        
+        Returns:
+            (点评, 专业分析)
+        """
+        
+        return asyncio.run(self.generate_both_async(stats, deep_analysis))
+    
+    async def generate_both_async(self, stats: dict, deep_analysis: dict,
+                                  client: Optional["httpx.AsyncClient"] = None) -> Tuple[str, str]:
+        """
+        并发生成 AI 点评和专业深度分析
+        
+        两次请求相互独立，同时发出后总耗时取决于较慢的一次
+        
+        Args:
+            client: 复用的 AsyncClient（批量生成时共用），为空时临时创建
+        
+        Returns:
+            (点评, 专业分析)
+        """
+        comment, analysis, _ = await self._generate_both(stats, deep_analysis, client)
+        return comment, analysis
+    
+    async def _generate_both(self, stats: dict, deep_analysis: dict,
+                             client: Optional["httpx.AsyncClient"]) -> Tuple[str, str, bool]:
+        """
+        generate_both_async 的实现
+        
+        Returns:
+            (点评, 专业分析, 两者是否都由 AI 生成)；任一项是降级文本时最后一项为 False
+        """
+        api_key = self._get_api_key()
+        if not api_key:
+            return self._fallback_comment(stats, deep_analysis), self._fallback_analysis(deep_analysis), False
+        
+        try:
+            comment_prompt = self._build_comment_prompt(stats, deep_analysis)
+            analysis_prompt = self._build_analysis_prompt(stats, deep_analysis)
+        except Exception as e:
+            logger.error(f"AI 提示词生成失败: {e}")
+            return self._fallback_comment(stats, deep_analysis), self._fallback_analysis(deep_analysis), False
+        
+        
+        async with self._async_client(client) as client:
+            comment, analysis = await asyncio.gather(
+                self._call_api_async(client, comment_prompt, api_key, max_tokens=200),
+                self._call_api_async(client, analysis_prompt, api_key, max_tokens=1500)
+            )
+        
+        return (
+            comment if comment else self._fallback_comment(stats, deep_analysis),
+            analysis if analysis else self._fallback_analysis(deep_analysis),
+            bool(comment) and bool(analysis)
+        )
+    
+    def _build_comment_prompt(self, stats: dict, deep_analysis: dict) -> str:
+        """构建朋友式点评 Prompt"""
         recorded_h = stats['recorded_minutes'] // 60
-        categories = stats.get('categories', [])
+        recorded_m = stats['recorded_minutes'] % 60
+        
+        categories_str = "、".join([
+            f"{cat}({m//60}h{m%60}m)" 
+            for cat, m in stats['categories'][:5]
+        ]) if stats['categories'] else "无记录"
+        
+        # 格式化深度分析数据
         focus = deep_analysis.get('focus', {})
+        rhythm = deep_analysis.get('rhythm', {})
+        switching = deep_analysis.get('switching', {})
+        categories = deep_analysis.get('categories', {})
         day_type = deep_analysis.get('day_type', {})
         
-        parts = []
+        # 专注力数据
+        if focus.get('has_data'):
+            focus_data = f"""- 总共 {focus['total_sessions']} 段工作
+- 碎片(<15分钟): {focus['fragment_count']}段，占{focus['fragment_percent']}%
+- 深度工作(>60分钟): {focus['deep_count']}段，共{focus['deep_total_mins']}分钟
+- 最长一段: {focus['max_session']['duration']}分钟（{focus['max_session']['category']}，{focus['max_session']['time']}）
+- 平均每段: {focus['avg_duration']}分钟"""
+        else:
+            focus_data = "数据不足"
         
-        # 基于今日类型
-        dtype = day_type.get('type', '')
-        if dtype == '深度工作日':
-            parts.append(f"今天是个深度工作日，{focus.get('deep_count', 0)}段超过60分钟的专注时间")
-        elif dtype == '碎片化日':
-            parts.append(f"今天时间比较碎片化，{focus.get('fragment_percent', 0)}%是短时间片段")
-        elif dtype == '多任务切换日':
-            parts.append("今天切换了不少任务类型，上下文切换成本不小")
+        # 节奏数据
+        if rhythm.get('has_data'):
+            period_lines = [f"- {name}: 均分{data['avg_score']}，共{data['total_mins']}分钟" 
+                           for name, data in rhythm.get('periods', {}).items()]
+            rhythm_data = "\n".join(period_lines) if period_lines else "数据不足"
+            rhythm_data += f"\n- 效率最高时段: {rhythm['peak_hour']}点（{rhythm['peak_score']}分）"
+            rhythm_data += f"\n- 效率最低时段: {rhythm['low_hour']}点（{rhythm['low_score']}分）"
         else:
-            if score >= 70:
-                parts.append(f"今天{recorded_h}小时的工作，综合效率{score}分，节奏不错")
-            else:
-                top_cat = categories[0][0] if categories else "工作"
-                parts.append(f"今天主要在「{top_cat}」上花了时间")
+            rhythm_data = "数据不足"
+        
+        # 切换数据
+        if switching.get('has_data'):
+            switching_data = f"- 总切换次数: {switching['total_switches']}次"
+            if switching.get('common_patterns'):
+                patterns = [f"{p[0]}({p[1]}次)" for p in switching['common_patterns']]
+                switching_data += f"\n- 常见切换: {', '.join(patterns)}"
+        else:
+            switching_data = "切换较少或无数据"
+        
+        # 类别数据
+        if categories.get('has_data'):
+            cat_lines = []
+            for cat, data in categories.get('stats', {}).items():
+                cat_lines.append(f"- {cat}: 均分{data['avg_score']}，{data['session_count']}段共{data['total_mins']}分钟")
+            category_data = "\n".join(cat_lines[:5])
+            if categories.get('best') and categories.get('worst') and categories['best'] != categories['worst']:
+                category_data += f"\n- 效率最高: {categories['best']}，最低: {categories['worst']}"
+        else:
+            category_data = "数据不足"
+        
+        # 今日类型
+        day_type_str = f"{day_type.get('type', '常规日')}（{day_type.get('indicators', '')}）"
+        
+        return _render_template(self._COMMENT_PARTS, dict(
+            date=stats['date'],
+            recorded_time=f"{recorded_h}小时{recorded_m}分钟",
+            score=stats['score'],
+            categories=categories_str,
+            focus_data=focus_data,
+            rhythm_data=rhythm_data,
+            switching_data=switching_data,
+            category_data=category_data,
+            day_type=day_type_str
+        ))
+    
+    def _build_analysis_prompt(self, stats: dict, deep_analysis: dict) -> str:
+        """构建专业深度分析 Prompt"""
+        return _render_template(self._ANALYSIS_PARTS, self._analysis_prompt_values(stats, deep_analysis))
+    
+    def _analysis_prompt_values(self, stats: dict, deep_analysis: dict) -> dict:
+        """格式化专业分析（及合并请求）Prompt 中的数据字段"""
+        recorded_h = stats['recorded_minutes'] // 60
+        recorded_m = stats['recorded_minutes'] % 60
         
-        # 加一个数据亮点
+        categories_str = "、".join([
+            f"{cat}({m//60}h{m%60}m)" 
+            for cat, m in stats['categories'][:5]
+        ]) if stats['categories'] else "无记录"
+        
+        # 格式化深度分析数据
+        focus = deep_analysis.get('focus', {})
+        rhythm = deep_analysis.get('rhythm', {})
+        switching = deep_analysis.get('switching', {})
+        categories = deep_analysis.get('categories', {})
+        day_type = deep_analysis.get('day_type', {})
+        
+        # 专注力数据
+        if focus.get('has_data'):
+            focus_data = f"""- 工作段数量: {focus['total_sessions']}段
+- 碎片工作(<15min): {focus['fragment_count']}段，占比{focus['fragment_percent']}%
+- 深度工作(>60min): {focus['deep_count']}段，累计{focus['deep_total_mins']}分钟
+- 最长单次专注: {focus['max_session']['duration']}分钟（{focus['max_session']['category']}，{focus['max_session']['time']}开始）
+- 平均工作段时长: {focus['avg_duration']}分钟"""
+        else:
+            focus_data = "数据不足，无法分析"
+        
+        # 节奏数据
+        if rhythm.get('has_data'):
+            period_lines = [f"- {name}: 效率均分{data['avg_score']}分，工作{data['total_mins']}分钟，{data['session_count']}个工作段" 
+                           for name, data in rhythm.get('periods', {}).items()]
+            rhythm_data = "\n".join(period_lines) if period_lines else "数据不足"
+            rhythm_data += f"\n- 效率峰值: {rhythm['peak_hour']}:00（{rhythm['peak_score']}分）"
+            rhythm_data += f"\n- 效率低谷: {rhythm['low_hour']}:00（{rhythm['low_score']}分）"
+            rhythm_data += f"\n- 峰谷差值: {rhythm['peak_score'] - rhythm['low_score']}分"
+        else:
+            rhythm_data = "数据不足，无法分析"
+        
+        # 切换数据
+        if switching.get('has_data'):
+            switching_data = f"- 类别切换总次数: {switching['total_switches']}次"
+            if switching.get('common_patterns'):
+                patterns = [f"{p[0]}（{p[1]}次）" for p in switching['common_patterns']]
+                switching_data += f"\n- 高频切换模式: {', '.join(patterns)}"
+        else:
+            switching_data = "切换极少或无数据"
+        
+        # 类别数据
+        if categories.get('has_data'):
+            cat_lines = []
+            for cat, data in sorted(categories.get('stats', {}).items(), 
+                                    key=lambda x: x[1]['total_mins'], reverse=True):
+                variance_text = f"，波动±{data['score_variance']}" if data['score_variance'] > 0 else ""
+                cat_lines.append(f"- {cat}: 效率{data['avg_score']}分{variance_text}，{data['session_count']}段共{data['total_mins']}分钟")
+            category_data = "\n".join(cat_lines[:6])
+            if categories.get('best') and categories.get('worst') and categories['best'] != categories['worst']:
+                best_data = categories['stats'].get(categories['best'], {})
+                worst_data = categories['stats'].get(categories['worst'], {})
+                diff = best_data.get('avg_score', 0) - worst_data.get('avg_score', 0)
+                category_data += f"\n- 效率最高: {categories['best']}（{best_data.get('avg_score', 0)}分）"
+                category_data += f"\n- 效率最低: {categories['worst']}（{worst_data.get('avg_score', 0)}分）"
+                category_data += f"\n- 类别效率差: {diff}分"
+        else:
+            category_data = "数据不足，无法分析"
+        
+        # 今日类型
+        day_type_str = f"{day_type.get('type', '常规日')}（{day_type.get('indicators', '')}）"
+        
+        return dict(
+            date=stats['date'],
+            recorded_time=f"{recorded_h}小时{recorded_m}分钟",
+            score=stats['score'],
+            categories=categories_str,
+            focus_data=focus_data,
+            rhythm_data=rhythm_data,
+            switching_data=switching_data,
+            category_data=category_data,
+            day_type=day_type_str
+        )
+    
+    def _fallback_analysis(self, deep_analysis: dict) -> str:
+        """深度分析降级方案"""
+        focus = deep_analysis.get('focus', {})
+        rhythm = deep_analysis.get('rhythm', {})
+        switching = deep_analysis.get('switching', {})
+        day_type = deep_analysis.get('day_type', {})
+        
+        lines = ["### 行为模式"]
+        
+        dtype = day_type.get('type', '常规日')
+        lines.append(f"今日属于 **{dtype}**。{day_type.get('indicators', '')}")
+        
+        if focus.get('has_data'):
+            lines.append("")
+            lines.append("### 专注力表现")
+            if focus.get('deep_count', 0) > 0:
+                lines.append(f"- 完成了 {focus['deep_count']} 次深度工作（>60分钟），累计 {focus['deep_total_mins']} 分钟")
+            lines.append(f"- 最长专注 {focus.get('max_session', {}).get('duration', 0)} 分钟")
+            lines.append(f"- 碎片工作占比 {focus.get('fragment_percent', 0)}%")
+        
+        if rhythm.get('has_data'):
+            lines.append("")
+            lines.append("### 时段效率")
+            lines.append(f"- 效率峰值在 {rhythm.get('peak_hour', '')}:00（{rhythm.get('peak_score', 0)}分）")
+            lines.append(f"- 效率低谷在 {rhythm.get('low_hour', '')}:00（{rhythm.get('low_score', 0)}分）")
+        
+        if switching.get('has_data') and switching.get('total_switches', 0) > 0:
+            lines.append("")
+            lines.append("### 任务切换")
+            lines.append(f"- 今日切换 {switching['total_switches']} 次")
+        
+        return "\n".join(lines)
+    
+    def _request_kwargs(self, prompt: str, api_key: str, max_tokens: int) -> dict:
+        """构建 chat/completions 请求参数（orjson 可用时优先用它序列化请求体）"""
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": max_tokens  # 使用传入的参数
+        }
+        kwargs = {
+            "url": self._endpoint,
+            "headers": {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            # 长输出需要更长超时
+            "timeout": 30.0 if max_tokens > 500 else 15.0
+        }
+        if ORJSON_AVAILABLE:
+            kwargs["content"] = orjson.dumps(payload)
+        else:
+            kwargs["json"] = payload
+        return kwargs
+    
+    @staticmethod
+    def _extract_content(response: "httpx.Response") -> Optional[str]:
+        """从响应中提取回复文本"""
+        response.raise_for_status()
+        result = orjson.loads(response.content) if ORJSON_AVAILABLE else response.json()
+        content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+        return content.strip() if content else None
+    
+    def _retry_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """
+        计算重试前的等待时间
+        
+        只有限流（429）、服务端 5xx 和网络/超时错误值得重试；返回 None 表示不重试。
+        等待时间为带随机抖动的指数退避，服务端给出 Retry-After 时取两者较大值
+        """
+        import httpx
+        
+        if attempt >= self.API_MAX_ATTEMPTS - 1:
+            return None
+        
+        backoff = random.uniform(0, 0.5 * (2 ** attempt))
+        if isinstance(error, httpx.HTTPStatusError):
+            if error.response.status_code not in self.API_RETRY_STATUS:
+                return None
+            try:
+                backoff = max(float(error.response.headers.get("Retry-After", 0)), backoff)
+            except ValueError:
+                pass  # HTTP 日期格式的 Retry-After，按退避时间处理
+        elif not isinstance(error, httpx.TransportError):
+            return None
+        
+        return min(backoff, self.API_RETRY_MAX_DELAY)
+    
+    @staticmethod
+    def _log_api_error(error: Exception) -> None:
+        """记录 API 调用失败原因"""
+        import httpx
+        
+        if isinstance(error, httpx.HTTPStatusError):
+            logger.warning(f"API HTTP 错误: {error.response.status_code}")
+        elif isinstance(error, httpx.RequestError):
+            logger.warning(f"API 请求错误: {error}")
+        else:
+            logger.warning(f"API 调用失败: {type(error).__name__}: {error}")
+    
+    def _call_api_sync(self, prompt: str, api_key: str, max_tokens: int = 300) -> Optional[str]:
+        """同步调用 API（临时性错误按退避重试）"""
+        request_kwargs = self._request_kwargs(prompt, api_key, max_tokens)
+        
+        for attempt in range(self.API_MAX_ATTEMPTS):
+            try:
+                response = _get_http_client().post(**request_kwargs)
+                return self._extract_content(response)
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    self._log_api_error(e)
+                    return None
+                logger.info(f"API 请求失败（{type(e).__name__}），{delay:.1f} 秒后重试 ({attempt + 1}/{self.API_MAX_ATTEMPTS})")
+                time.sleep(delay)
+        return None
+    
+    async def _call_api_async(self, client: "httpx.AsyncClient", prompt: str,
+                              api_key: str, max_tokens: int = 300) -> Optional[str]:
+        """异步调用 API（临时性错误按退避重试）"""
+        
+        request_kwargs = self._request_kwargs(prompt, api_key, max_tokens)
+        
+        for attempt in range(self.API_MAX_ATTEMPTS):
+            try:
+                response = await client.post(**request_kwargs)
+                return self._extract_content(response)
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    self._log_api_error(e)
+                    return None
+                logger.info(f"API 请求失败（{type(e).__name__}），{delay:.1f} 秒后重试 ({attempt + 1}/{self.API_MAX_ATTEMPTS})")
+                await asyncio.sleep(delay)
+        return None
+    
+    # 降级点评：今日类型 -> 开头句式
+    _FALLBACK_DAY_TYPE_OPENERS = {
+        '深度工作日': "今天是个深度工作日，{deep_count}段超过60分钟的专注时间",
+        '碎片化日': "今天时间比较碎片化，{fragment_percent}%是短时间片段",
+        '多任务切换日': "今天切换了不少任务类型，上下文切换成本不小",
+    }
+    
+    def _fallback_comment(self, stats: dict, deep_analysis: dict) -> str:
+        """降级方案：基于深度分析数据生成点评"""
+        focus = deep_analysis.get('focus', {})
+        day_type = deep_analysis.get('day_type', {}).get('type', '')
+        
+        # 只取点评实际用到的字段作为缓存键：开头句式由今日类型决定时，分数和分类不影响结果
+        if day_type in self._FALLBACK_DAY_TYPE_OPENERS:
+            opener_key = (focus.get('deep_count', 0), focus.get('fragment_percent', 0))
+        elif stats['score'] >= 70:
+            opener_key = (stats['recorded_minutes'] // 60, stats['score'])
+        else:
+            categories = stats.get('categories', [])
+            opener_key = (categories[0][0] if categories else "工作",)
+        
+        highlight = None
         if focus.get('has_data') and focus.get('max_session'):
             ms = focus['max_session']
-            parts.append(f"最长的一段是{ms['duration']}分钟的{ms['category']}（{ms['time']}开始）")
+            highlight = (ms['duration'], ms['category'], ms['time'])
+        
+        return self._fallback_for(day_type, opener_key, highlight)
+    
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def _fallback_for(day_type: str, opener_key: tuple, highlight: Optional[tuple]) -> str:
+        """根据归一化后的数据拼接降级点评（结果缓存，同一天多次降级时直接复用）"""
+        opener = AICommentGenerator._FALLBACK_DAY_TYPE_OPENERS.get(day_type)
+        if opener is not None:
+            deep_count, fragment_percent = opener_key
+            parts = [opener.format(deep_count=deep_count, fragment_percent=fragment_percent)]
+        elif len(opener_key) == 2:
+            recorded_h, score = opener_key
+            parts = [f"今天{recorded_h}小时的工作，综合效率{score}分，节奏不错"]
+        else:
+            parts = [f"今天主要在「{opener_key[0]}」上花了时间"]
+        
+        # 加一个数据亮点
+        if highlight is not None:
+            duration, category, start = highlight
+            parts.append(f"最长的一段是{duration}分钟的{category}（{start}开始）")
         
         return "。".join(parts) + " ✨"
 
 
+# 报告 HTML 模板（str.format 风格，导入时用 _compile_template 拆分一次，生成报告时只拼接动态字段）
+_REPORT_TEMPLATE = _compile_template("""
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+</head>
+<body style="margin: 0; padding: 0; background-color: #F3F4F6; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Microsoft YaHei', sans-serif;">
+    <div style="max-width: 640px; margin: 0 auto; padding: 20px;">
+        <!-- 头部 -->
+        <div style="background: linear-gradient(135deg, #4F46E5 0%, #7C3AED 100%); border-radius: 16px 16px 0 0; padding: 24px; text-align: center;">
+            <h1 style="margin: 0; color: white; font-size: 22px; font-weight: 600;">📊 Dayflow 深度分析报告</h1>
+            <p style="margin: 8px 0 0 0; color: rgba(255,255,255,0.9); font-size: 14px;">{date_str}</p>
+            <div style="margin-top: 12px; display: inline-block; background: rgba(255,255,255,0.2); padding: 6px 16px; border-radius: 20px;">
+                <span style="color: white; font-size: 13px;">{day_type}</span>
+            </div>
+        </div>
+        
+        <!-- 主体 -->
+        <div style="background-color: white; padding: 24px; border-radius: 0 0 16px 16px; box-shadow: 0 4px 6px rgba(0,0,0,0.05);">
+            
+            <!-- 总览卡片 -->
+            <div style="display: flex; gap: 12px; margin-bottom: 20px;">
+                <div style="flex: 1; background-color: #F0F9FF; border-radius: 10px; padding: 14px; text-align: center;">
+                    <div style="font-size: 24px; font-weight: 700; color: #0369A1;">{hours}h {mins}m</div>
+                    <div style="color: #6B7280; font-size: 12px; margin-top: 2px;">记录时长</div>
+                </div>
+                <div style="flex: 1; background-color: #F0FDF4; border-radius: 10px; padding: 14px; text-align: center;">
+                    <div style="font-size: 24px; font-weight: 700; color: {score_color};">{score_emoji} {score}</div>
+                    <div style="color: #6B7280; font-size: 12px; margin-top: 2px;">{score_text}</div>
+                </div>
+                <div style="flex: 1; background-color: #FEF3C7; border-radius: 10px; padding: 14px; text-align: center;">
+                    <div style="font-size: 24px; font-weight: 700; color: #D97706;">{deep_count}</div>
+                    <div style="color: #6B7280; font-size: 12px; margin-top: 2px;">深度工作</div>
+                </div>
+            </div>
+            
+            <!-- 时间分布 -->
+            <div style="margin-bottom: 20px;">
+                <h2 style="font-size: 15px; font-weight: 600; color: #111827; margin: 0 0 12px 0;">
+                    📈 时间分布
+                </h2>
+                {stats_html}
+            </div>
+            
+            <!-- 分隔线 -->
+            <div style="border-top: 1px solid #E5E7EB; margin: 20px 0;"></div>
+            
+            <!-- 深度分析 -->
+            <div style="margin-bottom: 20px;">
+                <h2 style="font-size: 15px; font-weight: 600; color: #111827; margin: 0 0 16px 0;">
+                    🔍 深度分析
+                </h2>
+                {deep_html}
+            </div>
+            
+            <!-- 分隔线 -->
+            <div style="border-top: 1px solid #E5E7EB; margin: 20px 0;"></div>
+            
+            <!-- AI 点评 -->
+            <div style="background: linear-gradient(135deg, #EDE9FE 0%, #DDD6FE 100%); border-radius: 12px; padding: 16px;">
+                <h2 style="font-size: 15px; font-weight: 600; color: #5B21B6; margin: 0 0 10px 0;">
+                    💬 今日洞察
+                </h2>
+                <p style="margin: 0; color: #4C1D95; font-size: 14px; line-height: 1.8;">
+                    {ai_comment}
+                </p>
+            </div>
+            
+            {expert_html}
+        </div>
+        
+        <!-- 页脚 -->
+        <div style="text-align: center; padding: 16px; color: #9CA3AF; font-size: 11px;">
+            由 Dayflow 自动生成 · {footer_time}
+        </div>
+    </div>
+</body>
+</html>""")
+
+# 当天没有任何记录时使用的精简报告（不做深度分析，也不调用 AI）
+_EMPTY_REPORT_TEMPLATE = _compile_template("""
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+</head>
+<body style="margin: 0; padding: 0; background-color: #F3F4F6; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Microsoft YaHei', sans-serif;">
+    <div style="max-width: 640px; margin: 0 auto; padding: 20px;">
+        <!-- 头部 -->
+        <div style="background: linear-gradient(135deg, #4F46E5 0%, #7C3AED 100%); border-radius: 16px 16px 0 0; padding: 24px; text-align: center;">
+            <h1 style="margin: 0; color: white; font-size: 22px; font-weight: 600;">📊 Dayflow 深度分析报告</h1>
+            <p style="margin: 8px 0 0 0; color: rgba(255,255,255,0.9); font-size: 14px;">{date_str}</p>
+        </div>
+        
+        <!-- 主体 -->
+        <div style="background-color: white; padding: 32px 24px; border-radius: 0 0 16px 16px; box-shadow: 0 4px 6px rgba(0,0,0,0.05); text-align: center;">
+            <div style="font-size: 32px;">📭</div>
+            <p style="margin: 12px 0 0 0; color: #374151; font-size: 15px; font-weight: 500;">今天还没有活动记录</p>
+            <p style="margin: 6px 0 0 0; color: #9CA3AF; font-size: 13px;">开始录制后，这里会显示时间分布和深度分析</p>
+        </div>
+        
+        <!-- 页脚 -->
+        <div style="text-align: center; padding: 16px; color: #9CA3AF; font-size: 11px;">
+            由 Dayflow 自动生成 · {footer_time}
+        </div>
+    </div>
+</body>
+</html>""")
+
+# 循环渲染的行模板预先压缩空白
+_STATS_ROW_TEMPLATE = _compile_template(_minify_html("""
+            <div style="margin-bottom: 10px;">
+                <div style="display: flex; justify-content: space-between; margin-bottom: 3px;">
+                    <span style="font-weight: 500; color: #374151; font-size: 13px;">{category}</span>
+                    <span style="color: #6B7280; font-size: 12px;">{h}h {m}m ({percent}%)</span>
+                </div>
+                <div style="background-color: #E5E7EB; border-radius: 4px; height: 6px; overflow: hidden;">
+                    <div style="background-color: {color}; width: {bar_width}%; height: 100%;"></div>
+                </div>
+            </div>"""))
+
+_FOCUS_CARD_TEMPLATE = _compile_template("""
+            <div style="background: #F8FAFC; border-radius: 10px; padding: 14px; margin-bottom: 12px;">
+                <div style="font-weight: 600; color: #334155; font-size: 13px; margin-bottom: 10px;">🎯 专注力数据</div>
+                <div style="display: flex; gap: 8px; flex-wrap: wrap;">
+                    <div style="background: white; border: 1px solid #E2E8F0; border-radius: 6px; padding: 8px 12px; flex: 1; min-width: 120px;">
+                        <div style="font-size: 18px; font-weight: 600; color: #0F172A;">{max_duration}分钟</div>
+                        <div style="font-size: 11px; color: #64748B;">最长专注</div>
+                    </div>
+                    <div style="background: white; border: 1px solid #E2E8F0; border-radius: 6px; padding: 8px 12px; flex: 1; min-width: 120px;">
+                        <div style="font-size: 18px; font-weight: 600; color: #0F172A;">{deep_total_mins}分钟</div>
+                        <div style="font-size: 11px; color: #64748B;">深度工作(>60min)</div>
+                    </div>
+                    <div style="background: white; border: 1px solid #E2E8F0; border-radius: 6px; padding: 8px 12px; flex: 1; min-width: 120px;">
+                        <div style="font-size: 18px; font-weight: 600; color: {fragment_color};">{fragment_percent}%</div>
+                        <div style="font-size: 11px; color: #64748B;">碎片占比(<15min)</div>
+                    </div>
+                </div>
+                <div style="margin-top: 10px; font-size: 12px; color: #64748B;">
+                    共 {total_sessions} 段工作 · 平均每段 {avg_duration} 分钟
+                    {max_detail}
+                </div>
+            </div>""")
+
+_RHYTHM_BAR_TEMPLATE = _compile_template(_minify_html("""
+                <div style="margin-bottom: 8px;">
+                    <div style="display: flex; justify-content: space-between; margin-bottom: 2px;">
+                        <span style="font-size: 12px; color: #374151;">{label} {peak_mark}</span>
+                        <span style="font-size: 12px; color: #6B7280;">{score}分 · {total_mins}分钟</span>
+                    </div>
+                    <div style="background: #E5E7EB; border-radius: 3px; height: 8px;">
+                        <div style="background: {bar_color}; width: {bar_width}%; height: 100%; border-radius: 3px;"></div>
+                    </div>
+                </div>"""))
+
+_RHYTHM_CARD_TEMPLATE = _compile_template("""
+            <div style="background: #F8FAFC; border-radius: 10px; padding: 14px; margin-bottom: 12px;">
+                <div style="font-weight: 600; color: #334155; font-size: 13px; margin-bottom: 10px;">⏰ 时段效率</div>
+                {rhythm_bars}
+                <div style="margin-top: 8px; font-size: 12px; color: #64748B;">
+                    效率峰值: {peak_hour}:00 ({peak_score}分) · 
+                    低谷: {low_hour}:00 ({low_score}分)
+                </div>
+            </div>""")
+
+_SWITCH_CARD_TEMPLATE = _compile_template("""
+            <div style="background: #F8FAFC; border-radius: 10px; padding: 14px; margin-bottom: 12px;">
+                <div style="font-weight: 600; color: #334155; font-size: 13px; margin-bottom: 10px;">🔄 任务切换</div>
+                <div style="display: flex; align-items: center; gap: 12px;">
+                    <div style="background: {switch_color}; color: white; font-size: 20px; font-weight: 700; padding: 12px 20px; border-radius: 8px;">
+                        {switch_count}
+                    </div>
+                    <div>
+                        <div style="font-size: 14px; font-weight: 500; color: #0F172A;">{switch_text}</div>
+                        <div style="font-size: 12px; color: #64748B;">今日类别切换次数</div>
+                    </div>
+                </div>
+                {pattern_html}
+            </div>""")
+
+_CATEGORY_CARD_TEMPLATE = _compile_template("""
+                <div style="background: #F8FAFC; border-radius: 10px; padding: 14px;">
+                    <div style="font-weight: 600; color: #334155; font-size: 13px; margin-bottom: 10px;">📊 类别效率对比</div>
+                    <div style="display: flex; gap: 10px;">
+                        <div style="flex: 1; background: #DCFCE7; border-radius: 8px; padding: 10px; text-align: center;">
+                            <div style="font-size: 11px; color: #166534;">效率最高</div>
+                            <div style="font-size: 15px; font-weight: 600; color: #15803D; margin: 4px 0;">{best}</div>
+                            <div style="font-size: 18px; font-weight: 700; color: #166534;">{best_score}分</div>
+                            <div style="font-size: 11px; color: #166534;">{best_sessions}段 · {best_mins}分钟</div>
+                        </div>
+                        <div style="flex: 1; background: #FEF3C7; border-radius: 8px; padding: 10px; text-align: center;">
+                            <div style="font-size: 11px; color: #92400E;">效率较低</div>
+                            <div style="font-size: 15px; font-weight: 600; color: #B45309; margin: 4px 0;">{worst}</div>
+                            <div style="font-size: 18px; font-weight: 700; color: #92400E;">{worst_score}分</div>
+                            <div style="font-size: 11px; color: #92400E;">{worst_sessions}段 · {worst_mins}分钟</div>
+                        </div>
+                    </div>
+                </div>""")
+
+_EXPERT_ANALYSIS_TEMPLATE = _compile_template("""
+            <!-- 分隔线 -->
+            <div style="border-top: 1px solid #E5E7EB; margin: 24px 0;"></div>
+            
+            <!-- 专业深度分析报告 -->
+            <div style="background: linear-gradient(135deg, #E0F2FE 0%, #BAE6FD 100%); border-radius: 12px; padding: 20px; margin-top: 16px;">
+                <h2 style="font-size: 16px; font-weight: 600; color: #0C4A6E; margin: 0 0 16px 0; display: flex; align-items: center;">
+                    📋 专业分析报告
+                </h2>
+                <div style="background: white; border-radius: 8px; padding: 16px; color: #334155; font-size: 13px; line-height: 1.7;">
+                    {html_content}
+                </div>
+            </div>""")
+
+# 专业分析报告的 Markdown 转换（逐行处理，只有行内粗体需要正则）
+_RE_MD_BOLD = re.compile(r'\*\*(.+?)\*\*')
+_MD_H3_HTML = '<h4 style="font-size: 14px; font-weight: 600; color: #1E3A5F; margin: 16px 0 8px 0;">{}</h4>'
+_MD_H2_HTML = '<h3 style="font-size: 15px; font-weight: 600; color: #1E3A5F; margin: 16px 0 10px 0;">{}</h3>'
+_MD_LIST_ITEM_HTML = '<div style="margin: 4px 0; padding-left: 12px;">• {}</div>'
+_MD_PARAGRAPH_HTML = '<p style="margin: 8px 0; color: #334155; font-size: 13px; line-height: 1.7;">{}</p>'
+
+_EMPTY_SECTION_HTML = '<div style="color: #9CA3AF; text-align: center; padding: 20px;">暂无数据</div>'
+
+# 类别颜色
+_CATEGORY_COLORS = {
+    "工作": "#4F46E5", "Work": "#4F46E5",
+    "学习": "#059669", "Study": "#059669",
+    "编程": "#6366F1", "Programming": "#6366F1",
+    "娱乐": "#DC2626", "Entertainment": "#DC2626",
+    "休息": "#F59E0B", "Rest": "#F59E0B",
+    "社交": "#EC4899", "Social": "#EC4899",
+    "其他": "#78716C", "Other": "#78716C",
+}
+
+# 效率评价档位: (最低分, emoji, 评语, 颜色)，按分数从高到低排列
+_SCORE_TIERS = (
+    (80, "🌟", "非常高效", "#059669"),
+    (60, "👍", "表现不错", "#4F46E5"),
+    (40, "💪", "稳步前进", "#F59E0B"),
+    (0, "🎯", "明天更好", "#6B7280"),
+)
+
+# 节奏时段标签 → 时段编号（与峰值小时所在时段比较）
+_PERIOD_BAND = {'上午': 0, '下午': 1, '晚上': 2}
+
+
 class ReportGenerator:
     """报告生成器"""
     
     def __init__(self, storage):
         self.storage = storage
         self.ai_generator = AICommentGenerator(storage)
+        # 最近生成的日报: 日期 -> (卡片指纹, (统计数据, 点评, 专业分析))，卡片没有变化时重复发送（测试邮件等）只重新渲染
+        self._report_cache: dict = {}
+    
+    def generate_daily_report(self, date: datetime = None, generated_at: Optional[datetime] = None) -> str:
+        """生成每日报告 HTML（generate_daily_report_async 的同步入口，不能在已运行事件循环的线程中调用）"""
+        return asyncio.run(self.generate_daily_report_async(date, generated_at=generated_at))
     
-    def generate_daily_report(self, date: datetime = None) -> str:
-        """生成每日报告 HTML"""
+    async def generate_daily_report_async(self, date: datetime = None,
+                                          client: Optional["httpx.AsyncClient"] = None,
+                                          generated_at: Optional[datetime] = None) -> str:
+        """
+        生成每日报告 HTML
+        
+        数据库查询和深度分析在线程中执行，AI 请求走 AsyncClient，可与其他异步任务（如周报）并发
+        
+        Args:
+            date: 报告日期，默认今天
+            client: 复用的 AsyncClient，为空时临时创建
+            generated_at: 页脚显示的生成时间，调用方已取过当前时间时直接传入，默认生成时取
+        """
         if date is None:
             date = datetime.now()
         
-        # 获取当天数据
-        cards = self.storage.get_cards_for_date(date)
+        cards = await asyncio.to_thread(self.storage.get_cards_for_date, date)
+        
+        # 卡片和 API Key 状态都没有变化时复用已生成的统计和 AI 文本，只重新渲染（页脚时间随之更新）
+        fingerprint = self._cards_fingerprint(cards, bool(self.ai_generator._get_api_key()))
+        cached = self._cached_report(date, fingerprint)
+        if cached is not None:
+            report, ai_comment, expert_analysis = cached
+            return self._render_report(date, report, ai_comment, expert_analysis, generated_at)
+        
+        report = await asyncio.to_thread(self._prepare_report, date, cards)
+        if report is None:
+            return self._build_empty_html(date, generated_at)
+        
+        # AI 点评（朋友式）和专业深度分析报告用一次请求生成（失败时自动回退为两次并发请求）
+        try:
+            ai_comment, expert_analysis, from_ai = await self.ai_generator._generate_combined(
+                report['ai_stats'], report['deep_analysis'], client
+            )
+        except Exception as e:
+            logger.warning(f"AI 内容生成失败: {e}")
+            ai_comment, expert_analysis, from_ai = "今天的数据已记录完成 ✨", "", False
+        
+        # 降级文本不缓存：配置 API Key 或网络恢复后下一次发送即可拿到 AI 内容
+        if from_ai:
+            self._store_report(date, fingerprint, (report, ai_comment, expert_analysis))
+        return self._render_report(date, report, ai_comment, expert_analysis, generated_at)
+    
+    def _cached_report(self, date: datetime, fingerprint: tuple) -> Optional[tuple]:
+        """卡片没有变化时返回已生成日报的 (统计数据, 点评, 专业分析)"""
+        day = date.date()
+        cached = self._report_cache.get(day)
+        if cached is not None and cached[0] == fingerprint:
+            logger.debug(f"复用已生成的日报: {day}")
+            return cached[1]
+        return None
+    
+    def _store_report(self, date: datetime, fingerprint: tuple, content: tuple) -> None:
+        """缓存日报的统计数据和 AI 文本（只保留当天的）"""
+        self._report_cache = {date.date(): (fingerprint, content)}
+    
+    @staticmethod
+    def _cards_fingerprint(cards: list, has_api_key: bool) -> tuple:
+        """卡片完整内容和 API Key 是否配置的指纹，用于判断日报是否需要重新生成"""
+        return has_api_key, tuple(
+            (card.id, card.start_time, card.end_time, card.title, card.summary,
+             card.category, card.productivity_score, card.app_sites, card.distractions)
+            for card in cards
+        )
+    
+    async def generate_reports_batch(self, dates: List[datetime],
+                                     max_concurrency: int = 4) -> List[Tuple[datetime, str]]:
+        """
+        批量生成多天的报告（用于补发历史报告）
+        
+        所有日期的卡片通过一次查询取出；各天的 AI 请求共用一个 HTTP 客户端并发进行，
+        最多 max_concurrency 天同时请求。生成的报告交给同一个 EmailService 依次发送即可复用其 SMTP 连接。
+        
+        Returns:
+            [(日期, 报告 HTML)]，顺序与 dates 一致
+        """
+        if not dates:
+            return []
+        
+        import httpx
+        
+        cards = await asyncio.to_thread(self.storage.get_cards_for_date_range, min(dates), max(dates))
+        cards_by_day = defaultdict(list)
+        for card in cards:
+            cards_by_day[card.start_time.date()].append(card)
+        
+        semaphore = asyncio.Semaphore(max_concurrency)
+        generated_at = datetime.now()  # 同一批报告使用同一个生成时间
+        
+        async def build(date: datetime, client: "httpx.AsyncClient") -> Tuple[datetime, str]:
+            # 深度分析放到线程中计算，与其他日期正在进行的 AI 请求重叠，不阻塞事件循环
+            report = await asyncio.to_thread(self._prepare_report, date, cards_by_day.get(date.date(), []))
+            if report is None:
+                return date, self._build_empty_html(date, generated_at)
+            async with semaphore:
+                ai_comment, expert_analysis = await self.ai_generator.generate_combined_async(
+                    report['ai_stats'], report['deep_analysis'], client=client
+                )
+            return date, self._render_report(date, report, ai_comment, expert_analysis, generated_at)
+        
+        async with httpx.AsyncClient(http2=HTTP2_AVAILABLE, timeout=httpx.Timeout(15.0)) as client:
+            return list(await asyncio.gather(*(build(d, client) for d in dates)))
+    
+    def _prepare_report(self, date: datetime, cards: list) -> Optional[dict]:
+        """
+        统计卡片数据并做深度分析，得到生成报告所需的全部数据
         
-        # 统计各类别时间
-        category_stats = {}
+        Returns:
+            报告数据；当天没有任何记录时返回 None（调用方直接生成空报告，跳过深度分析和 AI）
+        """
+        # 一次遍历统计各类别时间和效率评分
+        category_stats = Counter()
         total_minutes = 0
+        total_score = 0
+        score_count = 0
         
         for card in cards:
-            category = card.category or "其他"
             minutes = card.duration_minutes
-            category_stats[category] = category_stats.get(category, 0) + minutes
+            category_stats[card.category or "其他"] += minutes
             total_minutes += minutes
+            score = card.productivity_score
+            if score > 0:
+                total_score += score
+                score_count += 1
         
-        # 排序
-        sorted_stats = sorted(category_stats.items(), key=lambda x: x[1], reverse=True)
+        if total_minutes == 0 or not category_stats:
+            return None
         
-        # 计算效率评分
-        total_score = 0
-        score_count = 0
-        for card in cards:
-            if card.productivity_score > 0:
-                total_score += card.productivity_score
-                score_count += 1
+        # 按时长降序（同时长保持出现顺序）
+        sorted_stats = category_stats.most_common()
         avg_score = int(total_score / score_count) if score_count > 0 else 0
         
         # 深度分析
@@ -841,70 +1843,56 @@ class ReportGenerator:
             'categories': [(cat, int(mins)) for cat, mins in sorted_stats]
         }
         
-        # 生成 AI 点评（朋友式）
-        try:
-            ai_comment = self.ai_generator.generate_comment(ai_stats, deep_analysis)
-        except Exception as e:
-            logger.warning(f"AI 点评生成失败: {e}")
-            ai_comment = "今天的数据已记录完成 ✨"
-        
-        # 生成专业深度分析报告
-        try:
-            expert_analysis = self.ai_generator.generate_deep_analysis(ai_stats, deep_analysis)
-        except Exception as e:
-            logger.warning(f"专业分析生成失败: {e}")
-            expert_analysis = ""
-        
-        # 生成 HTML（包含深度分析）
-        return self._build_html(date, sorted_stats, total_minutes, avg_score, deep_analysis, ai_comment, expert_analysis)
+        return {
+            'stats': sorted_stats,
+            'total_minutes': total_minutes,
+            'score': avg_score,
+            'deep_analysis': deep_analysis,
+            'ai_stats': ai_stats
+        }
+    
+    def _render_report(self, date: datetime, report: dict, ai_comment: str, expert_analysis: str,
+                       generated_at: Optional[datetime] = None) -> str:
+        """根据统计数据和 AI 文本生成报告 HTML"""
+        return self._build_html(date, report['stats'], report['total_minutes'], report['score'],
+                                report['deep_analysis'], ai_comment, expert_analysis, generated_at)
+    
+    def _build_empty_html(self, date: datetime, generated_at: Optional[datetime] = None) -> str:
+        """构建无数据时的精简报告 HTML"""
+        return _render_template(_EMPTY_REPORT_TEMPLATE, dict(
+            date_str=date.strftime("%Y年%m月%d日"),
+            footer_time=(generated_at or datetime.now()).strftime("%H:%M")
+        ))
     
     def _build_html(self, date: datetime, stats: list, 
                     total_minutes: int, score: int, deep_analysis: dict, 
-                    ai_comment: str, expert_analysis: str = "") -> str:
+                    ai_comment: str, expert_analysis: str = "",
+                    generated_at: Optional[datetime] = None) -> str:
         """构建 HTML 邮件内容（含深度分析和专业报告）"""
         date_str = date.strftime("%Y年%m月%d日")
-        hours = int(total_minutes // 60)
-        mins = int(total_minutes % 60)
-        
-        # 类别颜色
-        category_colors = {
-            "工作": "#4F46E5", "Work": "#4F46E5",
-            "学习": "#059669", "Study": "#059669",
-            "编程": "#6366F1", "Programming": "#6366F1",
-            "娱乐": "#DC2626", "Entertainment": "#DC2626",
-            "休息": "#F59E0B", "Rest": "#F59E0B",
-            "社交": "#EC4899", "Social": "#EC4899",
-            "其他": "#78716C", "Other": "#78716C",
-        }
+        footer_time = (generated_at or datetime.now()).strftime("%H:%M")
+        # 卡片时长是浮点分钟数，先取整再 divmod（分钟数非负，结果与分别取整相同）
+        hours, mins = divmod(int(total_minutes), 60)
         
         # 构建时间分布条
-        stats_html = ""
+        stats_parts = []
+        inv_total = 100.0 / total_minutes if total_minutes > 0 else 0.0
         for category, minutes in stats[:6]:  # 最多显示6个
-            color = category_colors.get(category, "#78716C")
-            percent = (minutes / total_minutes * 100) if total_minutes > 0 else 0
-            h, m = int(minutes // 60), int(minutes % 60)
-            bar_width = min(percent, 100)
+            color = _CATEGORY_COLORS.get(category, "#78716C")
+            percent = minutes * inv_total
+            h, m = divmod(int(minutes), 60)
+            bar_width = percent if percent < 100 else 100
             
-            stats_html += f"""
-            <div style="margin-bottom: 10px;">
-                <div style="display: flex; justify-content: space-between; margin-bottom: 3px;">
-                    <span style="font-weight: 500; color: #374151; font-size: 13px;">{category}</span>
-                    <span style="color: #6B7280; font-size: 12px;">{h}h {m}m ({percent:.0f}%)</span>
-                </div>
-                <div style="background-color: #E5E7EB; border-radius: 4px; height: 6px; overflow: hidden;">
-                    <div style="background-color: {color}; width: {bar_width}%; height: 100%;"></div>
-                </div>
-            </div>"""
-        
-        # 效率评价
-        if score >= 80:
-            score_emoji, score_text, score_color = "🌟", "非常高效", "#059669"
-        elif score >= 60:
-            score_emoji, score_text, score_color = "👍", "表现不错", "#4F46E5"
-        elif score >= 40:
-            score_emoji, score_text, score_color = "💪", "稳步前进", "#F59E0B"
-        else:
-            score_emoji, score_text, score_color = "🎯", "明天更好", "#6B7280"
+            stats_parts.append(_render_template(_STATS_ROW_TEMPLATE, dict(
+                category=category, h=h, m=m, percent=f"{percent:.0f}",
+                color=color, bar_width=bar_width
+            )))
+        
+        # 效率评价（低于所有档位时取最低档）
+        score_emoji, score_text, score_color = next(
+            ((emoji, text, color) for threshold, emoji, text, color in _SCORE_TIERS if score >= threshold),
+            _SCORE_TIERS[-1][1:]
+        )
         
         # 提取深度分析数据
         focus = deep_analysis.get('focus', {})
@@ -917,87 +1905,22 @@ class ReportGenerator:
         deep_html = self._build_deep_analysis_html(focus, rhythm, switching, categories, day_type)
         
         # 完整 HTML
-        html = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-</head>
-<body style="margin: 0; padding: 0; background-color: #F3F4F6; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Microsoft YaHei', sans-serif;">
-    <div style="max-width: 640px; margin: 0 auto; padding: 20px;">
-        <!-- 头部 -->
-        <div style="background: linear-gradient(135deg, #4F46E5 0%, #7C3AED 100%); border-radius: 16px 16px 0 0; padding: 24px; text-align: center;">
-            <h1 style="margin: 0; color: white; font-size: 22px; font-weight: 600;">📊 Dayflow 深度分析报告</h1>
-            <p style="margin: 8px 0 0 0; color: rgba(255,255,255,0.9); font-size: 14px;">{date_str}</p>
-            <div style="margin-top: 12px; display: inline-block; background: rgba(255,255,255,0.2); padding: 6px 16px; border-radius: 20px;">
-                <span style="color: white; font-size: 13px;">{day_type.get('type', '常规日')}</span>
-            </div>
-        </div>
-        
-        <!-- 主体 -->
-        <div style="background-color: white; padding: 24px; border-radius: 0 0 16px 16px; box-shadow: 0 4px 6px rgba(0,0,0,0.05);">
-            
-            <!-- 总览卡片 -->
-            <div style="display: flex; gap: 12px; margin-bottom: 20px;">
-                <div style="flex: 1; background-color: #F0F9FF; border-radius: 10px; padding: 14px; text-align: center;">
-                    <div style="font-size: 24px; font-weight: 700; color: #0369A1;">{hours}h {mins}m</div>
-                    <div style="color: #6B7280; font-size: 12px; margin-top: 2px;">记录时长</div>
-                </div>
-                <div style="flex: 1; background-color: #F0FDF4; border-radius: 10px; padding: 14px; text-align: center;">
-                    <div style="font-size: 24px; font-weight: 700; color: {score_color};">{score_emoji} {score}</div>
-                    <div style="color: #6B7280; font-size: 12px; margin-top: 2px;">{score_text}</div>
-                </div>
-                <div style="flex: 1; background-color: #FEF3C7; border-radius: 10px; padding: 14px; text-align: center;">
-                    <div style="font-size: 24px; font-weight: 700; color: #D97706;">{focus.get('deep_count', 0)}</div>
-                    <div style="color: #6B7280; font-size: 12px; margin-top: 2px;">深度工作</div>
-                </div>
-            </div>
-            
-            <!-- 时间分布 -->
-            <div style="margin-bottom: 20px;">
-                <h2 style="font-size: 15px; font-weight: 600; color: #111827; margin: 0 0 12px 0;">
-                    📈 时间分布
-                </h2>
-                {stats_html if stats_html else '<div style="color: #9CA3AF; text-align: center; padding: 20px;">暂无数据</div>'}
-            </div>
-            
-            <!-- 分隔线 -->
-            <div style="border-top: 1px solid #E5E7EB; margin: 20px 0;"></div>
-            
-            <!-- 深度分析 -->
-            <div style="margin-bottom: 20px;">
-                <h2 style="font-size: 15px; font-weight: 600; color: #111827; margin: 0 0 16px 0;">
-                    🔍 深度分析
-                </h2>
-                {deep_html}
-            </div>
-            
-            <!-- 分隔线 -->
-            <div style="border-top: 1px solid #E5E7EB; margin: 20px 0;"></div>
-            
-            <!-- AI 点评 -->
-            <div style="background: linear-gradient(135deg, #EDE9FE 0%, #DDD6FE 100%); border-radius: 12px; padding: 16px;">
-                <h2 style="font-size: 15px; font-weight: 600; color: #5B21B6; margin: 0 0 10px 0;">
-                    💬 今日洞察
-                </h2>
-                <p style="margin: 0; color: #4C1D95; font-size: 14px; line-height: 1.8;">
-                    {ai_comment}
-                </p>
-            </div>
-            
-            {self._build_expert_analysis_html(expert_analysis) if expert_analysis else ''}
-        </div>
-        
-        <!-- 页脚 -->
-        <div style="text-align: center; padding: 16px; color: #9CA3AF; font-size: 11px;">
-            由 Dayflow 自动生成 · {datetime.now().strftime("%H:%M")}
-        </div>
-    </div>
-</body>
-</html>"""
-        
-        return html
+        return _render_template(_REPORT_TEMPLATE, dict(
+            date_str=date_str,
+            day_type=day_type.get('type', '常规日'),
+            hours=hours,
+            mins=mins,
+            score_color=score_color,
+            score_emoji=score_emoji,
+            score=score,
+            score_text=score_text,
+            deep_count=focus.get('deep_count', 0),
+            stats_html="".join(stats_parts) if stats_parts else _EMPTY_SECTION_HTML,
+            deep_html=deep_html,
+            ai_comment=ai_comment,
+            expert_html=self._build_expert_analysis_html(expert_analysis) if expert_analysis else '',
+            footer_time=footer_time
+        ))
     
     def _build_deep_analysis_html(self, focus: dict, rhythm: dict, 
                                    switching: dict, categories: dict, day_type: dict) -> str:
@@ -1006,94 +1929,71 @@ class ReportGenerator:
         
         # 1. 专注力分析
         if focus.get('has_data'):
-            max_s = focus.get('max_session', {})
-            focus_html = f"""
-            <div style="background: #F8FAFC; border-radius: 10px; padding: 14px; margin-bottom: 12px;">
-                <div style="font-weight: 600; color: #334155; font-size: 13px; margin-bottom: 10px;">🎯 专注力数据</div>
-                <div style="display: flex; gap: 8px; flex-wrap: wrap;">
-                    <div style="background: white; border: 1px solid #E2E8F0; border-radius: 6px; padding: 8px 12px; flex: 1; min-width: 120px;">
-                        <div style="font-size: 18px; font-weight: 600; color: #0F172A;">{focus.get('max_session', {}).get('duration', 0)}分钟</div>
-                        <div style="font-size: 11px; color: #64748B;">最长专注</div>
-                    </div>
-                    <div style="background: white; border: 1px solid #E2E8F0; border-radius: 6px; padding: 8px 12px; flex: 1; min-width: 120px;">
-                        <div style="font-size: 18px; font-weight: 600; color: #0F172A;">{focus.get('deep_total_mins', 0)}分钟</div>
-                        <div style="font-size: 11px; color: #64748B;">深度工作(>60min)</div>
-                    </div>
-                    <div style="background: white; border: 1px solid #E2E8F0; border-radius: 6px; padding: 8px 12px; flex: 1; min-width: 120px;">
-                        <div style="font-size: 18px; font-weight: 600; color: {'#DC2626' if focus.get('fragment_percent', 0) > 50 else '#0F172A'};">{focus.get('fragment_percent', 0)}%</div>
-                        <div style="font-size: 11px; color: #64748B;">碎片占比(<15min)</div>
-                    </div>
-                </div>
-                <div style="margin-top: 10px; font-size: 12px; color: #64748B;">
-                    共 {focus.get('total_sessions', 0)} 段工作 · 平均每段 {focus.get('avg_duration', 0)} 分钟
-                    {f" · 最长: {max_s.get('category', '')} ({max_s.get('time', '')})" if max_s.get('category') else ''}
-                </div>
-            </div>"""
-            sections.append(focus_html)
+            max_s = focus.get('max_session') or {}
+            max_category = max_s.get('category')
+            fragment_percent = focus.get('fragment_percent', 0)
+            sections.append(_render_template(_FOCUS_CARD_TEMPLATE, dict(
+                max_duration=max_s.get('duration', 0),
+                deep_total_mins=focus.get('deep_total_mins', 0),
+                fragment_color='#DC2626' if fragment_percent > 50 else '#0F172A',
+                fragment_percent=fragment_percent,
+                total_sessions=focus.get('total_sessions', 0),
+                avg_duration=focus.get('avg_duration', 0),
+                max_detail=f" · 最长: {max_category} ({max_s.get('time', '')})" if max_category else ''
+            )))
         
         # 2. 工作节奏分析
         if rhythm.get('has_data'):
             periods = rhythm.get('periods', {})
-            rhythm_bars = ""
-            max_score = max([p.get('avg_score', 0) for p in periods.values()]) if periods else 100
+            bars = []
+            max_score = max((p.get('avg_score', 0) for p in periods.values()), default=100)
+            
+            # 峰值小时所在时段只需判断一次
+            peak_hour = rhythm.get('peak_hour', -1)
+            peak_band = 0 if 6 <= peak_hour < 12 else 1 if 12 <= peak_hour < 18 else 2 if peak_hour >= 18 else -1
             
             for name, data in periods.items():
                 score = data.get('avg_score', 0)
                 bar_width = (score / max_score * 100) if max_score > 0 else 0
-                is_peak = (rhythm.get('peak_hour', -1) >= 6 and rhythm.get('peak_hour', -1) < 12 and '上午' in name) or \
-                         (rhythm.get('peak_hour', -1) >= 12 and rhythm.get('peak_hour', -1) < 18 and '下午' in name) or \
-                         (rhythm.get('peak_hour', -1) >= 18 and '晚上' in name)
+                label = name.split('(')[0]
+                is_peak = _PERIOD_BAND.get(label) == peak_band
                 
-                rhythm_bars += f"""
-                <div style="margin-bottom: 8px;">
-                    <div style="display: flex; justify-content: space-between; margin-bottom: 2px;">
-                        <span style="font-size: 12px; color: #374151;">{name.split('(')[0]} {'⭐' if is_peak else ''}</span>
-                        <span style="font-size: 12px; color: #6B7280;">{score}分 · {data.get('total_mins', 0)}分钟</span>
-                    </div>
-                    <div style="background: #E5E7EB; border-radius: 3px; height: 8px;">
-                        <div style="background: {'#10B981' if score >= 70 else '#F59E0B' if score >= 50 else '#EF4444'}; width: {bar_width}%; height: 100%; border-radius: 3px;"></div>
-                    </div>
-                </div>"""
+                bars.append(_render_template(_RHYTHM_BAR_TEMPLATE, dict(
+                    label=label,
+                    peak_mark='⭐' if is_peak else '',
+                    score=score,
+                    total_mins=data.get('total_mins', 0),
+                    bar_color='#10B981' if score >= 70 else '#F59E0B' if score >= 50 else '#EF4444',
+                    bar_width=bar_width
+                )))
             
-            rhythm_html = f"""
-            <div style="background: #F8FAFC; border-radius: 10px; padding: 14px; margin-bottom: 12px;">
-                <div style="font-weight: 600; color: #334155; font-size: 13px; margin-bottom: 10px;">⏰ 时段效率</div>
-                {rhythm_bars}
-                <div style="margin-top: 8px; font-size: 12px; color: #64748B;">
-                    效率峰值: {rhythm.get('peak_hour', '')}:00 ({rhythm.get('peak_score', 0)}分) · 
-                    低谷: {rhythm.get('low_hour', '')}:00 ({rhythm.get('low_score', 0)}分)
-                </div>
-            </div>"""
-            sections.append(rhythm_html)
+            sections.append(_render_template(_RHYTHM_CARD_TEMPLATE, dict(
+                rhythm_bars="".join(bars),
+                peak_hour=rhythm.get('peak_hour', ''),
+                peak_score=rhythm.get('peak_score', 0),
+                low_hour=rhythm.get('low_hour', ''),
+                low_score=rhythm.get('low_score', 0)
+            )))
         
         # 3. 任务切换分析
-        if switching.get('has_data') and switching.get('total_switches', 0) > 0:
-            switch_count = switching.get('total_switches', 0)
+        switch_count = switching.get('total_switches', 0)
+        if switching.get('has_data') and switch_count > 0:
             switch_color = '#10B981' if switch_count <= 3 else '#F59E0B' if switch_count <= 6 else '#EF4444'
             switch_text = '非常聚焦' if switch_count <= 3 else '节奏正常' if switch_count <= 6 else '切换频繁'
             
             patterns = switching.get('common_patterns', [])
             pattern_str = " · ".join([f"{p[0]}" for p in patterns[:2]]) if patterns else ""
             
-            switch_html = f"""
-            <div style="background: #F8FAFC; border-radius: 10px; padding: 14px; margin-bottom: 12px;">
-                <div style="font-weight: 600; color: #334155; font-size: 13px; margin-bottom: 10px;">🔄 任务切换</div>
-                <div style="display: flex; align-items: center; gap: 12px;">
-                    <div style="background: {switch_color}; color: white; font-size: 20px; font-weight: 700; padding: 12px 20px; border-radius: 8px;">
-                        {switch_count}
-                    </div>
-                    <div>
-                        <div style="font-size: 14px; font-weight: 500; color: #0F172A;">{switch_text}</div>
-                        <div style="font-size: 12px; color: #64748B;">今日类别切换次数</div>
-                    </div>
-                </div>
-                {f'<div style="margin-top: 8px; font-size: 12px; color: #64748B;">常见切换: {pattern_str}</div>' if pattern_str else ''}
-            </div>"""
-            sections.append(switch_html)
+            sections.append(_render_template(_SWITCH_CARD_TEMPLATE, dict(
+                switch_color=switch_color,
+                switch_count=switch_count,
+                switch_text=switch_text,
+                pattern_html=f'<div style="margin-top: 8px; font-size: 12px; color: #64748B;">常见切换: {pattern_str}</div>' if pattern_str else ''
+            )))
         
         # 4. 类别效率对比
-        if categories.get('has_data') and len(categories.get('stats', {})) >= 2:
-            cat_stats = categories.get('stats', {})
+        cat_stats = categories.get('stats') or {}
+        if categories.get('has_data') and len(cat_stats) >= 2:
             best = categories.get('best')
             worst = categories.get('worst')
             
@@ -1101,65 +2001,54 @@ class ReportGenerator:
                 best_data = cat_stats.get(best, {})
                 worst_data = cat_stats.get(worst, {})
                 
-                cat_html = f"""
-                <div style="background: #F8FAFC; border-radius: 10px; padding: 14px;">
-                    <div style="font-weight: 600; color: #334155; font-size: 13px; margin-bottom: 10px;">📊 类别效率对比</div>
-                    <div style="display: flex; gap: 10px;">
-                        <div style="flex: 1; background: #DCFCE7; border-radius: 8px; padding: 10px; text-align: center;">
-                            <div style="font-size: 11px; color: #166534;">效率最高</div>
-                            <div style="font-size: 15px; font-weight: 600; color: #15803D; margin: 4px 0;">{best}</div>
-                            <div style="font-size: 18px; font-weight: 700; color: #166534;">{best_data.get('avg_score', 0)}分</div>
-                            <div style="font-size: 11px; color: #166534;">{best_data.get('session_count', 0)}段 · {best_data.get('total_mins', 0)}分钟</div>
-                        </div>
-                        <div style="flex: 1; background: #FEF3C7; border-radius: 8px; padding: 10px; text-align: center;">
-                            <div style="font-size: 11px; color: #92400E;">效率较低</div>
-                            <div style="font-size: 15px; font-weight: 600; color: #B45309; margin: 4px 0;">{worst}</div>
-                            <div style="font-size: 18px; font-weight: 700; color: #92400E;">{worst_data.get('avg_score', 0)}分</div>
-                            <div style="font-size: 11px; color: #92400E;">{worst_data.get('session_count', 0)}段 · {worst_data.get('total_mins', 0)}分钟</div>
-                        </div>
-                    </div>
-                </div>"""
-                sections.append(cat_html)
+                sections.append(_render_template(_CATEGORY_CARD_TEMPLATE, dict(
+                    best=best,
+                    best_score=best_data.get('avg_score', 0),
+                    best_sessions=best_data.get('session_count', 0),
+                    best_mins=best_data.get('total_mins', 0),
+                    worst=worst,
+                    worst_score=worst_data.get('avg_score', 0),
+                    worst_sessions=worst_data.get('session_count', 0),
+                    worst_mins=worst_data.get('total_mins', 0)
+                )))
         
         return "\n".join(sections) if sections else '<div style="color: #9CA3AF; text-align: center; padding: 20px;">数据量较少，暂无深度分析</div>'
     
     def _build_expert_analysis_html(self, expert_analysis: str) -> str:
-        """构建专业分析报告的 HTML"""
-        import re
-        
-        # 将 Markdown 转换为 HTML
-        html_content = expert_analysis
-        
-        # 转换 Markdown 标题
-        html_content = re.sub(r'^### (.+)$', r'<h4 style="font-size: 14px; font-weight: 600; color: #1E3A5F; margin: 16px 0 8px 0;">\1</h4>', html_content, flags=re.MULTILINE)
-        html_content = re.sub(r'^## (.+)$', r'<h3 style="font-size: 15px; font-weight: 600; color: #1E3A5F; margin: 16px 0 10px 0;">\1</h3>', html_content, flags=re.MULTILINE)
-        html_content = re.sub(r'^\*\*(.+?)\*\*', r'<strong>\1</strong>', html_content, flags=re.MULTILINE)
-        
-        # 转换粗体
-        html_content = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', html_content)
+        """
+        构建专业分析报告的 HTML
         
-        # 转换列表项
-        html_content = re.sub(r'^- (.+)$', r'<div style="margin: 4px 0; padding-left: 12px;">• \1</div>', html_content, flags=re.MULTILINE)
+        逐行转换 Markdown：标题、列表项各成一块，连续的普通行合并为一个段落（行间用 <br>），空行结束段落
+        """
+        parts = []
+        paragraph = []
         
-        # 转换换行
-        html_content = html_content.replace('\n\n', '</p><p style="margin: 8px 0; color: #334155; font-size: 13px; line-height: 1.7;">')
-        html_content = html_content.replace('\n', '<br>')
+        def flush_paragraph():
+            if paragraph:
+                parts.append(_MD_PARAGRAPH_HTML.format("<br>".join(paragraph)))
+                paragraph.clear()
         
-        return f"""
-            <!-- 分隔线 -->
-            <div style="border-top: 1px solid #E5E7EB; margin: 24px 0;"></div>
+        for line in expert_analysis.splitlines():
+            if not line.strip():
+                flush_paragraph()
+                continue
             
-            <!-- 专业深度分析报告 -->
-            <div style="background: linear-gradient(135deg, #E0F2FE 0%, #BAE6FD 100%); border-radius: 12px; padding: 20px; margin-top: 16px;">
-                <h2 style="font-size: 16px; font-weight: 600; color: #0C4A6E; margin: 0 0 16px 0; display: flex; align-items: center;">
-                    📋 专业分析报告
-                </h2>
-                <div style="background: white; border-radius: 8px; padding: 16px; color: #334155; font-size: 13px; line-height: 1.7;">
-                    <p style="margin: 0; color: #334155; font-size: 13px; line-height: 1.7;">
-                        {html_content}
-                    </p>
-                </div>
-            </div>"""
+            line = _RE_MD_BOLD.sub(r'<strong>\1</strong>', line)
+            if line.startswith('### '):
+                flush_paragraph()
+                parts.append(_MD_H3_HTML.format(line[4:]))
+            elif line.startswith('## '):
+                flush_paragraph()
+                parts.append(_MD_H2_HTML.format(line[3:]))
+            elif line.startswith('- '):
+                flush_paragraph()
+                parts.append(_MD_LIST_ITEM_HTML.format(line[2:]))
+            else:
+                paragraph.append(line)
+        flush_paragraph()
+        
+        html_content = "".join(parts)
+        return _render_template(_EXPERT_ANALYSIS_TEMPLATE, dict(html_content=html_content))
 
 
 class EmailScheduler:
@@ -1182,6 +2071,12 @@ class EmailScheduler:
     MAX_RETRIES = 3
     RETRY_BASE_DELAY = 60  # 秒
     
+    # 发送时间配置的缓存有效期（秒）
+    SEND_TIMES_CACHE_TTL = 60
+    
+    # 定时器允许提前触发的秒数（超过视为系统时间发生变化）
+    TIMER_EARLY_TOLERANCE = 5
+    
     def __init__(
         self, 
         email_service: EmailService, 
@@ -1209,6 +2104,66 @@ class EmailScheduler:
         # 内存缓存（兼容旧逻辑）
         self._last_noon_send: Optional[datetime] = None
         self._last_night_send: Optional[datetime] = None
+        
+        # 发送时间缓存（check_and_send 每分钟调用，避免每次都读配置）
+        self._send_times_cache: Optional[List[Tuple[int, int]]] = None
+        self._send_times_cache_ts = 0.0
+        
+        # 配置变更时立即失效缓存
+        config_changed = getattr(config_manager, "config_changed", None)
+        if config_changed is not None:
+            config_changed.connect(self._on_config_changed)
+        
+        # 发送记录使用一个长连接（调度器生命周期内复用），由锁保护跨线程访问
+        self._db_lock = threading.Lock()
+        self._db_conn: Optional[sqlite3.Connection] = None
+        self._last_checkpoint_date = None
+        if storage:
+            try:
+                self._db_conn = sqlite3.connect(str(storage.db_path), timeout=10.0, check_same_thread=False)
+                self._db_conn.row_factory = sqlite3.Row
+                self._db_conn.execute("PRAGMA journal_mode=WAL")
+                self._db_conn.execute("PRAGMA synchronous=NORMAL")
+            except Exception as e:
+                logger.warning(f"打开发送记录数据库连接失败: {e}")
+                self._db_conn = None
+        
+        # 发送在共享 I/O 线程池中执行（含重试等待），check_and_send 立即返回
+        self._in_flight: Set[str] = set()
+        self._send_futures: Set[Future] = set()
+        self._in_flight_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # 发送失败的时间段，由调用方线程（check_and_send）取出后再显示托盘通知
+        self._failed_periods: List[str] = []
+        
+        # 按下一个发送时间点定时唤醒（on_app_start 后启用），代替每分钟轮询
+        self._timer: Optional[threading.Timer] = None
+        self._timer_lock = threading.Lock()
+    
+    def shutdown(self) -> None:
+        """停止定时器和发送线程并释放连接（应用退出时调用）"""
+        self._stop_event.set()  # 中断重试等待
+        self._cancel_timer()
+        
+        # 线程池是模块共享的，这里只取消/等待本调度器提交的发送任务
+        with self._in_flight_lock:
+            futures = list(self._send_futures)
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        self.close()
+    
+    def close(self) -> None:
+        """关闭数据库长连接和复用的 SMTP 连接（应用退出时调用）"""
+        with self._db_lock:
+            if self._db_conn is not None:
+                try:
+                    self._db_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    self._db_conn.close()
+                except Exception as e:
+                    logger.warning(f"关闭发送记录数据库连接失败: {e}")
+                self._db_conn = None
+        self.email_service.close()
     
     def on_app_start(self) -> None:
         """
@@ -1220,6 +2175,7 @@ class EmailScheduler:
         
         send_times = self._get_send_times()
         now = datetime.now()
+        missed: List[str] = []
         
         for hour, minute in send_times:
             period = f"{hour:02d}:{minute:02d}"
@@ -1240,19 +2196,36 @@ class EmailScheduler:
                 time_since_scheduled = (now - scheduled_today).total_seconds() / 3600
                 if time_since_scheduled <= self.CATCH_UP_WINDOW_HOURS:
                     logger.info(f"检测到错过的报告 ({period})，正在补发...")
-                    self._send_report(period)
+                    missed.append(period)
+        
+        if len(missed) > 1:
+            self._send_reports(missed)
+        elif missed:
+            self._send_report(missed[0])
+        
+        # 补发检查完成后，按下一个发送时间点定时
+        self._schedule_next()
     
     def on_system_wake(self) -> None:
         """
         系统从睡眠唤醒时调用
         
-        重新检查是否有错过的报告
+        重新检查是否有错过的报告，并重新计算下一个发送时间点（睡眠期间定时器不可靠）
         """
         logger.info("系统唤醒，重新检查邮件报告...")
         self.on_app_start()
     
     def check_and_send(self):
-        """检查是否需要发送报告（每分钟调用一次）"""
+        """
+        检查是否需要发送报告（每分钟调用一次）
+        
+        定时器启用后发送由定时器负责，这里只显示失败通知；定时器未启用时按原逻辑轮询兜底
+        """
+        self._flush_failure_notifications()
+        
+        if self._timer is not None:
+            return
+        
         now = datetime.now()
         today = now.date()
         
@@ -1286,17 +2259,194 @@ class EmailScheduler:
                     self._last_night_send = now
     
     def _get_send_times(self) -> List[Tuple[int, int]]:
-        """获取配置的发送时间列表"""
-        if self.config_manager:
-            return self.config_manager.get_email_send_times()
-        return [(12, 0), (22, 0)]  # 默认值
+        """获取配置的发送时间列表（缓存 SEND_TIMES_CACHE_TTL 秒）"""
+        if not self.config_manager:
+            return [(12, 0), (22, 0)]  # 默认值
+        
+        now = time.monotonic()
+        if self._send_times_cache is None or now - self._send_times_cache_ts >= self.SEND_TIMES_CACHE_TTL:
+            self._send_times_cache = self.config_manager.get_email_send_times()
+            self._send_times_cache_ts = now
+        return self._send_times_cache
+    
+    def invalidate_send_times_cache(self) -> None:
+        """使发送时间缓存失效（配置变更后调用）"""
+        self._send_times_cache = None
+    
+    def _on_config_changed(self, *_) -> None:
+        """配置变更：刷新发送时间，已启用定时器时按新配置重新定时"""
+        self.invalidate_send_times_cache()
+        if self._timer is not None:
+            self._schedule_next()
+    
+    def _compute_next_deadline(self, now: datetime) -> Optional[Tuple[str, datetime]]:
+        """
+        计算下一个发送时间点
+        
+        Returns:
+            (时间段标识, 发送时间)，取严格晚于 now 的最早一个（今天都已过则顺延到明天）；没有配置时返回 None
+        """
+        deadlines = []
+        for hour, minute in self._get_send_times():
+            deadline = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if deadline <= now:
+                deadline += timedelta(days=1)
+            deadlines.append((deadline, f"{hour:02d}:{minute:02d}"))
+        
+        if not deadlines:
+            return None
+        deadline, period = min(deadlines)
+        return period, deadline
+    
+    def _schedule_next(self) -> None:
+        """取消现有定时器，并按下一个发送时间点重新定时"""
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            
+            if self._stop_event.is_set():
+                return
+            
+            now = datetime.now()
+            next_deadline = self._compute_next_deadline(now)
+            if next_deadline is None:
+                return
+            
+            period, deadline = next_deadline
+            self._timer = threading.Timer(
+                (deadline - now).total_seconds(), self._fire_and_reschedule, args=[period, deadline]
+            )
+            self._timer.daemon = True
+            self._timer.start()
+            logger.debug(f"下一次邮件报告: {period} ({deadline:%Y-%m-%d %H:%M})")
+    
+    def _cancel_timer(self) -> None:
+        """取消定时器"""
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+    
+    def _fire_and_reschedule(self, period: str, deadline: datetime) -> None:
+        """定时器到点：提交发送任务并定时下一次"""
+        # 定时器按单调时钟计时，系统时间被回拨/校准后可能提前触发，此时只重新定时
+        now = datetime.now()
+        if now < deadline - timedelta(seconds=self.TIMER_EARLY_TOLERANCE):
+            logger.debug(f"定时器提前触发（系统时间变化），重新定时 {period}")
+            self._schedule_next()
+            return
+        
+        try:
+            if not self.email_service.config.enabled:
+                logger.debug(f"邮件推送未启用，跳过 {period} 报告")
+            else:
+                last_send = self._get_last_send_time(period)
+                if last_send is None or last_send.date() != now.date():
+                    logger.info(f"触发 {period} 邮件发送")
+                    self._send_report(period)
+        except Exception as e:
+            logger.error(f"定时发送 {period} 报告失败: {e}")
+        finally:
+            self._schedule_next()
     
     def _send_report(self, period: str):
-        """发送报告（带重试）"""
-        success = self._send_with_retry(period)
+        """提交发送任务（带重试）到发送线程，同一时间段不会重复提交"""
+        self._send_reports([period])
+    
+    def _send_reports(self, periods: List[str]) -> None:
+        """
+        提交一组时间段的发送任务，同一时间段不会重复提交
+        
+        多个时间段（如补发）共用一份报告，并通过 EmailService.send_reports 在同一个 SMTP 会话中发送
+        """
+        with self._in_flight_lock:
+            skipped = [p for p in periods if p in self._in_flight]
+            periods = [p for p in periods if p not in self._in_flight]
+            self._in_flight.update(periods)
+        for period in skipped:
+            logger.debug(f"{period} 报告正在发送中，跳过")
+        if not periods:
+            return
+        
+        if self._stop_event.is_set():
+            with self._in_flight_lock:
+                self._in_flight.difference_update(periods)
+            return
+        
+        try:
+            if len(periods) == 1:
+                future = _IO_POOL.submit(self._send_in_background, periods[0])
+            else:
+                future = _IO_POOL.submit(self._send_batch_in_background, periods)
+        except RuntimeError as e:
+            # 解释器退出时线程池已关闭
+            logger.warning(f"提交发送任务失败: {e}")
+            with self._in_flight_lock:
+                self._in_flight.difference_update(periods)
+            return
+        
+        with self._in_flight_lock:
+            self._send_futures.add(future)
+        future.add_done_callback(self._on_send_done)
+    
+    def _on_send_done(self, future: Future) -> None:
+        """发送任务结束（含被取消）后清理记录"""
+        with self._in_flight_lock:
+            self._send_futures.discard(future)
+    
+    def _send_in_background(self, period: str) -> None:
+        """发送线程入口"""
+        try:
+            if not self._send_with_retry(period):
+                # 托盘通知需在 GUI 线程显示，交由下一次 check_and_send 处理
+                with self._in_flight_lock:
+                    self._failed_periods.append(period)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.discard(period)
+    
+    def _send_batch_in_background(self, periods: List[str]) -> None:
+        """
+        发送线程入口（多个时间段）
         
-        if not success:
-            # 发送托盘通知
+        先在一个 SMTP 会话中批量发送一次，失败的时间段再逐个走带退避的重试
+        """
+        try:
+            now = datetime.now()
+            try:
+                html = self.report_generator.generate_daily_report(now, generated_at=now)
+            except Exception as e:
+                logger.error(f"生成报告失败: {', '.join(periods)}: {e}")
+                for period in periods:
+                    self._save_last_send_time(period, now, success=False, error_message=str(e), retry_count=0)
+                with self._in_flight_lock:
+                    self._failed_periods.extend(periods)
+                return
+            
+            messages = [(self._build_subject(period, now), html) for period in periods]
+            try:
+                results = self.email_service.send_reports(messages)
+            except Exception as e:
+                logger.error(f"批量发送异常: {e}")
+                results = [(False, str(e))] * len(periods)
+            
+            for period, (success, _error_msg) in zip(periods, results):
+                if success:
+                    logger.info(f"定时报告发送成功: {period} (批量)")
+                    self._save_last_send_time(period, now, success=True, retry_count=0)
+                elif self._stop_event.is_set() or not self._send_with_retry(period):
+                    with self._in_flight_lock:
+                        self._failed_periods.append(period)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.difference_update(periods)
+    
+    def _flush_failure_notifications(self) -> None:
+        """显示后台发送失败的托盘通知"""
+        with self._in_flight_lock:
+            failed, self._failed_periods = self._failed_periods, []
+        for period in failed:
             self._notify_failure(period)
     
     def _send_with_retry(self, period: str) -> bool:
@@ -1310,21 +2460,20 @@ class EmailScheduler:
             是否发送成功
         """
         now = datetime.now()
-        date_str = now.strftime("%m月%d日")
+        subject = self._build_subject(period, now)
         
-        # 构建邮件主题
-        if period == "noon":
-            subject = f"📊 Dayflow 午间报告 - {date_str}"
-        elif period == "night":
-            subject = f"📊 Dayflow 晚间报告 - {date_str}"
-        else:
-            subject = f"📊 Dayflow {period} 报告 - {date_str}"
+        # 报告只生成一次，重试只针对 SMTP 发送（生成失败不是临时性网络问题，重试无意义）
+        try:
+            html = self.report_generator.generate_daily_report(now, generated_at=now)
+        except Exception as e:
+            logger.error(f"生成报告失败: {period}: {e}")
+            self._save_last_send_time(period, now, success=False, error_message=str(e), retry_count=0)
+            return False
         
         last_error = ""
         
         for attempt in range(self.MAX_RETRIES):
             try:
-                html = self.report_generator.generate_daily_report(now)
                 success, error_msg = self.email_service.send_report(subject, html)
                 
                 if success:
@@ -1339,21 +2488,32 @@ class EmailScheduler:
                 last_error = str(e)
                 logger.error(f"发送异常 (尝试 {attempt + 1}/{self.MAX_RETRIES}): {e}")
             
-            # 指数退避等待
+            # 指数退避等待（应用退出时立即中断）
             if attempt < self.MAX_RETRIES - 1:
                 delay = self.RETRY_BASE_DELAY * (2 ** attempt)
                 logger.info(f"等待 {delay} 秒后重试...")
-                import time
-                time.sleep(delay)
+                if self._stop_event.wait(delay):
+                    logger.info(f"调度器已停止，放弃重试: {period}")
+                    break
         
         # 所有重试都失败
         logger.error(f"定时报告发送失败（已重试 {self.MAX_RETRIES} 次）: {period}")
         self._save_last_send_time(period, now, success=False, error_message=last_error, retry_count=self.MAX_RETRIES)
         return False
     
+    @staticmethod
+    def _build_subject(period: str, now: datetime) -> str:
+        """构建邮件主题"""
+        date_str = now.strftime("%m月%d日")
+        if period == "noon":
+            return f"📊 Dayflow 午间报告 - {date_str}"
+        if period == "night":
+            return f"📊 Dayflow 晚间报告 - {date_str}"
+        return f"📊 Dayflow {period} 报告 - {date_str}"
+    
     def _get_last_send_time(self, period: str) -> Optional[datetime]:
         """从数据库获取上次成功发送时间"""
-        if not self.storage:
+        if self._db_conn is None:
             # 兼容模式：使用内存缓存
             if period == "noon":
                 return self._last_noon_send
@@ -1362,20 +2522,15 @@ class EmailScheduler:
             return None
         
         try:
-            # 使用独立连接查询
-            import sqlite3
-            conn = sqlite3.connect(str(self.storage.db_path), timeout=10.0)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute(
-                """
-                SELECT send_time FROM email_send_log 
-                WHERE period = ? AND success = 1 
-                ORDER BY send_time DESC LIMIT 1
-                """,
-                (period,)
-            )
-            row = cursor.fetchone()
-            conn.close()
+            with self._db_lock:
+                row = self._db_conn.execute(
+                    """
+                    SELECT send_time FROM email_send_log 
+                    WHERE period = ? AND success = 1 
+                    ORDER BY send_time DESC LIMIT 1
+                    """,
+                    (period,)
+                ).fetchone()
             
             if row:
                 return datetime.fromisoformat(row["send_time"])
@@ -1400,23 +2555,25 @@ class EmailScheduler:
         elif period == "night":
             self._last_night_send = send_time
         
-        if not self.storage:
+        if self._db_conn is None:
             return
         
         try:
-            import sqlite3
-            conn = sqlite3.connect(str(self.storage.db_path), timeout=10.0)
-            conn.execute("PRAGMA synchronous=FULL")
-            conn.execute(
-                """
-                INSERT INTO email_send_log (period, send_time, success, error_message, retry_count)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                (period, send_time.isoformat(), 1 if success else 0, error_message, retry_count)
-            )
-            conn.commit()
-            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-            conn.close()
+            with self._db_lock:
+                self._db_conn.execute(
+                    """
+                    INSERT INTO email_send_log (period, send_time, success, error_message, retry_count)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (period, send_time.isoformat(), 1 if success else 0, error_message, retry_count)
+                )
+                self._db_conn.commit()
+                
+                # WAL 检查点每天最多做一次，不再每次写入都截断
+                today = send_time.date()
+                if self._last_checkpoint_date != today:
+                    self._db_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    self._last_checkpoint_date = today
             logger.debug(f"已保存发送记录: {period} at {send_time}")
         
         except Exception as e:
@@ -1440,7 +2597,7 @@ class EmailScheduler:
         try:
             now = datetime.now()
             subject = f"🧪 Dayflow 测试邮件 - {now.strftime('%H:%M')}"
-            html = self.report_generator.generate_daily_report(now)
+            html = self.report_generator.generate_daily_report(now, generated_at=now)
             return self.email_service.send_report(subject, html)
         except Exception as e:
             logger.error(f"发送测试邮件失败: {e}")
@@ -0,0 +1,89 @@
+"""
+Dayflow Windows - 关键帧编码模块
+录制时在线采样的关键帧和分析时从视频解码的关键帧使用同一套编码流程
+"""
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import cv2
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# libjpeg-turbo（SIMD 加速）编码 JPEG，未安装或 DLL 加载失败时回退到 cv2.imencode
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _turbo_jpeg = TurboJPEG()
+    TURBOJPEG_AVAILABLE = True
+except Exception:
+    TURBOJPEG_AVAILABLE = False
+
+# 送给模型的关键帧尺寸和 JPEG 质量
+KEYFRAME_SIZE = (1280, 720)
+JPEG_QUALITY = 70
+
+# 关键帧文件后缀（与视频切片同名）
+KEYFRAMES_SUFFIX = ".frames.npz"
+
+# 每个线程复用的缩放目标缓冲区（录制线程和解码线程池会同时编码）
+_resize_buffers = threading.local()
+
+
+def sample_indices(total_frames: int, max_frames: int = config.TRANSCRIBE_MAX_FRAMES) -> Counter:
+    """
+    均匀采样的帧序号 -> 该帧被采样的次数
+
+    帧数少于 max_frames 时同一帧会被采样多次
+    """
+    return Counter(int(i * total_frames / max_frames) for i in range(max_frames))
+
+
+def encode_keyframe(frame: np.ndarray) -> np.ndarray:
+    """压缩并编码一帧为 JPEG，返回编码后的字节数组"""
+    width, height = KEYFRAME_SIZE
+    # 不超过目标尺寸的帧直接编码（放大不增加信息，只会增大传输体积）；缩小用 INTER_AREA，文字更清晰
+    if frame.shape[1] > width or frame.shape[0] > height:
+        dst = getattr(_resize_buffers, "dst", None)
+        if dst is None:
+            dst = _resize_buffers.dst = np.empty((height, width, 3), dtype=np.uint8)
+        frame = cv2.resize(frame, KEYFRAME_SIZE, dst=dst, interpolation=cv2.INTER_AREA)
+    if TURBOJPEG_AVAILABLE:
+        return np.frombuffer(
+            _turbo_jpeg.encode(frame, quality=JPEG_QUALITY, pixel_format=TJPF_BGR), dtype=np.uint8
+        )
+    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return buffer
+
+
+def keyframes_path(video_path: str) -> Path:
+    """视频切片对应的关键帧文件路径"""
+    return Path(video_path).with_suffix(KEYFRAMES_SUFFIX)
+
+
+def save_keyframes(video_path: str, buffers: List[np.ndarray]) -> Optional[Path]:
+    """保存录制时采样的关键帧，失败时返回 None（分析时会回退到解码视频）"""
+    path = keyframes_path(video_path)
+    try:
+        np.savez(path, *buffers)
+        return path
+    except Exception as e:
+        logger.warning(f"保存关键帧失败: {e}")
+        return None
+
+
+def load_keyframes(video_path: str) -> Optional[List[np.ndarray]]:
+    """读取录制时保存的关键帧，不存在或损坏时返回 None"""
+    path = keyframes_path(video_path)
+    try:
+        with np.load(path) as data:
+            return [data[f"arr_{i}"] for i in range(len(data.files))]
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"读取关键帧失败 {path.name}: {e}")
+        return None
@@ -3,10 +3,14 @@ Dayflow Windows - API 交互层
 使用 OpenAI 兼容格式调用心流 API
 """
 import asyncio
-import base64
+import atexit
+import binascii
+import importlib.util
 import json
 import logging
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional, Dict
 from datetime import datetime
@@ -16,8 +20,66 @@ import httpx
 import cv2
 
 import config
+from core.keyframes import encode_keyframe, load_keyframes, sample_indices
 from core.types import Observation, ActivityCard, AppSite, Distraction
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# httpx 的 HTTP/2 支持依赖 h2，这里只检测是否安装，不导入
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# 视频解码 + JPEG 编码线程池：OpenCV 在这些调用中释放 GIL，放到线程里执行不会阻塞事件循环，
+# 多个切片并发转录时解码可以和其他切片的 HTTP 等待重叠
+_DECODE_POOL = ThreadPoolExecutor(max_workers=config.MAX_CONCURRENT_TRANSCRIBE, thread_name_prefix="dayflow-decode")
+atexit.register(_DECODE_POOL.shutdown, wait=False)
+
+_JPEG_DATA_URL_PREFIX = b"data:image/jpeg;base64,"
+
+
+def _jpeg_data_url(buffer) -> str:
+    """JPEG 字节 -> data URL（直接在 bytes 上拼接前缀，避免 base64 字符串再格式化一次）"""
+    return (_JPEG_DATA_URL_PREFIX + binascii.b2a_base64(buffer, newline=False)).decode('ascii')
+
+
+# JSON 结构记号：整个字符串字面量（其中的括号不计数）或花括号
+_JSON_TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[{}]')
+
+_json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# 窗口标题线索提取：标题分隔符、像文件名的后缀、包含有效字符的片段
+_RE_TITLE_SEPARATOR = re.compile(r"\s*[\-|—|_|·|•|:：]\s*")
+_RE_FILE_SUFFIX = re.compile(r"\.[a-z0-9]{1,8}$")
+_RE_MEANINGFUL_TEXT = re.compile(r"[\u4e00-\u9fffA-Za-z0-9].{2,}")
+
+
+def _find_json_object(text: str) -> Optional[str]:
+    """
+    定位模型回复中的 JSON 对象（第一个 '{' 到与之配对的 '}'）
+    
+    回复在 JSON 之后还有说明文字时也能正确截取；括号不配对（输出被截断）时
+    退回到最后一个 '}'，交给 JSON 解析报错
+    """
+    start = text.find('{')
+    if start < 0:
+        return None
+    
+    depth = 0
+    for match in _JSON_TOKEN_RE.finditer(text, start):
+        token = match.group()
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:match.end()]
+    
+    end = text.rfind('}')
+    return text[start:end + 1] if end > start else None
+
 logger = logging.getLogger(__name__)
 
 # 系统提示词
@@ -146,6 +208,12 @@ class DayflowBackendProvider:
         "文件资源管理器", "windows terminal", "powershell", "cmd", "unknown"
     }
     
+    # 连接池上限：分析调度器会并发转录多个切片，默认的 keep-alive 连接数会让并发请求排队等连接
+    MAX_CONNECTIONS = 64
+    MAX_KEEPALIVE_CONNECTIONS = 32
+    # 空闲连接保留时间（秒）：切片按分钟级间隔分析，默认 5 秒会让几乎每次请求都重新握手
+    KEEPALIVE_EXPIRY = 75.0
+    
     def __init__(
         self,
         api_base_url: Optional[str] = None,
@@ -157,6 +225,7 @@ class DayflowBackendProvider:
         self.api_key = api_key or config.API_KEY
         self.model = model or config.API_MODEL
         self.timeout = timeout
+        self._endpoint = f"{self.api_base_url}/chat/completions"
         
         self._client: Optional[httpx.AsyncClient] = None
     
@@ -172,7 +241,13 @@ class DayflowBackendProvider:
         """获取或创建异步 HTTP 客户端"""
         if self._client is None or self._client.is_closed:
             self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
                 timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.MAX_CONNECTIONS,
+                    max_keepalive_connections=self.MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=self.KEEPALIVE_EXPIRY
+                ),
                 headers=self.headers
             )
         return self._client
@@ -183,46 +258,56 @@ class DayflowBackendProvider:
             await self._client.aclose()
             self._client = None
     
-    def _extract_frames_from_video(self, video_path: str, max_frames: int = 10) -> List[str]:
+    def _extract_frames_from_video(self, video_path: str, max_frames: int = config.TRANSCRIBE_MAX_FRAMES) -> List[str]:
         """
-        从视频中提取关键帧并编码为 base64
+        从视频中提取关键帧并编码为 JPEG data URL
+        
+        录制时已保存关键帧的切片直接读取，无需解码视频
         
         Args:
             video_path: 视频文件路径
             max_frames: 最大提取帧数
             
         Returns:
-            List[str]: base64 编码的图片列表
+            List[str]: base64 data URL 列表
         """
-        frames_base64 = []
+        buffers = load_keyframes(video_path)
+        if buffers is not None and len(buffers) == max_frames:
+            return [_jpeg_data_url(buffer) for buffer in buffers]
+        
+        frame_urls = []
         
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             logger.error(f"无法打开视频文件: {video_path}")
-            return frames_base64
+            return frame_urls
         
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         if total_frames == 0:
             cap.release()
-            return frames_base64
-        
-        # 均匀采样帧
-        frame_indices = [int(i * total_frames / max_frames) for i in range(max_frames)]
-        
-        for idx in frame_indices:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-            ret, frame = cap.read()
+            return frame_urls
+        
+        # 均匀采样帧（帧数少于 max_frames 时同一帧会被采样多次）
+        frame_indices = sample_indices(total_frames, max_frames)
+        last_index = max(frame_indices)
+        
+        # 顺序解码一遍：逐帧 seek 每次都要回到最近的关键帧重新解码，
+        # 不需要的帧只 grab（解码但不转换为 BGR 图像），到最后一个采样帧即停止
+        for idx in range(last_index + 1):
+            if not cap.grab():
+                break
+            count = frame_indices.get(idx)
+            if not count:
+                continue
+            ret, frame = cap.retrieve()
             if not ret:
                 continue
             
             # 压缩图片以减少传输大小
-            frame = cv2.resize(frame, (1280, 720))
-            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-            base64_image = base64.b64encode(buffer).decode('utf-8')
-            frames_base64.append(base64_image)
+            frame_urls.extend([_jpeg_data_url(encode_keyframe(frame))] * count)
         
         cap.release()
-        return frames_base64
+        return frame_urls
     
     def _extract_message_content(self, message_content) -> str:
         """兼容不同 OpenAI/Gemini 兼容服务的 message.content 返回格式。"""
@@ -256,7 +341,7 @@ class DayflowBackendProvider:
             return None
 
         # 常见编辑器/浏览器标题分隔符
-        candidates = [seg.strip(" -—_|•·[]()") for seg in re.split(r"\s*[\-|—|_|·|•|:：]\s*", title) if seg.strip()]
+        candidates = [seg.strip(" -—_|•·[]()") for seg in _RE_TITLE_SEPARATOR.split(title) if seg.strip()]
         if not candidates:
             candidates = [title]
 
@@ -275,11 +360,11 @@ class DayflowBackendProvider:
                 continue
 
             score = 0
-            if re.search(r"\.[a-z0-9]{1,8}$", part_norm):
+            if _RE_FILE_SUFFIX.search(part_norm):
                 score += 4  # 像文件名
             if any(ch in part for ch in ('/', '\\')):
                 score += 3  # 像路径
-            if re.search(r"[\u4e00-\u9fffA-Za-z0-9].{2,}", part):
+            if _RE_MEANINGFUL_TEXT.search(part):
                 score += 1
             if len(part) >= 6:
                 score += 1
@@ -322,13 +407,14 @@ class DayflowBackendProvider:
         }
         
         try:
-            response = await client.post(
-                f"{self.api_base_url}/chat/completions",
-                json=request_body
-            )
+            # orjson 可用时直接收发 bytes，省去 httpx 内部的 json 编解码（请求体含多张 base64 截图）
+            if ORJSON_AVAILABLE:
+                response = await client.post(self._endpoint, content=orjson.dumps(request_body))
+            else:
+                response = await client.post(self._endpoint, json=request_body)
             response.raise_for_status()
             
-            result = response.json()
+            result = orjson.loads(response.content) if ORJSON_AVAILABLE else response.json()
             choices = result.get("choices") or []
             if not choices:
                 raise ValueError(f"响应中缺少 choices: {result}")
@@ -375,8 +461,10 @@ class DayflowBackendProvider:
         if not video_file.exists():
             raise FileNotFoundError(f"视频文件不存在: {video_path}")
         
-        # 提取视频帧
-        frames = self._extract_frames_from_video(video_path, max_frames=8)
+        # 提取视频帧（在线程池中执行）
+        frames = await asyncio.get_running_loop().run_in_executor(
+            _DECODE_POOL, self._extract_frames_from_video, video_path, config.TRANSCRIBE_MAX_FRAMES
+        )
         if not frames:
             logger.warning(f"无法从视频提取帧: {video_path}")
             return []
@@ -411,11 +499,11 @@ class DayflowBackendProvider:
             "text": f"以下是一段 {duration:.0f} 秒屏幕录制的 {len(frames)} 个关键帧，请分析用户的活动。{window_info_text}{prompt or ''}"
         })
         
-        for i, frame_base64 in enumerate(frames):
+        for frame_url in frames:
             content.append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/jpeg;base64,{frame_base64}",
+                    "url": frame_url,
                     "detail": "low"
                 }
             })
@@ -438,6 +526,33 @@ class DayflowBackendProvider:
             logger.error(f"视频分析失败: {e}")
             return []
     
+    async def transcribe_many(
+        self,
+        items: List[Dict],
+        concurrency: Optional[int] = None
+    ) -> List[List[Observation]]:
+        """
+        并发分析多个视频切片
+        
+        Args:
+            items: transcribe_video 的参数字典列表（video_path、duration，可选 prompt、window_records）
+            concurrency: 同时进行的请求数上限，默认 config.MAX_CONCURRENT_TRANSCRIBE
+            
+        Returns:
+            List[List[Observation]]: 与 items 一一对应的观察记录，失败的切片为空列表
+        """
+        semaphore = asyncio.Semaphore(concurrency or config.MAX_CONCURRENT_TRANSCRIBE)
+        
+        async def _one(item: Dict) -> List[Observation]:
+            async with semaphore:
+                return await self.transcribe_video(**item)
+        
+        results = await asyncio.gather(*[_one(item) for item in items], return_exceptions=True)
+        for item, result in zip(items, results):
+            if isinstance(result, BaseException):
+                logger.error(f"视频分析失败: {item.get('video_path')}: {result}")
+        return [[] if isinstance(r, BaseException) else r for r in results]
+    
     def _apply_window_records(
         self, 
         observations: List[Observation], 
@@ -636,9 +751,9 @@ class DayflowBackendProvider:
         
         try:
             # 尝试提取 JSON
-            json_match = re.search(r'\{[\s\S]*\}', text)
-            if json_match:
-                data = json.loads(json_match.group())
+            json_text = _find_json_object(text)
+            if json_text:
+                data = _json_loads(json_text)
                 items = data.get("observations", [])
                 
                 for item in items:
@@ -667,9 +782,9 @@ class DayflowBackendProvider:
         cards = []
         
         try:
-            json_match = re.search(r'\{[\s\S]*\}', text)
-            if json_match:
-                data = json.loads(json_match.group())
+            json_text = _find_json_object(text)
+            if json_text:
+                data = _json_loads(json_text)
                 items = data.get("cards", [])
                 
                 for item in items:
@@ -759,16 +874,82 @@ class DayflowBackendProvider:
             return False, f"错误: {str(e)}"
 
 
+# 同步便捷函数共用的事件循环（后台常驻线程）和 provider：
+# httpx.AsyncClient 的连接绑定在创建它的事件循环上，循环和客户端都复用才能保留 keep-alive 连接
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_providers: Dict[tuple, DayflowBackendProvider] = {}
+_sync_lock = threading.Lock()
+
+
+def _run_sync(coro):
+    """在常驻事件循环中运行协程并阻塞等待结果"""
+    global _sync_loop
+    with _sync_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="dayflow-llm-sync", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
+
+
+def _shared_provider(
+    api_base_url: Optional[str] = None,
+    api_key: Optional[str] = None,
+    model: Optional[str] = None,
+    timeout: float = 120.0
+) -> DayflowBackendProvider:
+    """
+    按实际生效的连接参数缓存 provider，同步调用之间复用其 HTTP 客户端
+    
+    未传入的参数取 config 当前值（设置页保存 API 配置后会修改 config），配置变化时创建新的 provider，
+    旧的 provider 在常驻事件循环中关闭
+    """
+    key = (
+        (api_base_url or config.API_BASE_URL).rstrip("/"),
+        api_key or config.API_KEY,
+        model or config.API_MODEL,
+        timeout
+    )
+    with _sync_lock:
+        provider = _sync_providers.get(key)
+        if provider is None:
+            stale = list(_sync_providers.values())
+            _sync_providers.clear()
+            provider = _sync_providers[key] = DayflowBackendProvider(*key)
+            if _sync_loop is not None:
+                for old in stale:
+                    asyncio.run_coroutine_threadsafe(old.close(), _sync_loop)
+    return provider
+
+
+@atexit.register
+def _close_sync_providers() -> None:
+    """退出时关闭共享 provider 的 HTTP 客户端并停止事件循环"""
+    with _sync_lock:
+        loop, providers = _sync_loop, list(_sync_providers.values())
+        _sync_providers.clear()
+    if loop is None or not loop.is_running():
+        return
+    for provider in providers:
+        try:
+            asyncio.run_coroutine_threadsafe(provider.close(), loop).result(timeout=5)
+        except Exception as e:
+            logger.debug(f"关闭 HTTP 客户端失败: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+
+
 # 便捷函数：同步调用
 def transcribe_video_sync(video_path: str, duration: float, **kwargs) -> List[Observation]:
     """同步版本的视频分析"""
-    loop = asyncio.new_event_loop()
-    provider = DayflowBackendProvider(**kwargs)
-    try:
-        return loop.run_until_complete(provider.transcribe_video(video_path, duration))
-    finally:
-        loop.run_until_complete(provider.close())
-        loop.close()
+    return _run_sync(_shared_provider(**kwargs).transcribe_video(video_path, duration))
+
+
+def transcribe_videos_sync(
+    items: List[Dict],
+    concurrency: Optional[int] = None,
+    **kwargs
+) -> List[List[Observation]]:
+    """同步版本的批量视频分析（切片并发请求，共用同一个 HTTP 客户端）"""
+    return _run_sync(_shared_provider(**kwargs).transcribe_many(items, concurrency))
 
 
 def generate_cards_sync(
@@ -777,13 +958,7 @@ def generate_cards_sync(
     **kwargs
 ) -> List[ActivityCard]:
     """同步版本的卡片生成"""
-    loop = asyncio.new_event_loop()
-    provider = DayflowBackendProvider(**kwargs)
-    try:
-        return loop.run_until_complete(provider.generate_activity_cards(observations, context_cards))
-    finally:
-        loop.run_until_complete(provider.close())
-        loop.close()
+    return _run_sync(_shared_provider(**kwargs).generate_activity_cards(observations, context_cards))
 
 
 def generate_daily_report_sync(
@@ -792,10 +967,4 @@ def generate_daily_report_sync(
     **kwargs
 ) -> str:
     """同步版本的日报生成"""
-    loop = asyncio.new_event_loop()
-    provider = DayflowBackendProvider(**kwargs)
-    try:
-        return loop.run_until_complete(provider.generate_daily_report(cards, date_str))
-    finally:
-        loop.run_until_complete(provider.close())
-        loop.close()
+    return _run_sync(_shared_provider(**kwargs).generate_daily_report(cards, date_str))
@@ -6,6 +6,8 @@ import time
 import logging
 import threading
 import json
+import shutil
+import subprocess
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, Callable, List, Dict
@@ -15,18 +17,123 @@ import dxcam
 import cv2
 
 import config
+from core.keyframes import encode_keyframe, sample_indices, save_keyframes
 from core.types import VideoChunk, ChunkStatus
 from core.window_tracker import get_tracker, WindowInfo
 
 logger = logging.getLogger(__name__)
 
+# 硬件编码器的低延迟/高速预设
+_HW_ENCODER_ARGS = {
+    "h264_nvenc": ["-preset", "p1"],
+    "h264_qsv": ["-preset", "veryfast"],
+    "h264_amf": ["-quality", "speed"],
+}
+
+# Windows 下启动 ffmpeg 时不弹出控制台窗口
+_NO_WINDOW = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+
+# 硬件编码器探测结果：探测在后台线程中进行，完成前（以及探测不到时）为 None，切片使用 mp4v
+_hw_encoder: Optional[str] = None
+_hw_probe_started = False
+_hw_probe_lock = threading.Lock()
+
+
+def _start_hw_encoder_probe() -> None:
+    """在后台线程中探测硬件编码器（每个进程只探测一次，避免阻塞录制线程）"""
+    global _hw_probe_started
+    with _hw_probe_lock:
+        if _hw_probe_started:
+            return
+        _hw_probe_started = True
+    threading.Thread(target=_probe_hw_encoder, name="dayflow-encoder-probe", daemon=True).start()
+
+
+def _probe_hw_encoder() -> None:
+    """后台探测线程入口"""
+    global _hw_encoder
+    _hw_encoder = _detect_hw_encoder()
+
+
+def _detect_hw_encoder() -> Optional[str]:
+    """探测可用的硬件 H.264 编码器，不可用时返回 None（每次最多运行若干个 ffmpeg 进程，耗时可达数秒）"""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return None
+    
+    for encoder in config.VIDEO_HW_ENCODERS:
+        # 编码器编译进 ffmpeg 不代表显卡/驱动支持，实际编码一帧验证
+        try:
+            result = subprocess.run(
+                [ffmpeg, "-hide_banner", "-loglevel", "error",
+                 "-f", "lavfi", "-i", "color=size=256x256:rate=1",
+                 "-frames:v", "1", "-c:v", encoder, "-f", "null", "-"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                timeout=10, creationflags=_NO_WINDOW
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.debug(f"探测编码器 {encoder} 失败: {e}")
+            continue
+        if result.returncode == 0:
+            logger.info(f"使用硬件编码器: {encoder}")
+            return encoder
+    
+    logger.info("未找到可用的硬件编码器，使用 mp4v 软件编码")
+    return None
+
+
+class _FFmpegWriter:
+    """
+    通过 ffmpeg 管道写入视频（硬件 H.264 编码）
+    
+    接口与 cv2.VideoWriter 的 write/release 一致
+    """
+    
+    def __init__(self, path: Path, encoder: str, fps: int, size: tuple):
+        width, height = size
+        self._proc = subprocess.Popen(
+            [shutil.which("ffmpeg"), "-hide_banner", "-loglevel", "error", "-y",
+             "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps),
+             "-i", "-",
+             "-c:v", encoder, *_HW_ENCODER_ARGS.get(encoder, []),
+             "-b:v", config.VIDEO_BITRATE, "-pix_fmt", "yuv420p",
+             str(path)],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            creationflags=_NO_WINDOW
+        )
+        self._broken = False
+    
+    def write(self, frame: np.ndarray) -> None:
+        if self._broken:
+            return
+        try:
+            self._proc.stdin.write(memoryview(np.ascontiguousarray(frame)))
+        except (BrokenPipeError, OSError) as e:
+            # ffmpeg 意外退出，本切片余下的帧丢弃
+            self._broken = True
+            logger.error(f"写入 ffmpeg 失败: {e}")
+    
+    def release(self) -> None:
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            returncode = self._proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            returncode = self._proc.wait()
+        if returncode != 0:
+            logger.warning(f"ffmpeg 编码退出码: {returncode}")
+
 
 class ScreenRecorder:
     """
     屏幕录制器
     - 1 FPS 低功耗录制
     - 每 60 秒自动切片
-    - H.264 编码，低码率
+    - 有硬件编码器时使用 H.264（ffmpeg），否则使用 mp4v 软件编码
     """
     
     def __init__(
@@ -59,11 +166,15 @@ class ScreenRecorder:
         self._canvas_offset_y: int = 0
         
         # 当前切片信息
-        self._current_writer: Optional[cv2.VideoWriter] = None
+        self._current_writer = None  # cv2.VideoWriter 或 _FFmpegWriter
         self._current_chunk_path: Optional[Path] = None
         self._current_chunk_start: Optional[datetime] = None
         self._frame_count = 0
         
+        # 关键帧在线采样：按切片的预期帧数均匀采样，边录边编码，分析时无需再解码视频
+        self._keyframe_indices = sample_indices(self.chunk_duration * self.fps)
+        self._keyframes: List[np.ndarray] = []
+        
         # 窗口追踪
         self._window_tracker = get_tracker()
         self._current_window_records: List[Dict] = []  # 当前切片的窗口记录
@@ -85,6 +196,9 @@ class ScreenRecorder:
             logger.warning("录制已在进行中")
             return
 
+        config.ensure_dirs()
+        _start_hw_encoder_probe()
+
         if self._all_screens:
             logger.info("开始屏幕录制... (全部屏幕模式)")
             self._create_all_cameras()
@@ -274,21 +388,19 @@ class ScreenRecorder:
     def _recording_loop(self):
         """录制主循环"""
         frame_interval = 1.0 / self.fps
-        last_frame_time = 0
+        next_frame_time = time.monotonic()  # 下一帧的绝对时间点（单调时钟，不受系统时间调整影响）
         last_window_info = None  # 缓存上次窗口信息
         
         while not self._stop_event.is_set():
-            current_time = time.time()
-            
-            # 控制帧率 - 使用精确等待而非轮询
-            time_to_wait = frame_interval - (current_time - last_frame_time)
-            if time_to_wait > 0:
-                self._stop_event.wait(min(time_to_wait, 0.5))  # 最多等待0.5秒，确保能响应停止信号
-                continue
+            # 控制帧率 - 一次等到下一帧的时间点；stop() 设置事件后立即返回
+            time_to_wait = next_frame_time - time.monotonic()
+            if time_to_wait > 0 and self._stop_event.wait(time_to_wait):
+                break
             
-            # 暂停检查
+            # 暂停检查（恢复后立即抓帧）
             if self._paused:
                 self._stop_event.wait(0.5)
+                next_frame_time = time.monotonic()
                 continue
             
             try:
@@ -298,7 +410,8 @@ class ScreenRecorder:
                 else:
                     frame = self._camera.grab()
                 if frame is None:
-                    time.sleep(0.1)
+                    # 屏幕无变化或抓帧失败，稍后重试
+                    next_frame_time = time.monotonic() + 0.1
                     continue
                 
                 # 先采集窗口信息（在帧捕获时立即采集，确保时间对齐）
@@ -333,13 +446,17 @@ class ScreenRecorder:
                 # 写入帧
                 if self._current_writer:
                     self._current_writer.write(frame)
+                    count = self._keyframe_indices.get(self._frame_count)
+                    if count:
+                        self._keyframes.extend([encode_keyframe(frame)] * count)
                     self._frame_count += 1
                 
-                last_frame_time = current_time
+                # 按固定节拍推进；落后超过一帧（系统繁忙或睡眠唤醒）时不补帧，从当前时间重新对齐
+                next_frame_time = max(next_frame_time + frame_interval, time.monotonic())
                 
             except Exception as e:
                 logger.error(f"录制帧错误: {e}")
-                time.sleep(1)
+                next_frame_time = time.monotonic() + 1
     
     def _should_create_new_chunk(self) -> bool:
         """检查是否需要创建新切片"""
@@ -356,10 +473,20 @@ class ScreenRecorder:
         self._current_chunk_path = self.output_dir / filename
         self._current_chunk_start = timestamp
         self._frame_count = 0
+        self._keyframes = []
         self._current_window_records = []  # 重置窗口记录
         
-        # 创建 VideoWriter
+        # 创建 VideoWriter（硬件编码器探测完成前使用 mp4v；yuv420p 要求宽高为偶数，否则只能用软件编码）
         height, width = frame_shape[:2]
+        encoder = _hw_encoder
+        if encoder and width % 2 == 0 and height % 2 == 0:
+            try:
+                self._current_writer = _FFmpegWriter(self._current_chunk_path, encoder, self.fps, (width, height))
+                logger.debug(f"创建新切片: {filename} ({encoder})")
+                return
+            except OSError as e:
+                logger.warning(f"启动 ffmpeg 失败，改用软件编码: {e}")
+        
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         
         self._current_writer = cv2.VideoWriter(
@@ -394,6 +521,10 @@ class ScreenRecorder:
                     logger.warning(f"保存窗口记录失败: {e}")
                     window_records_path = None
             
+            # 保存关键帧（切片提前结束或丢帧导致采样不全时不保存，分析时回退到解码视频）
+            if len(self._keyframes) == config.TRANSCRIBE_MAX_FRAMES:
+                save_keyframes(str(self._current_chunk_path), self._keyframes)
+            
             # 创建切片对象
             chunk = VideoChunk(
                 file_path=str(self._current_chunk_path),
@@ -417,6 +548,7 @@ class ScreenRecorder:
         self._current_chunk_path = None
         self._current_chunk_start = None
         self._frame_count = 0
+        self._keyframes = []
         self._current_window_records = []
 
 
@@ -7,6 +7,12 @@ from typing import List, Optional
 from enum import Enum
 import json
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 
 class ChunkStatus(Enum):
     """视频切片状态"""
@@ -24,7 +30,7 @@ class BatchStatus(Enum):
     FAILED = "failed"
 
 
-@dataclass
+@dataclass(slots=True)
 class Observation:
     """
     观察记录 - 对应视频转录结果
@@ -58,7 +64,14 @@ class Observation:
         )
 
 
-@dataclass
+def observations_to_json(observations: List[Observation]) -> str:
+    """序列化观察记录列表为 JSON 字符串（orjson 可用时优先使用）"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps([o.to_dict() for o in observations]).decode("utf-8")
+    return json.dumps([o.to_dict() for o in observations])
+
+
+@dataclass(slots=True)
 class AppSite:
     """应用/网站信息"""
     name: str
@@ -81,7 +94,7 @@ class AppSite:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class Distraction:
     """分心记录"""
     description: str
@@ -104,7 +117,7 @@ class Distraction:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class ActivityCard:
     """
     时间轴活动卡片 - 展示在时间轴上的主要元素
@@ -158,7 +171,7 @@ class ActivityCard:
         return 0
 
 
-@dataclass
+@dataclass(slots=True)
 class VideoChunk:
     """视频切片"""
     id: Optional[int] = None
@@ -183,7 +196,7 @@ class VideoChunk:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class AnalysisBatch:
     """分析批次"""
     id: Optional[int] = None
@@ -137,6 +137,7 @@ class ConnectionPool:
         # 使用 WAL 模式
         conn.execute("PRAGMA journal_mode=WAL")
         conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("PRAGMA cache_size=-20000")  # 约 20MB 页缓存
         return conn
     
     def acquire(self) -> sqlite3.Connection:
@@ -73,7 +73,10 @@ CREATE TABLE IF NOT EXISTS email_send_log (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE INDEX IF NOT EXISTS idx_email_send_log_period ON email_send_log(period);
+-- 调度器每分钟按 (period, success) 取最新一条，复合索引让查询直接走索引、无需排序
+-- （已覆盖原 period 单列索引，旧库中的单列索引一并删除）
+DROP INDEX IF EXISTS idx_email_send_log_period;
+CREATE INDEX IF NOT EXISTS idx_email_send_log_period_success_time ON email_send_log(period, success, send_time DESC);
 CREATE INDEX IF NOT EXISTS idx_email_send_log_time ON email_send_log(send_time);
 
 -- 日报缓存表
@@ -20,6 +20,27 @@ from database.connection_pool import ConnectionPool, PoolExhaustedError
 
 logger = logging.getLogger(__name__)
 
+# 热路径 SQL 使用固定的字符串常量，确保命中 sqlite3 连接内的语句缓存
+_INSERT_CARD_SQL = """
+    INSERT INTO timeline_cards 
+    (batch_id, category, title, summary, start_time, end_time, 
+     app_sites_json, distractions_json, productivity_score)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+_UPDATE_CHUNK_STATUS_SQL = "UPDATE chunks SET status = ? WHERE id = ?"
+_UPDATE_CHUNK_STATUS_BATCH_SQL = "UPDATE chunks SET status = ?, batch_id = ? WHERE id = ?"
+_UPDATE_BATCH_COMPLETED_SQL = """
+    UPDATE analysis_batches 
+    SET status = ?, observations_json = ?, completed_at = CURRENT_TIMESTAMP 
+    WHERE id = ?
+"""
+_UPDATE_BATCH_FAILED_SQL = """
+    UPDATE analysis_batches 
+    SET status = ?, error_message = ?, completed_at = CURRENT_TIMESTAMP 
+    WHERE id = ?
+"""
+_UPDATE_BATCH_STATUS_SQL = "UPDATE analysis_batches SET status = ? WHERE id = ?"
+
 
 class StorageManager:
     """SQLite 数据库管理器 - 使用连接池"""
@@ -32,6 +53,8 @@ class StorageManager:
             db_path: 数据库文件路径
             use_pool: 是否使用连接池（默认 True）
         """
+        if db_path is None:
+            config.ensure_dirs()
         self.db_path = db_path or config.DATABASE_PATH
         self._use_pool = use_pool
         self._pool: Optional[ConnectionPool] = None
@@ -84,6 +107,7 @@ class StorageManager:
             # 使用 WAL 模式，但确保数据立即写入
             self._local.conn.execute("PRAGMA journal_mode=WAL")
             self._local.conn.execute("PRAGMA synchronous=FULL")  # 改为 FULL 确保数据写入
+            self._local.conn.execute("PRAGMA cache_size=-20000")  # 约 20MB 页缓存
         return self._local.conn
     
     @contextmanager
@@ -164,15 +188,32 @@ class StorageManager:
         with self._get_connection() as conn:
             if batch_id is not None:
                 conn.execute(
-                    "UPDATE chunks SET status = ?, batch_id = ? WHERE id = ?",
+                    _UPDATE_CHUNK_STATUS_BATCH_SQL,
                     (status.value, batch_id, chunk_id)
                 )
             else:
                 conn.execute(
-                    "UPDATE chunks SET status = ? WHERE id = ?",
+                    _UPDATE_CHUNK_STATUS_SQL,
                     (status.value, chunk_id)
                 )
     
+    def update_chunk_statuses_bulk(self, chunk_ids: List[int], status: ChunkStatus,
+                                   batch_id: Optional[int] = None):
+        """批量更新切片状态（单个事务）"""
+        if not chunk_ids:
+            return
+        with self._get_connection() as conn:
+            if batch_id is not None:
+                conn.executemany(
+                    _UPDATE_CHUNK_STATUS_BATCH_SQL,
+                    [(status.value, batch_id, chunk_id) for chunk_id in chunk_ids]
+                )
+            else:
+                conn.executemany(
+                    _UPDATE_CHUNK_STATUS_SQL,
+                    [(status.value, chunk_id) for chunk_id in chunk_ids]
+                )
+    
     def _row_to_chunk(self, row: sqlite3.Row) -> VideoChunk:
         """将数据库行转换为 VideoChunk 对象"""
         # 安全获取 window_records_path（兼容旧数据库）
@@ -220,25 +261,17 @@ class StorageManager:
         with self._get_connection() as conn:
             if status == BatchStatus.COMPLETED:
                 conn.execute(
-                    """
-                    UPDATE analysis_batches 
-                    SET status = ?, observations_json = ?, completed_at = CURRENT_TIMESTAMP 
-                    WHERE id = ?
-                    """,
+                    _UPDATE_BATCH_COMPLETED_SQL,
                     (status.value, observations_json or "[]", batch_id)
                 )
             elif status == BatchStatus.FAILED:
                 conn.execute(
-                    """
-                    UPDATE analysis_batches 
-                    SET status = ?, error_message = ?, completed_at = CURRENT_TIMESTAMP 
-                    WHERE id = ?
-                    """,
+                    _UPDATE_BATCH_FAILED_SQL,
                     (status.value, error_message, batch_id)
                 )
             else:
                 conn.execute(
-                    "UPDATE analysis_batches SET status = ? WHERE id = ?",
+                    _UPDATE_BATCH_STATUS_SQL,
                     (status.value, batch_id)
                 )
     
@@ -269,12 +302,7 @@ class StorageManager:
         """保存时间轴卡片"""
         with self._get_connection() as conn:
             cursor = conn.execute(
-                """
-                INSERT INTO timeline_cards 
-                (batch_id, category, title, summary, start_time, end_time, 
-                 app_sites_json, distractions_json, productivity_score)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
+                _INSERT_CARD_SQL,
                 (
                     batch_id,
                     card.category,
@@ -289,6 +317,29 @@ class StorageManager:
             )
             return cursor.lastrowid
     
+    def save_cards_bulk(self, cards: List[ActivityCard], batch_id: Optional[int] = None):
+        """批量保存时间轴卡片（单个事务）"""
+        if not cards:
+            return
+        with self._get_connection() as conn:
+            conn.executemany(
+                _INSERT_CARD_SQL,
+                [
+                    (
+                        batch_id,
+                        card.category,
+                        card.title,
+                        card.summary,
+                        card.start_time.isoformat() if card.start_time else None,
+                        card.end_time.isoformat() if card.end_time else None,
+                        json.dumps([a.to_dict() for a in card.app_sites]),
+                        json.dumps([d.to_dict() for d in card.distractions]),
+                        card.productivity_score
+                    )
+                    for card in cards
+                ]
+            )
+    
     def get_cards_for_date(self, date: datetime) -> List[ActivityCard]:
         """获取指定日期的时间轴卡片"""
         start = date.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -305,6 +356,22 @@ class StorageManager:
             )
             return [self._row_to_card(row) for row in cursor.fetchall()]
     
+    def get_cards_for_date_range(self, start_date: datetime, end_date: datetime) -> List[ActivityCard]:
+        """获取日期范围内（含首尾两天）的时间轴卡片"""
+        start = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+        
+        with self._get_connection() as conn:
+            cursor = conn.execute(
+                """
+                SELECT * FROM timeline_cards 
+                WHERE start_time >= ? AND start_time <= ?
+                ORDER BY start_time ASC
+                """,
+                (start.isoformat(), end.isoformat())
+            )
+            return [self._row_to_card(row) for row in cursor.fetchall()]
+    
     def get_recent_cards(self, limit: int = 10) -> List[ActivityCard]:
         """获取最近的卡片（用作上下文）"""
         with self._get_connection() as conn:
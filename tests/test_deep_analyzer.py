@@ -0,0 +1,367 @@
+"""
+Property-Based Tests for DeepAnalyzer
+
+Feature: performance-improvements
+The NumPy-based DeepAnalyzer must produce exactly the same analysis as the
+original per-card loop implementation, kept below as ReferenceDeepAnalyzer.
+"""
+import random
+from datetime import datetime, timedelta
+
+from hypothesis import given, settings, strategies as st
+
+from core.email_service import DeepAnalyzer
+from core.types import ActivityCard
+
+
+class ReferenceDeepAnalyzer:
+    """Original loop-based DeepAnalyzer (before the NumPy rewrite), used as the baseline"""
+    
+    def __init__(self, cards: list):
+        self.cards = cards
+        self.sorted_cards = sorted(
+            [c for c in cards if c.start_time], 
+            key=lambda x: x.start_time
+        )
+        # 合并连续同类型记录为真正的工作段
+        self.merged_sessions = self._merge_consecutive_cards()
+    
+    def _merge_consecutive_cards(self) -> list:
+        """
+        将连续的同类型记录合并成真正的工作段
+        
+        例如：10个连续的"编程"卡片 → 1个10分钟的编程工作段
+        
+        注意：如果两张卡片之间的时间间隔超过 5 分钟，即使类别相同也视为不同工作段
+        """
+        if not self.sorted_cards:
+            return []
+        
+        # 时间间隔阈值（分钟）- 超过此值视为不同工作段
+        GAP_THRESHOLD_MINUTES = 5
+        
+        sessions = []
+        current_session = {
+            'category': self.sorted_cards[0].category,
+            'start_time': self.sorted_cards[0].start_time,
+            'end_time': self.sorted_cards[0].end_time,
+            'duration': self.sorted_cards[0].duration_minutes,
+            'scores': [self.sorted_cards[0].productivity_score] if self.sorted_cards[0].productivity_score > 0 else []
+        }
+        
+        for card in self.sorted_cards[1:]:
+            # 计算与上一张卡片的时间间隔
+            time_gap = 0
+            if current_session['end_time'] and card.start_time:
+                time_gap = (card.start_time - current_session['end_time']).total_seconds() / 60
+            
+            # 如果类别相同且时间间隔在阈值内，合并到当前工作段
+            if card.category == current_session['category'] and time_gap <= GAP_THRESHOLD_MINUTES:
+                current_session['duration'] += card.duration_minutes
+                current_session['end_time'] = card.end_time
+                if card.productivity_score > 0:
+                    current_session['scores'].append(card.productivity_score)
+            else:
+                # 类别不同或时间间隔过大，保存当前工作段，开始新的
+                current_session['avg_score'] = int(sum(current_session['scores']) / len(current_session['scores'])) if current_session['scores'] else 0
+                sessions.append(current_session)
+                current_session = {
+                    'category': card.category,
+                    'start_time': card.start_time,
+                    'end_time': card.end_time,
+                    'duration': card.duration_minutes,
+                    'scores': [card.productivity_score] if card.productivity_score > 0 else []
+                }
+        
+        # 保存最后一个工作段
+        current_session['avg_score'] = int(sum(current_session['scores']) / len(current_session['scores'])) if current_session['scores'] else 0
+        sessions.append(current_session)
+        
+        return sessions
+    
+    def analyze(self) -> dict:
+        """执行完整的深度分析，返回结构化数据"""
+        return {
+            'focus': self._analyze_focus(),
+            'rhythm': self._analyze_rhythm(),
+            'switching': self._analyze_switching(),
+            'categories': self._analyze_categories(),
+            'timeline': self._analyze_timeline(),
+            'day_type': self._classify_day_type(),
+            'raw_record_count': len(self.cards)  # 原始记录数（分钟数）
+        }
+    
+    def _analyze_focus(self) -> dict:
+        """专注力分析 - 基于合并后的真实工作段"""
+        if not self.merged_sessions:
+            return {'has_data': False}
+        
+        durations = [s['duration'] for s in self.merged_sessions if s['duration'] > 0]
+        if not durations:
+            return {'has_data': False}
+        
+        # 时长分布统计（基于真实工作段）
+        fragments = [d for d in durations if d < 15]  # <15分钟
+        short = [d for d in durations if 15 <= d < 30]  # 15-30分钟
+        medium = [d for d in durations if 30 <= d < 60]  # 30-60分钟
+        deep = [d for d in durations if d >= 60]  # >60分钟（深度工作）
+        
+        # 找最长的那次
+        max_duration = max(durations)
+        max_session = None
+        for s in self.merged_sessions:
+            if s['duration'] == max_duration:
+                max_session = {
+                    'category': s['category'],
+                    'duration': int(max_duration),
+                    'time': s['start_time'].strftime('%H:%M') if s['start_time'] else ''
+                }
+                break
+        
+        return {
+            'has_data': True,
+            'total_sessions': len(self.merged_sessions),  # 真实工作段数量
+            'fragment_count': len(fragments),  # 碎片数量
+            'fragment_percent': int(len(fragments) / len(durations) * 100) if durations else 0,
+            'short_count': len(short),
+            'medium_count': len(medium),
+            'deep_count': len(deep),  # 深度工作次数
+            'deep_total_mins': int(sum(deep)),  # 深度工作总时长
+            'max_session': max_session,
+            'avg_duration': int(sum(durations) / len(durations))
+        }
+    
+    def _analyze_rhythm(self) -> dict:
+        """工作节奏分析 - 按时段统计"""
+        # 按小时统计
+        hourly_data = {}
+        for card in self.sorted_cards:
+            if card.start_time and card.productivity_score > 0:
+                hour = card.start_time.hour
+                if hour not in hourly_data:
+                    hourly_data[hour] = {'scores': [], 'minutes': 0}
+                hourly_data[hour]['scores'].append(card.productivity_score)
+                hourly_data[hour]['minutes'] += card.duration_minutes
+        
+        if not hourly_data:
+            return {'has_data': False}
+        
+        # 计算每小时平均分
+        hourly_avg = {h: int(sum(d['scores'])/len(d['scores'])) 
+                      for h, d in hourly_data.items()}
+        
+        # 找峰值和谷值
+        peak_hour = max(hourly_avg, key=hourly_avg.get)
+        low_hour = min(hourly_avg, key=hourly_avg.get)
+        
+        # 按时段汇总
+        periods = {
+            '上午(6-12)': {'scores': [], 'minutes': 0},
+            '下午(12-18)': {'scores': [], 'minutes': 0},
+            '晚上(18-24)': {'scores': [], 'minutes': 0}
+        }
+        for hour, data in hourly_data.items():
+            if 6 <= hour < 12:
+                periods['上午(6-12)']['scores'].extend(data['scores'])
+                periods['上午(6-12)']['minutes'] += data['minutes']
+            elif 12 <= hour < 18:
+                periods['下午(12-18)']['scores'].extend(data['scores'])
+                periods['下午(12-18)']['minutes'] += data['minutes']
+            else:
+                periods['晚上(18-24)']['scores'].extend(data['scores'])
+                periods['晚上(18-24)']['minutes'] += data['minutes']
+        
+        period_stats = {}
+        for name, data in periods.items():
+            if data['scores']:
+                period_stats[name] = {
+                    'avg_score': int(sum(data['scores'])/len(data['scores'])),
+                    'total_mins': int(data['minutes']),
+                    'session_count': len(data['scores'])
+                }
+        
+        return {
+            'has_data': True,
+            'hourly_avg': hourly_avg,
+            'peak_hour': peak_hour,
+            'peak_score': hourly_avg[peak_hour],
+            'low_hour': low_hour,
+            'low_score': hourly_avg[low_hour],
+            'periods': period_stats
+        }
+    
+    def _analyze_switching(self) -> dict:
+        """任务切换分析 - 基于合并后的真实工作段"""
+        if len(self.merged_sessions) < 2:
+            return {'has_data': False, 'total_switches': 0}
+        
+        # 切换次数 = 工作段数量 - 1
+        switches = []
+        for i in range(1, len(self.merged_sessions)):
+            prev = self.merged_sessions[i-1]
+            curr = self.merged_sessions[i]
+            switches.append({
+                'time': curr['start_time'].strftime('%H:%M') if curr['start_time'] else '',
+                'from': prev['category'],
+                'to': curr['category']
+            })
+        
+        # 统计切换频率
+        from collections import Counter
+        switch_pairs = Counter(f"{s['from']}→{s['to']}" for s in switches)
+        most_common = switch_pairs.most_common(3)
+        
+        return {
+            'has_data': True,
+            'total_switches': len(switches),
+            'switch_list': switches[:10],
+            'common_patterns': most_common
+        }
+    
+    def _analyze_categories(self) -> dict:
+        """类别效率分析 - 基于合并后的真实工作段"""
+        from collections import defaultdict
+        
+        cat_data = defaultdict(lambda: {'scores': [], 'minutes': 0, 'sessions': 0})
+        
+        for session in self.merged_sessions:
+            cat = session['category'] or '其他'
+            if session['avg_score'] > 0:
+                cat_data[cat]['scores'].append(session['avg_score'])
+            cat_data[cat]['minutes'] += session['duration']
+            cat_data[cat]['sessions'] += 1
+        
+        if not cat_data:
+            return {'has_data': False}
+        
+        # 计算每个类别的统计
+        cat_stats = {}
+        for cat, data in cat_data.items():
+            avg_score = int(sum(data['scores'])/len(data['scores'])) if data['scores'] else 0
+            cat_stats[cat] = {
+                'avg_score': avg_score,
+                'total_mins': int(data['minutes']),
+                'session_count': data['sessions'],  # 真实工作段数量
+                'score_variance': self._calc_variance(data['scores']) if len(data['scores']) > 1 else 0
+            }
+        
+        # 找最高效和最低效
+        scored_cats = {k: v for k, v in cat_stats.items() if v['avg_score'] > 0}
+        best_cat = max(scored_cats, key=lambda x: scored_cats[x]['avg_score']) if scored_cats else None
+        worst_cat = min(scored_cats, key=lambda x: scored_cats[x]['avg_score']) if scored_cats else None
+        
+        return {
+            'has_data': True,
+            'stats': cat_stats,
+            'best': best_cat,
+            'worst': worst_cat
+        }
+    
+    def _calc_variance(self, scores: list) -> int:
+        """计算分数波动（标准差）"""
+        if len(scores) < 2:
+            return 0
+        avg = sum(scores) / len(scores)
+        variance = sum((s - avg) ** 2 for s in scores) / len(scores)
+        return int(variance ** 0.5)
+    
+    def _analyze_timeline(self) -> list:
+        """生成时间线摘要 - 基于合并后的真实工作段"""
+        timeline = []
+        for session in self.merged_sessions[:15]:  # 最多15个工作段
+            if session['start_time']:
+                timeline.append({
+                    'time': session['start_time'].strftime('%H:%M'),
+                    'category': session['category'],
+                    'duration': int(session['duration']),
+                    'score': session.get('avg_score', 0)
+                })
+        return timeline
+    
+    def _classify_day_type(self) -> dict:
+        """基于数据判断今日类型"""
+        focus = self._analyze_focus()
+        switching = self._analyze_switching()
+        
+        if not focus.get('has_data'):
+            return {'type': '数据不足', 'description': '记录较少，无法分类'}
+        
+        deep_count = focus.get('deep_count', 0)
+        fragment_percent = focus.get('fragment_percent', 0)
+        switch_count = switching.get('total_switches', 0)
+        
+        # 基于数据的客观分类
+        if deep_count >= 2 and fragment_percent < 30:
+            return {'type': '深度工作日', 'indicators': f'{deep_count}次深度工作，碎片仅{fragment_percent}%'}
+        elif switch_count >= 8:
+            return {'type': '多任务切换日', 'indicators': f'切换{switch_count}次'}
+        elif fragment_percent > 60:
+            return {'type': '碎片化日', 'indicators': f'{fragment_percent}%为碎片时间'}
+        elif deep_count == 0 and focus.get('avg_duration', 0) < 20:
+            return {'type': '轻量日', 'indicators': f'平均每段{focus.get("avg_duration", 0)}分钟'}
+        else:
+            return {'type': '常规日', 'indicators': '节奏正常'}
+
+
+# ============================================================================
+# Property: Analysis Equivalence
+# *For any* list of activity cards (in any order, with gaps, overlaps and
+# missing end times), DeepAnalyzer.analyze() should return the same result as
+# the reference implementation.
+# ============================================================================
+
+DAY_START = datetime(2024, 1, 1, 5, 0)
+
+# Each card: (category, gap from the previous card in minutes, duration in minutes or None, score)
+# Gaps around the 5 minute merge threshold and negative gaps (overlaps) are the interesting cases;
+# durations and scores stay on exact binary fractions so float sums are order-independent.
+card_specs = st.lists(
+    st.tuples(
+        st.sampled_from(["工作", "学习", "娱乐", ""]),
+        st.sampled_from([0, 0, 0, 1, 4, 5, 6, 30, 240, -3]),
+        st.one_of(st.none(), st.integers(min_value=0, max_value=150)),
+        st.integers(min_value=0, max_value=200).map(lambda x: x / 2)
+    ),
+    max_size=80
+)
+
+
+def build_cards(specs, rnd: random.Random) -> list:
+    """Lay the cards out on a timeline (possibly past midnight) and shuffle them"""
+    cards = []
+    t = DAY_START
+    for category, gap, duration, score in specs:
+        t += timedelta(minutes=gap)
+        end = t + timedelta(minutes=duration) if duration is not None else None
+        cards.append(ActivityCard(category=category, start_time=t, end_time=end, productivity_score=score))
+        t = end or t + timedelta(minutes=1)
+    rnd.shuffle(cards)
+    return cards
+
+
+@settings(max_examples=300)
+@given(specs=card_specs, rnd=st.randoms(use_true_random=False))
+def test_property_analysis_matches_reference(specs, rnd):
+    """
+    Property: Analysis Equivalence
+    
+    For any set of cards, the vectorized analyzer matches the reference output.
+    """
+    cards = build_cards(specs, rnd)
+    
+    assert DeepAnalyzer(cards).analyze() == ReferenceDeepAnalyzer(cards).analyze()
+
+
+def test_cards_without_start_time_are_ignored():
+    """Cards missing a start time are skipped by both implementations but still counted as raw records"""
+    cards = [
+        ActivityCard(category="工作", start_time=DAY_START, end_time=DAY_START + timedelta(minutes=70),
+                     productivity_score=80),
+        ActivityCard(category="学习", productivity_score=60)
+    ]
+    
+    result = DeepAnalyzer(cards).analyze()
+    
+    assert result == ReferenceDeepAnalyzer(cards).analyze()
+    assert result['raw_record_count'] == 2
+    assert result['focus']['deep_count'] == 1
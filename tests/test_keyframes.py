@@ -0,0 +1,52 @@
+"""
+Tests for the keyframe sidecar (keyframes saved next to a video chunk at
+record time and loaded back at analysis time)
+"""
+import cv2
+import numpy as np
+
+from core.keyframes import (
+    KEYFRAME_SIZE, KEYFRAMES_SUFFIX, encode_keyframe, keyframes_path, load_keyframes, sample_indices,
+    save_keyframes
+)
+
+
+def make_frame(width: int, height: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+def test_save_and_load_keyframes_round_trip(tmp_path):
+    video_path = str(tmp_path / "chunk_20240101_090000.mp4")
+    buffers = [encode_keyframe(make_frame(1920, 1080, i)) for i in range(3)]
+    
+    path = save_keyframes(video_path, buffers)
+    
+    assert path == keyframes_path(video_path)
+    assert path.name == "chunk_20240101_090000" + KEYFRAMES_SUFFIX
+    loaded = load_keyframes(video_path)
+    assert len(loaded) == len(buffers)
+    for original, restored in zip(buffers, loaded):
+        np.testing.assert_array_equal(original, restored)
+        # Still a valid JPEG, downscaled to the keyframe size
+        frame = cv2.imdecode(restored, cv2.IMREAD_COLOR)
+        assert (frame.shape[1], frame.shape[0]) == KEYFRAME_SIZE
+
+
+def test_small_frames_are_not_upscaled():
+    frame = cv2.imdecode(encode_keyframe(make_frame(640, 360, 0)), cv2.IMREAD_COLOR)
+    
+    assert frame.shape[:2] == (360, 640)
+
+
+def test_load_keyframes_missing_or_corrupt(tmp_path):
+    video_path = str(tmp_path / "chunk.mp4")
+    assert load_keyframes(video_path) is None
+    
+    keyframes_path(video_path).write_bytes(b"not an npz file")
+    assert load_keyframes(video_path) is None
+
+
+def test_sample_indices_spreads_frames_evenly():
+    assert sample_indices(80, 8) == {i * 10: 1 for i in range(8)}
+    # Fewer frames than samples: frames are sampled more than once
+    assert sum(sample_indices(3, 8).values()) == 8
@@ -0,0 +1,146 @@
+"""
+Tests for the LLM provider
+
+Covers _find_json_object, which extracts the JSON object from a model reply
+that may be wrapped in a code fence or followed by extra text, and the
+provider shared by the sync helpers, and concurrent transcription of many
+chunks (with transcribe_video stubbed out).
+"""
+import asyncio
+import json
+
+import pytest
+
+import config
+from core import llm_provider
+from core.llm_provider import _find_json_object
+from core.types import Observation
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Nested objects: stop at the brace matching the first '{', not the last '}' in the reply
+    ('{"a": {"b": {"c": 1}}, "d": 2} 说明: {"x": 1}', '{"a": {"b": {"c": 1}}, "d": 2}'),
+    # Braces inside strings are not counted
+    ('{"text": "用 } 和 { 分隔", "n": 1} 以上', '{"text": "用 } 和 { 分隔", "n": 1}'),
+    # Escaped quotes do not end the string early
+    (r'{"text": "say \"}\" ok", "n": 2}', r'{"text": "say \"}\" ok", "n": 2}'),
+    # Fenced code block with trailing explanation
+    ('```json\n{"observations": [{"start_ts": 0, "end_ts": 10, "text": "写代码"}]}\n```\n完成',
+     '{"observations": [{"start_ts": 0, "end_ts": 10, "text": "写代码"}]}'),
+])
+def test_find_json_object_extracts_first_object(text: str, expected: str):
+    result = _find_json_object(text)
+    
+    assert result == expected
+    json.loads(result)
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "模型没有返回 JSON",
+    "only a closing brace }",
+])
+def test_find_json_object_without_json(text: str):
+    assert _find_json_object(text) is None
+
+
+def test_find_json_object_truncated_falls_back_to_last_brace():
+    """Unbalanced (truncated) output falls back to the last '}' and lets the JSON parser report the error"""
+    text = '{"cards": [{"title": "a"}, {"title": "b"'
+    
+    assert _find_json_object(text) == '{"cards": [{"title": "a"}'
+
+
+# ============================================================================
+# Shared provider of the sync helpers
+# ============================================================================
+
+def test_sync_helpers_follow_api_config_changes(monkeypatch):
+    """Saving new API settings at runtime must take effect on the next sync call"""
+    monkeypatch.setattr(llm_provider, "_sync_providers", {})
+    monkeypatch.setattr(config, "API_KEY", "old-key")
+    monkeypatch.setattr(config, "API_BASE_URL", "https://old.example.com/v1")
+    
+    async def fake_report(self, cards, date_str):
+        return f"{self.api_key}@{self.api_base_url}"
+    
+    monkeypatch.setattr(llm_provider.DayflowBackendProvider, "generate_daily_report", fake_report)
+    
+    first = llm_provider._shared_provider()
+    assert llm_provider.generate_daily_report_sync([], "2024-01-01") == "old-key@https://old.example.com/v1"
+    # Unchanged config reuses the provider (and its HTTP client)
+    assert llm_provider._shared_provider() is first
+    
+    monkeypatch.setattr(config, "API_KEY", "new-key")
+    monkeypatch.setattr(config, "API_BASE_URL", "https://new.example.com/v1/")
+    
+    assert llm_provider.generate_daily_report_sync([], "2024-01-01") == "new-key@https://new.example.com/v1"
+    second = llm_provider._shared_provider()
+    assert second is not first
+    assert second.headers["Authorization"] == "Bearer new-key"
+    # Only the provider for the current settings is kept
+    assert list(llm_provider._sync_providers.values()) == [second]
+
+
+# ============================================================================
+# transcribe_many / transcribe_videos_sync
+# ============================================================================
+
+class StubTranscriber(llm_provider.DayflowBackendProvider):
+    """transcribe_video replaced by a stub that records how many calls overlap"""
+    
+    def __init__(self, failures: dict = None):
+        super().__init__(api_base_url="https://stub.example.com/v1", api_key="stub", model="stub")
+        self.failures = failures or {}
+        self.active = 0
+        self.max_active = 0
+    
+    async def transcribe_video(self, video_path: str, duration: float, prompt=None, window_records=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            # Later items finish first, so results come back out of completion order
+            await asyncio.sleep(0.001 * (20 - int(video_path.split("_")[1])))
+            if video_path in self.failures:
+                raise self.failures[video_path]
+            return [Observation(start_ts=0, end_ts=duration, text=video_path)]
+        finally:
+            self.active -= 1
+
+
+def make_items(count: int) -> list:
+    return [{"video_path": f"chunk_{i}", "duration": 60.0 + i} for i in range(count)]
+
+
+@pytest.mark.parametrize("concurrency", [1, 3, 8])
+def test_transcribe_many_keeps_input_order_and_limits_concurrency(concurrency: int):
+    provider = StubTranscriber()
+    items = make_items(12)
+    
+    results = asyncio.run(provider.transcribe_many(items, concurrency))
+    
+    assert [r[0].text for r in results] == [item["video_path"] for item in items]
+    assert [r[0].end_ts for r in results] == [item["duration"] for item in items]
+    assert provider.max_active == concurrency
+    assert provider.active == 0
+
+
+def test_transcribe_many_maps_failed_and_cancelled_items_to_empty():
+    provider = StubTranscriber(failures={
+        "chunk_1": RuntimeError("API 请求失败"),
+        "chunk_3": asyncio.CancelledError(),
+    })
+    
+    results = asyncio.run(provider.transcribe_many(make_items(5), concurrency=2))
+    
+    assert [[o.text for o in r] for r in results] == [["chunk_0"], [], ["chunk_2"], [], ["chunk_4"]]
+
+
+def test_transcribe_videos_sync_uses_transcribe_many(monkeypatch):
+    provider = StubTranscriber()
+    monkeypatch.setattr(llm_provider, "_shared_provider", lambda **kwargs: provider)
+    
+    results = llm_provider.transcribe_videos_sync(make_items(6), concurrency=2)
+    
+    assert [r[0].text for r in results] == [f"chunk_{i}" for i in range(6)]
+    assert provider.max_active == 2
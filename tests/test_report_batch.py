@@ -0,0 +1,83 @@
+"""
+Tests for ReportGenerator.generate_reports_batch
+
+Several days are generated from one range query. The AI generator is stubbed
+out, and the cards live in a temporary SQLite database. The range query runs
+in a worker thread, where a per-thread in-memory connection would see an
+empty database.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from core.email_service import ReportGenerator
+from core.types import ActivityCard
+from database.storage import StorageManager
+
+
+class StubAIGenerator:
+    """Stands in for AICommentGenerator and records the stats of every request"""
+    
+    def __init__(self):
+        self.requests = []
+    
+    async def generate_combined_async(self, stats: dict, deep_analysis: dict, client=None):
+        self.requests.append(stats)
+        await asyncio.sleep(0)
+        return f"点评-{stats['date']}", f"分析-{stats['date']}"
+
+
+def make_card(start: datetime, minutes: int, category: str, score: float) -> ActivityCard:
+    return ActivityCard(category=category, title=category, start_time=start,
+                        end_time=start + timedelta(minutes=minutes), productivity_score=score)
+
+
+def test_generate_reports_batch(tmp_path):
+    storage = StorageManager(db_path=tmp_path / "dayflow.db", use_pool=False)
+    day1, day2, day3 = (datetime(2024, 5, d, 21, 0) for d in (1, 2, 3))
+    storage.save_cards_bulk([
+        make_card(day1.replace(hour=9), 90, "编程", 90),
+        make_card(day1.replace(hour=11), 30, "会议", 70),
+        # Just before midnight still belongs to day 1
+        make_card(day1.replace(hour=23, minute=50), 5, "编程", 80),
+        make_card(day3.replace(hour=0, minute=0), 45, "学习", 60),
+        # Outside the requested range
+        make_card(day3 + timedelta(days=1), 60, "娱乐", 20),
+    ])
+    generator = ReportGenerator(storage)
+    generator.ai_generator = StubAIGenerator()
+    empty_days = []
+    build_empty_html = generator._build_empty_html
+    
+    def spy_empty_html(date, generated_at=None):
+        html = build_empty_html(date, generated_at)
+        empty_days.append((date, html))
+        return html
+    
+    generator._build_empty_html = spy_empty_html
+    
+    # Dates out of order: results follow the input order
+    results = asyncio.run(generator.generate_reports_batch([day3, day1, day2], max_concurrency=2))
+    
+    assert [date for date, _ in results] == [day3, day1, day2]
+    html_by_day = dict(results)
+    
+    # Cards are grouped by the day they start on
+    requests = {stats['date']: stats for stats in generator.ai_generator.requests}
+    assert set(requests) == {"2024年05月01日", "2024年05月03日"}
+    assert requests["2024年05月01日"]['recorded_minutes'] == 125
+    assert requests["2024年05月01日"]['categories'] == [("编程", 95), ("会议", 30)]
+    assert requests["2024年05月03日"]['categories'] == [("学习", 45)]
+    assert "点评-2024年05月01日" in html_by_day[day1]
+    assert "点评-2024年05月03日" in html_by_day[day3]
+    
+    # A day without cards skips the AI and renders the empty report
+    assert [date for date, _ in empty_days] == [day2]
+    assert html_by_day[day2] == empty_days[0][1]
+    
+    storage.close()
+
+
+def test_generate_reports_batch_without_dates():
+    generator = ReportGenerator(storage=None)
+    
+    assert asyncio.run(generator.generate_reports_batch([])) == []
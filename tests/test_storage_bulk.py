@@ -0,0 +1,139 @@
+"""
+Property-Based Tests for StorageManager bulk operations
+
+Bulk writes (single transaction) must read back exactly like the per-row
+methods they replace. Each test uses a fresh in-memory SQLite database.
+"""
+import dataclasses
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from hypothesis import given, settings, strategies as st
+
+from core.types import ActivityCard, AnalysisBatch, AppSite, ChunkStatus, Distraction, VideoChunk
+from database.storage import StorageManager
+
+
+def make_storage() -> StorageManager:
+    """In-memory database (single cached connection, no pool)"""
+    return StorageManager(db_path=Path(":memory:"), use_pool=False)
+
+
+def chunk_rows(storage: StorageManager) -> dict:
+    """chunk id -> (status, batch_id)"""
+    with storage._get_connection() as conn:
+        rows = conn.execute("SELECT id, status, batch_id FROM chunks").fetchall()
+    return {row["id"]: (row["status"], row["batch_id"]) for row in rows}
+
+
+# ============================================================================
+# update_chunk_statuses_bulk
+# ============================================================================
+
+def test_update_chunk_statuses_bulk_round_trip():
+    storage = make_storage()
+    start = datetime(2024, 1, 1, 9, 0)
+    chunk_ids = [
+        storage.save_chunk(VideoChunk(file_path=f"chunk_{i}.mp4", start_time=start + timedelta(minutes=i),
+                                      end_time=start + timedelta(minutes=i + 1), duration_seconds=60))
+        for i in range(4)
+    ]
+    batch_id = storage.create_batch(AnalysisBatch(chunk_ids=chunk_ids[:3], start_time=start,
+                                                  end_time=start + timedelta(minutes=3)))
+    
+    # With batch id: status and batch are both updated
+    storage.update_chunk_statuses_bulk(chunk_ids[:3], ChunkStatus.PROCESSING, batch_id)
+    rows = chunk_rows(storage)
+    assert [rows[i] for i in chunk_ids[:3]] == [("processing", batch_id)] * 3
+    assert rows[chunk_ids[3]] == ("pending", None)
+    assert [c.id for c in storage.get_pending_chunks()] == [chunk_ids[3]]
+    
+    # Without batch id: only the status changes, the batch stays assigned
+    storage.update_chunk_statuses_bulk(chunk_ids[:2], ChunkStatus.COMPLETED)
+    rows = chunk_rows(storage)
+    assert [rows[i] for i in chunk_ids[:3]] == [
+        ("completed", batch_id), ("completed", batch_id), ("processing", batch_id)
+    ]
+    
+    # Empty list is a no-op
+    storage.update_chunk_statuses_bulk([], ChunkStatus.FAILED)
+    assert chunk_rows(storage) == rows
+    
+    storage.close()
+
+
+# ============================================================================
+# save_cards_bulk / get_cards_for_date_range
+# *For any* list of cards saved with save_cards_bulk, reading the covered
+# days back should return the same cards (ordered by start time, with ids).
+# ============================================================================
+
+DAY_START = datetime(2024, 3, 1)
+
+app_sites = st.lists(
+    st.builds(AppSite, name=st.text(min_size=1, max_size=10),
+              duration_seconds=st.integers(min_value=0, max_value=3600).map(float),
+              icon_url=st.none() | st.just("https://example.com/icon.png")),
+    max_size=3
+)
+distractions = st.lists(
+    st.builds(Distraction, description=st.text(max_size=10),
+              timestamp=st.integers(min_value=0, max_value=86400).map(float),
+              duration_seconds=st.integers(min_value=0, max_value=600).map(float)),
+    max_size=2
+)
+cards = st.lists(
+    st.builds(
+        ActivityCard,
+        category=st.sampled_from(["工作", "学习", "娱乐", "其他"]),
+        title=st.text(max_size=20),
+        summary=st.text(max_size=40),
+        app_sites=app_sites,
+        distractions=distractions,
+        productivity_score=st.integers(min_value=0, max_value=100).map(float)
+    ),
+    max_size=30
+)
+# Start times over three days at minute resolution, unique so the read order is deterministic
+start_minutes = st.lists(st.integers(min_value=0, max_value=3 * 24 * 60 - 1), unique=True, max_size=30)
+
+
+@settings(max_examples=50, deadline=None)
+@given(cards=cards, minutes=start_minutes)
+def test_property_save_cards_bulk_round_trip(cards, minutes):
+    cards = [
+        dataclasses.replace(card, start_time=DAY_START + timedelta(minutes=m),
+                            end_time=DAY_START + timedelta(minutes=m + 1))
+        for card, m in zip(cards, minutes)
+    ]
+    storage = make_storage()
+    
+    storage.save_cards_bulk(cards)
+    loaded = storage.get_cards_for_date_range(DAY_START, DAY_START + timedelta(days=2))
+    
+    expected = sorted(cards, key=lambda c: c.start_time)
+    assert len({c.id for c in loaded}) == len(loaded)
+    assert [dataclasses.replace(c, id=None) for c in loaded] == expected
+    
+    # The range query covers whole days and matches the per-day query
+    assert storage.get_cards_for_date_range(DAY_START + timedelta(days=1, hours=12),
+                                            DAY_START + timedelta(days=1)) == \
+        storage.get_cards_for_date(DAY_START + timedelta(days=1))
+    
+    storage.close()
+
+
+def test_save_cards_bulk_empty_and_batch_id():
+    storage = make_storage()
+    batch_id = storage.create_batch(AnalysisBatch(start_time=DAY_START, end_time=DAY_START + timedelta(minutes=15)))
+    card = ActivityCard(category="工作", title="写代码", start_time=DAY_START + timedelta(hours=9),
+                        end_time=DAY_START + timedelta(hours=9, minutes=1), productivity_score=80)
+    
+    storage.save_cards_bulk([])
+    storage.save_cards_bulk([card], batch_id=batch_id)
+    
+    with storage._get_connection() as conn:
+        rows = conn.execute("SELECT batch_id FROM timeline_cards").fetchall()
+    assert [row["batch_id"] for row in rows] == [batch_id]
+    
+    storage.close()
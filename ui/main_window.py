@@ -2968,6 +2968,10 @@ class MainWindow(QMainWindow):
         # 停止分析
         self._stop_analysis()
         
+        # 停止邮件发送线程，关闭数据库长连接和复用的 SMTP 连接
+        if getattr(self, 'email_scheduler', None):
+            self.email_scheduler.shutdown()
+        
         # 关闭数据库连接，确保数据写入
         if self.storage:
             self.storage.close()
@@ -3023,6 +3027,9 @@ class MainWindow(QMainWindow):
         # 重新加载配置（以防用户修改）
         enabled = self.storage.get_setting("email_enabled", "false") == "true"
         if not enabled:
+            # 定时器在后台到点发送，关闭推送时需同步到配置
+            if getattr(self, 'email_scheduler', None):
+                self.email_scheduler.email_service.config.enabled = False
             return
         
         # 更新配置
@@ -15,8 +15,10 @@ import logging
 from pathlib import Path
 from datetime import datetime
 
+import config
+
 # 配置日志
-log_dir = Path(os.getenv('LOCALAPPDATA', '')) / 'Dayflow' / 'logs'
+log_dir = config.APP_DATA_DIR / 'logs'
 log_dir.mkdir(parents=True, exist_ok=True)
 log_file = log_dir / f'updater_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'
 
@@ -31,17 +33,6 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def get_app_data_dir() -> Path:
-    """获取应用数据目录"""
-    local_app_data = os.getenv("LOCALAPPDATA")
-    if local_app_data:
-        return Path(local_app_data) / "Dayflow"
-    user_profile = os.getenv("USERPROFILE")
-    if user_profile:
-        return Path(user_profile) / "AppData" / "Local" / "Dayflow"
-    return Path.home() / "AppData" / "Local" / "Dayflow"
-
-
 def wait_for_process_exit(exe_path: Path, timeout: int = 30) -> bool:
     """
     等待指定进程退出
@@ -72,7 +63,7 @@ def wait_for_process_exit(exe_path: Path, timeout: int = 30) -> bool:
 
 def apply_update() -> bool:
     """执行更新"""
-    app_data_dir = get_app_data_dir()
+    app_data_dir = config.APP_DATA_DIR
     pending_dir = app_data_dir / "pending_update"
     info_path = pending_dir / "update_info.json"
     new_exe = pending_dir / "Dayflow_new.exe"
@@ -208,7 +199,7 @@ def main():
     time.sleep(1)
     
     # 读取更新信息获取原 EXE 路径
-    app_data_dir = get_app_data_dir()
+    app_data_dir = config.APP_DATA_DIR
     info_path = app_data_dir / "pending_update" / "update_info.json"
     
     current_exe_path = ""